@@ -0,0 +1,178 @@
+import numpy as np
+from analysis import run_lengths
+from emissions_calculator import DEFAULT_STATE, average_fuel_price, trip_fuel_prices
+from instrumentation import count, instrumented
+from time_utils import MISSING_TIME, local_days, to_datetime
+
+# Reducers over timeline chunks: update(chunk) for each, then result().
+
+@instrumented('aggregate')
+def aggregate(chunks, reducers):
+    for chunk in chunks:
+        count('chunks')
+        count('entries', len(chunk))
+        for reducer in reducers.values():
+            reducer.update(chunk)
+    return {name: reducer.result() for name, reducer in reducers.items()}
+
+class EventCount:
+    def __init__(self):
+        self.count = 0
+
+    def update(self, chunk):
+        self.count += len(chunk)
+
+    def result(self):
+        return self.count
+
+class PassengerDistance:
+    # Total distanceMeters over passenger-vehicle activities.
+    def __init__(self, activity_type='IN_PASSENGER_VEHICLE'):
+        self.activity_type = activity_type
+        self.meters = 0.0
+
+    def update(self, chunk):
+        self.meters += float(chunk.distance[chunk.where('top_candidate_type', self.activity_type)].sum())
+
+    def result(self):
+        return self.meters
+
+class FuelPrice:
+    # Distance-weighted price per gallon of passenger-vehicle trips.
+    def __init__(self, activity_type='IN_PASSENGER_VEHICLE', grade='Regular', dated=False):
+        self.activity_type = activity_type
+        self.grade = grade
+        self.dated = dated
+        self.meters = 0.0
+        self.cost_meters = 0.0
+
+    def update(self, chunk):
+        rows = chunk.where('top_candidate_type', self.activity_type)
+        meters = chunk.distance[rows]
+        times = (chunk.start_time[rows], chunk.start_offset[rows]) if self.dated else (None, None)
+        prices = trip_fuel_prices(chunk.start_lat[rows], chunk.start_lng[rows], self.grade, DEFAULT_STATE, *times)
+        self.meters += float(meters.sum())
+        self.cost_meters += float((meters * prices).sum())
+
+    def result(self):
+        return average_fuel_price(self.cost_meters, self.meters, self.grade)
+
+class DateSpan:
+    # Start of the first entry and end of the last, as find_min_max_dates.
+    def __init__(self):
+        self.first = None
+        self.last = None
+
+    def update(self, chunk):
+        if not len(chunk):
+            return
+        if self.first is None:
+            self.first = (chunk.start_time[0], chunk.start_offset[0])
+        self.last = (chunk.end_time[-1], chunk.end_offset[-1])
+
+    def result(self):
+        if self.first is None:
+            return None, None
+        return to_datetime(*self.first), to_datetime(*self.last)
+
+class DriveDays:
+    # Distinct local dates on which a passenger-vehicle activity started.
+    def __init__(self, activity_type='IN_PASSENGER_VEHICLE'):
+        self.activity_type = activity_type
+        self.days = set()
+
+    def update(self, chunk):
+        rows = chunk.where('top_candidate_type', self.activity_type) & (chunk.start_time != MISSING_TIME)
+        self.days.update(np.unique(local_days(chunk.start_time[rows], chunk.start_offset[rows])).tolist())
+
+    def result(self):
+        return len(self.days)
+
+class ActivitySequences:
+    # analyze_activity_sequences over chunks; a chunk's last run waits for the next.
+    def __init__(self):
+        self.started = False
+        self.pending = None  # (label, length) of the unfinished last run
+        self.total_visits = 0
+        self.total_activities = 0
+        self.grouped_activities = 0
+        self.activity_groups = 0
+        self.zero_run = 0
+        self.zero_gaps = 0
+        self.zero_gap_runs = 0
+
+    def update(self, chunk):
+        if not len(chunk):
+            return
+        codes = chunk.semantic_type
+        _, lengths, values = run_lengths(codes, codes < 0)
+        categories = chunk.categories['semantic_type']
+        labels = [categories[code] if code >= 0 else None for code in (values[0], values[-1])]
+        lengths = lengths.copy()
+
+        if not self.started:
+            # count_consecutive_groups starts every sequence with an empty group.
+            self.started = True
+            self._emit(np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64))
+        elif self.pending is not None:
+            label, length = self.pending
+            if label is not None and label == labels[0]:
+                lengths[0] += length
+            else:
+                self._emit_runs([label], np.array([length]))
+
+        self.pending = (labels[1], int(lengths[-1]))
+        if len(lengths) > 1:
+            values, lengths = values[:-1], lengths[:-1]
+            self._emit_codes(values, lengths, chunk.code('semantic_type', 'visit'),
+                             chunk.code('semantic_type', 'activity'))
+
+    def _emit_runs(self, labels, lengths):
+        repeats = lengths - 1
+        self._emit(np.where(np.array([label == 'visit' for label in labels]), repeats, 0),
+                   np.where(np.array([label == 'activity' for label in labels]), repeats, 0))
+
+    def _emit_codes(self, values, lengths, visit_code, activity_code):
+        repeats = lengths - 1
+        visits = repeats * (values == visit_code) if visit_code >= 0 else np.zeros_like(repeats)
+        activities = repeats * (values == activity_code) if activity_code >= 0 else np.zeros_like(repeats)
+        self._emit(visits, activities)
+
+    def _emit(self, visits, activities):
+        self.total_visits += int(visits.sum())
+        self.total_activities += int(activities.sum())
+        grouped = activities[activities > 0]
+        self.grouped_activities += int(grouped.sum())
+        self.activity_groups += len(grouped)
+
+        _, lengths, is_zero = run_lengths(activities == 0)
+        lengths = lengths.copy()
+        if is_zero[0]:
+            lengths[0] += self.zero_run
+        elif self.zero_run:
+            self.zero_gaps += self.zero_run
+            self.zero_gap_runs += 1
+        self.zero_run = int(lengths[-1]) if is_zero[-1] else 0
+        closed = lengths[:-1][is_zero[:-1]]
+        self.zero_gaps += int(closed.sum())
+        self.zero_gap_runs += len(closed)
+
+    def result(self):
+        # The pending run is emitted on a copy so result() leaves the state as is.
+        final = ActivitySequences()
+        final.__dict__.update(self.__dict__)
+        if not final.started:
+            final._emit(np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64))
+        elif final.pending is not None:
+            label, length = final.pending
+            final._emit_runs([label], np.array([length]))
+        zero_gaps, zero_gap_runs = final.zero_gaps, final.zero_gap_runs
+        if final.zero_run > 0:
+            zero_gaps += final.zero_run
+            zero_gap_runs += 1
+        return {
+            "total_consecutive_visits": final.total_visits,
+            "total_consecutive_activities": final.total_activities,
+            "average_activities_in_groups": final.grouped_activities / final.activity_groups if final.activity_groups else None,
+            "average_gaps_between_activities": zero_gaps / zero_gap_runs if zero_gap_runs else None,
+        }
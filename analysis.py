@@ -1,9 +1,15 @@
+import numpy as np
+from instrumentation import instrumented
+from time_utils import MISSING_TIME, to_datetime
+
+@instrumented('analysis')
 def analyze_activity_sequences(va):
     sequence = extract_sequence(va)
-    visits, activities = count_consecutive_groups(sequence)
+    visits, activities = count_consecutive_groups(sequence, va.code('semantic_type', 'visit'),
+                                                  va.code('semantic_type', 'activity'))
 
-    total_visits = sum(visits)
-    total_activities = sum(activities)
+    total_visits = int(visits.sum())
+    total_activities = int(activities.sum())
     average_activities = calculate_averages(activities)
     average_zero_gap = calculate_gaps(activities)
 
@@ -17,53 +23,80 @@ def analyze_activity_sequences(va):
     return results
 
 def extract_sequence(data):
-    return [item['semanticType'] for item in data]
-
-def count_consecutive_groups(sequence):
-    last = ''
-    visits = []
-    activities = []
-    visit_count = 0
-    activity_count = 0
-    
-    for item in sequence:
-        if item == last:
-            if item == 'visit':
-                visit_count += 1
-            elif item == 'activity':
-                activity_count += 1
-        else:
-            visits.append(visit_count)
-            activities.append(activity_count)
-            visit_count = 0
-            activity_count = 0
-
-        last = item
+    return data.semantic_type
 
-    visits.append(visit_count)
-    activities.append(activity_count)
+def run_lengths(codes, breaks=None):
+    # Start, length and value of every run; `breaks` marks forced run starts.
+    codes = np.asarray(codes)
+    n = len(codes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), codes[:0]
+    change = np.empty(n, dtype=bool)
+    change[0] = True
+    np.not_equal(codes[1:], codes[:-1], out=change[1:])
+    if breaks is not None:
+        change |= breaks
+    starts = np.flatnonzero(change)
+    lengths = np.diff(np.append(starts, n))
+    return starts, lengths, codes[starts]
 
+def count_consecutive_groups(sequence, visit_code, activity_code):
+    # Repeats per run (length - 1) for visits and activities; missing types never repeat.
+    sequence = np.asarray(sequence)
+    starts, lengths, values = run_lengths(sequence, sequence < 0)
+    repeats = lengths - 1
+    visits = np.zeros(len(lengths) + 1, dtype=np.int64)
+    activities = np.zeros(len(lengths) + 1, dtype=np.int64)
+    if visit_code >= 0:
+        np.multiply(repeats, values == visit_code, out=visits[1:])
+    if activity_code >= 0:
+        np.multiply(repeats, values == activity_code, out=activities[1:])
     return visits, activities
 
 def calculate_averages(activities):
-    non_zero_activities = [a for a in activities if a > 0]
-    return sum(non_zero_activities) / len(non_zero_activities) if non_zero_activities else None
+    activities = np.asarray(activities)
+    non_zero_activities = activities[activities > 0]
+    return float(non_zero_activities.mean()) if len(non_zero_activities) else None
 
 def calculate_gaps(activities):
-    zero_gaps = []
-    zero_count = 0
+    is_zero = np.asarray(activities) == 0
+    _, lengths, values = run_lengths(is_zero)
+    zero_gaps = lengths[values]
+    return float(zero_gaps.mean()) if len(zero_gaps) else None
 
-    for a in activities:
-        if a == 0:
-            zero_count += 1
-        elif zero_count > 0:
-            zero_gaps.append(zero_count)
-            zero_count = 0
+def run_length_histogram(va, column='semantic_type'):
+    # histogram[label][k] is the number of runs of exactly k entries with that label.
+    codes = va.columns[column]
+    _, lengths, values = run_lengths(codes, codes < 0)
+    histogram = {}
+    for code, label in enumerate(va.categories[column]):
+        label_lengths = lengths[values == code]
+        if len(label_lengths):
+            histogram[label] = np.bincount(label_lengths)
+    return histogram
 
-    if zero_count > 0:
-        zero_gaps.append(zero_count)
+def passenger_vehicle_runs(va, activity_type='IN_PASSENGER_VEHICLE'):
+    # Multi-leg trips: first row, legs and total distanceMeters of each run of drives.
+    is_passenger = va.where('top_candidate_type', activity_type)
+    starts, lengths, values = run_lengths(is_passenger)
+    starts, lengths = starts[values], lengths[values]
+    cumulative = np.concatenate([[0.0], np.cumsum(np.where(is_passenger, va.distance, 0.0))])
+    return starts, lengths, cumulative[starts + lengths] - cumulative[starts]
 
-    return sum(zero_gaps) / len(zero_gaps) if zero_gaps else None
+def longest_stretch_without_driving(va, activity_type='IN_PASSENGER_VEHICLE'):
+    # (seconds, start, end) of the longest stretch without a passenger-vehicle activity.
+    if not len(va):
+        return None, None, None
+    rows = np.flatnonzero(va.where('top_candidate_type', activity_type) &
+                          (va.start_time != MISSING_TIME) & (va.end_time != MISSING_TIME))
+    gap_starts = np.concatenate([[va.start_time[0]], va.end_time[rows]])
+    gap_ends = np.concatenate([va.start_time[rows], [va.end_time[-1]]])
+    gap_start_offsets = np.concatenate([[va.start_offset[0]], va.end_offset[rows]])
+    gap_end_offsets = np.concatenate([va.start_offset[rows], [va.end_offset[-1]]])
+    longest = int(np.argmax(gap_ends - gap_starts))
+    return (int(gap_ends[longest] - gap_starts[longest]) // 1000,
+            to_datetime(gap_starts[longest], gap_start_offsets[longest]),
+            to_datetime(gap_ends[longest], gap_end_offsets[longest]))
 
 def filter_passenger_vehicle_entries(va):
-    return [entry for entry in va if entry.get('topCandidateType') == 'IN_PASSENGER_VEHICLE']
\ No newline at end of file
+    return va.take(va.where('top_candidate_type', 'IN_PASSENGER_VEHICLE'))
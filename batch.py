@@ -0,0 +1,113 @@
+import argparse
+import csv
+import json
+import os
+from multiprocessing import Pool
+import reference_data
+from data_processing import DEFAULT_CUTOFF, stream_segments
+from report import stream_report
+from rollups import PERIODS, write_series_csv
+
+OUTPUT_FIELDS = (
+    'user', 'source', 'events', 'miles_driven', 'gallons_burned', 'CO2_tons_released', 'dust_pounds_released',
+    'wear_cost', 'bay_area_miles', 'bay_area_gallons_burned', 'bay_area_CO2_tons_released',
+    'bay_area_dust_pounds_released', 'car_total_cost', 'monthly_payment', 'monthly_amortized_cost',
+    'annual_insurance_cost', 'registration_fee', 'days_used', 'annual_miles_driven', 'annual_wear_cost',
+    'per_mile_cost', 'drive_days', 'total_consecutive_visits', 'total_consecutive_activities',
+    'average_activities_in_groups', 'average_gaps_between_activities', 'error',
+)
+
+def run_batch(source, params_file=None, output='batch_report.csv', workers=None, cutoff=DEFAULT_CUTOFF,
+              rollup_dir=None):
+    # One CSV row per user; a failed export fills that row's `error` column.
+    exports = find_exports(source)
+    user_params = load_user_params(params_file) if params_file else {}
+    defaults = user_params.pop('default', {})
+    tasks = [(user, path, {**defaults, **user_params.get(user, {})}, cutoff, rollup_dir) for user, path in exports]
+
+    succeeded = failed = 0
+    with open(output, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=OUTPUT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        if workers == 1:
+            rows = map(run_user, tasks)
+            pool = None
+        else:
+            # Parsed once here; forked workers inherit the tables, others load them at start.
+            reference_data.preload()
+            pool = Pool(workers, initializer=reference_data.preload)
+            rows = pool.imap_unordered(run_user, tasks)
+        try:
+            for row in rows:
+                writer.writerow(row)
+                if row.get('error'):
+                    failed += 1
+                else:
+                    succeeded += 1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    print(f"\nBatch complete: {succeeded} reports written, {failed} failed -> {output}")
+    return succeeded, failed
+
+def run_user(task):
+    user, path, params, cutoff, rollup_dir = task
+    row = {'user': user, 'source': path}
+    try:
+        row.update(stream_report(stream_segments(path), params, cutoff, PERIODS if rollup_dir else ()))
+        for period, series in row.pop('rollups', {}).items():
+            write_series_csv(series, os.path.join(rollup_dir, f"{user}_{period}.csv"))
+    except Exception as error:
+        row['error'] = f"{type(error).__name__}: {error}"
+    return row
+
+def find_exports(source):
+    # A directory of <user>.json exports, or a manifest of user,path rows or paths.
+    if os.path.isdir(source):
+        return [(os.path.splitext(name)[0], os.path.join(source, name))
+                for name in sorted(os.listdir(source)) if name.endswith('.json')]
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r', newline='') as file:
+        if source.endswith('.csv'):
+            entries = [(row['user'], row['path']) for row in csv.DictReader(file)]
+        else:
+            paths = [line.strip() for line in file if line.strip()]
+            entries = [(os.path.splitext(os.path.basename(path))[0], path) for path in paths]
+    return [(user, os.path.join(base, path)) for user, path in entries]
+
+def load_user_params(filename):
+    # user -> parameters, from JSON or a CSV with a `user` column; `default` applies to all.
+    with open(filename, 'r', newline='') as file:
+        if filename.endswith('.json'):
+            return json.load(file)
+        params = {}
+        for row in csv.DictReader(file):
+            user = row.pop('user')
+            params[user] = {key: _parse_value(value) for key, value in row.items() if value not in (None, '')}
+        return params
+
+def _parse_value(value):
+    lowered = value.strip().lower()
+    if lowered in ('true', 'false'):
+        return lowered == 'true'
+    if lowered in ('none', 'null'):
+        return None
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value.strip()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the cost and emissions report for many timeline exports.")
+    parser.add_argument('source', help="directory of exports, or a manifest file")
+    parser.add_argument('--params', help="per-user parameters (.json or .csv)")
+    parser.add_argument('--output', default='batch_report.csv')
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--rollups', help="directory for per-user day, week and month series")
+    args = parser.parse_args()
+    run_batch(args.source, args.params, args.output, args.workers, rollup_dir=args.rollups)
@@ -0,0 +1,273 @@
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+from analysis import analyze_activity_sequences
+from car_cost_calculator import determine_car_payment, determine_fees_insurance
+from data_processing import add_duration_to_va, load_json_data, process_data
+from emissions_calculator import calculate_emissions_and_costs
+from main import DEFAULTS
+from report import calculate_total_costs, split_params
+from synthetic import write_export
+
+DEFAULT_SIZES = (10000, 100000, 1000000)
+DATA_DIR = os.path.join('.smolways_cache', 'benchmark')
+RESULTS_VERSION = 1
+STAGES = ('load_json_data', 'process_data', 'add_duration_to_va', 'analyze_activity_sequences',
+          'calculate_emissions_and_costs', 'determine_car_payment', 'calculate_total_costs')
+
+# Per-stage timings and peak memory of main.py on synthetic exports.
+# Memory is measured in a separate run, as tracemalloc slows everything down.
+
+def run_pipeline(path, stage):
+    # `stage(name, function, *args)` runs one step and returns its result.
+    data = stage('load_json_data', load_json_data, path)
+    va, timelinePaths = stage('process_data', process_data, data)
+    del data
+    va = stage('add_duration_to_va', add_duration_to_va, va)
+    stage('analyze_activity_sequences', analyze_activity_sequences, va)
+    emissions_costs = stage('calculate_emissions_and_costs', calculate_emissions_and_costs, va)
+    _, car_params, insurance_params = split_params(DEFAULTS)
+    _, _, monthly_amortized_cost = stage('determine_car_payment', determine_car_payment, **car_params)
+    insurance_cost = determine_fees_insurance(**insurance_params)
+    stage('calculate_total_costs', calculate_total_costs, emissions_costs, monthly_amortized_cost, va,
+          car_params['years_owned'], insurance_cost)
+    return va, timelinePaths
+
+def time_stages(path):
+    seconds = {}
+
+    def stage(name, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds[name] = time.perf_counter() - start
+        return result
+
+    va, timelinePaths = run_pipeline(path, stage)
+    return seconds, len(va), len(timelinePaths)
+
+def measure_memory(path):
+    # Peak bytes allocated while each stage ran, over what was live before it.
+    peaks = {}
+
+    def stage(name, function, *args, **kwargs):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = function(*args, **kwargs)
+        peaks[name] = tracemalloc.get_traced_memory()[1] - before
+        return result
+
+    tracemalloc.start()
+    try:
+        run_pipeline(path, stage)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def synthetic_export(segments, seed=0, data_dir=DATA_DIR):
+    # Generated once per size and seed and reused by later runs.
+    path = os.path.join(data_dir, f"synthetic_{segments}_{seed}.json")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        write_export(path + '.partial', segments, seed)
+        os.replace(path + '.partial', path)
+    return path
+
+def run_benchmark(sizes=DEFAULT_SIZES, output='benchmark.json', repeat=3, memory=True, seed=0, data_dir=DATA_DIR):
+    runs = []
+    for segments in sizes:
+        path = synthetic_export(segments, seed, data_dir)
+        timings = []
+        for _ in range(repeat):
+            seconds, events, paths = time_stages(path)
+            timings.append(seconds)
+        peaks = measure_memory(path) if memory else {}
+        stages = [{
+            'stage': name,
+            'seconds': min(timing[name] for timing in timings),
+            'runs': [timing[name] for timing in timings],
+            'peak_bytes': peaks.get(name),
+        } for name in STAGES]
+        runs.append({'segments': segments, 'file_bytes': os.path.getsize(path), 'events': events,
+                     'timelinePaths': paths, 'stages': stages})
+        print(f"\n{segments} segments ({events} events, {paths} timelinePaths):")
+        for entry in stages:
+            peak = f"{entry['peak_bytes'] / 2 ** 20:10.1f} MiB" if entry['peak_bytes'] is not None else ''
+            print(f"  {entry['stage']:32} {entry['seconds']:9.4f} s {peak}")
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+        'runs': runs,
+    }
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+        file.write('\n')
+    print(f"\nBenchmark results -> {output}")
+    return results
+
+def compare_results(baseline, current, threshold=1.2, min_seconds=0.01):
+    # Stages at least `threshold` times slower or hungrier than in `baseline`.
+    baseline, current = (_load_results(results) for results in (baseline, current))
+    before = {(run['segments'], entry['stage']): entry for run in baseline['runs'] for entry in run['stages']}
+    regressions = []
+    for run in current['runs']:
+        for entry in run['stages']:
+            old = before.get((run['segments'], entry['stage']))
+            if old is None:
+                continue
+            for measure in ('seconds', 'peak_bytes'):
+                if measure == 'seconds' and max(old[measure], entry[measure]) < min_seconds:
+                    continue
+                if old.get(measure) and entry.get(measure) is not None and entry[measure] / old[measure] >= threshold:
+                    regressions.append({'segments': run['segments'], 'stage': entry['stage'], 'measure': measure,
+                                        'baseline': old[measure], 'current': entry[measure],
+                                        'ratio': entry[measure] / old[measure]})
+    for regression in regressions:
+        print(f"Regression: {regression['stage']} at {regression['segments']} segments, {regression['measure']} "
+              f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['ratio']:.2f}x)")
+    return regressions
+
+# Ingest and cold report times of the working tree against git revisions,
+# each run from a scratch copy with the export as its default timeline.
+INGEST_SCRIPT = """
+import contextlib, io, sys, time
+import data_processing
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    if hasattr(data_processing, 'stream_segments'):
+        data_processing.process_data(data_processing.stream_segments(sys.argv[1]))
+    else:
+        data_processing.process_data(data_processing.load_json_data(sys.argv[1]))
+print(time.perf_counter() - start)
+"""
+
+def run_revision_benchmark(revisions, segments=300000, output='benchmark_revisions.json', repeat=3, seed=0,
+                           data_dir=DATA_DIR):
+    path = os.path.abspath(synthetic_export(segments, seed, data_dir))
+    measures = {'ingest': lambda tree: _run_ingest(tree, path), 'report': _run_report}
+    runs = {(revision, measure): [] for revision in revisions for measure in measures}
+    with tempfile.TemporaryDirectory() as scratch:
+        trees = {revision: _copy_tree(revision, os.path.join(scratch, str(i)), path)
+                 for i, revision in enumerate(revisions)}
+        for _ in range(repeat):
+            for measure, run in measures.items():
+                for revision, tree in trees.items():
+                    shutil.rmtree(os.path.join(tree, '.smolways_cache'), ignore_errors=True)
+                    runs[revision, measure].append(run(tree))
+    results = []
+    print(f"\n{segments} segments ({os.path.getsize(path) / 2 ** 20:.0f} MiB):")
+    for revision in revisions:
+        entry = {'revision': revision or 'working tree', 'commit': _commit(revision)}
+        if revision is None:
+            entry['uncommitted_changes'] = _modified()
+        for measure in measures:
+            entry[measure] = {'seconds': min(runs[revision, measure]), 'runs': runs[revision, measure]}
+        results.append(entry)
+        print(f"  {entry['revision']:16} ingest {entry['ingest']['seconds']:8.3f} s   "
+              f"report {entry['report']['seconds']:8.3f} s")
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+        'segments': segments,
+        'file_bytes': os.path.getsize(path),
+        'revisions': results,
+    }
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+        file.write('\n')
+    print(f"\nBenchmark results -> {output}")
+    return results
+
+def _run_ingest(tree, path):
+    result = subprocess.run([sys.executable, '-c', INGEST_SCRIPT, path], cwd=tree,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+def _run_report(tree):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'main.py'], cwd=tree, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def _copy_tree(revision, directory, export):
+    # The files of `revision`, or of the working tree for None, with `export`
+    # linked in as the default timeline.
+    root = os.path.dirname(os.path.abspath(__file__))
+    if revision is None:
+        shutil.copytree(root, directory, ignore=shutil.ignore_patterns('.git', '.smolways_cache', '__pycache__'))
+    else:
+        os.makedirs(directory)
+        archive = subprocess.run(['git', 'archive', '--format=tar', revision], capture_output=True, check=True,
+                                 cwd=root)
+        with tarfile.open(fileobj=io.BytesIO(archive.stdout)) as tar:
+            tar.extractall(directory, filter='data')
+    target = os.path.join(directory, 'data', 'location-history.json')
+    if os.path.exists(target):
+        os.remove(target)
+    os.symlink(export, target)
+    return directory
+
+def _load_results(results):
+    if isinstance(results, str):
+        with open(results, 'r') as file:
+            return json.load(file)
+    return results
+
+def _commit(revision='HEAD'):
+    try:
+        return subprocess.run(['git', 'rev-parse', revision or 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def _modified():
+    # Whether tracked files differ from HEAD, which _commit() alone hides.
+    try:
+        return bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                                   text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip())
+    except OSError:
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time and measure each stage of the pipeline on synthetic exports.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="segments per export")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per size; the best is kept")
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help="skip the tracemalloc run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', default=DATA_DIR, help="where generated exports are kept")
+    parser.add_argument('--compare', help="earlier results file to check for regressions")
+    parser.add_argument('--threshold', type=float, default=1.2, help="slowdown ratio reported as a regression")
+    parser.add_argument('--against', nargs='+', metavar='REVISION',
+                        help="instead time ingest and the report in the working tree and at these git revisions")
+    parser.add_argument('--against-segments', type=int, default=300000, help="segments in the export for --against")
+    args = parser.parse_args()
+    if args.against:
+        run_revision_benchmark([None] + args.against, args.against_segments, args.output, args.repeat, args.seed,
+                               args.data_dir)
+        sys.exit()
+    results = run_benchmark(args.sizes, args.output, args.repeat, args.memory, args.seed, args.data_dir)
+    if args.compare:
+        compare_results(args.compare, results, args.threshold)
@@ -1,25 +1,8 @@
-import csv
-import os
 from datetime import datetime
+from instrumentation import instrumented
+from reference_data import load_inflation_data, price_index
 
-def load_inflation_data():
-    inflation_data = {}
-    csv_path = os.path.join('data', 'inflation_rate_year.csv')
-    
-    try:
-        with open(csv_path, 'r') as file:
-            csv_reader = csv.reader(file)
-            next(csv_reader)  # Skip header
-            for row in csv_reader:
-                inflation_data[int(row[0])] = float(row[1])
-        return inflation_data
-    except FileNotFoundError:
-        print(f"Error: The file 'inflation_rate_year.csv' was not found in the 'data' directory.")
-    except ValueError:
-        print("Error: Invalid data in the CSV file.")
-    return None
-
-def calculate_car_cost(year, used_flag, inflation_data):
+def calculate_car_cost(year, used_flag, inflation_index):
     current_year = datetime.now().year
     
     base_cost = 25571 if used_flag else 48644  # Used or new car average for 2024
@@ -28,13 +11,12 @@ def calculate_car_cost(year, used_flag, inflation_data):
         print(f"Error: Year {year} is out of range.")
         return None
 
-    cost = base_cost
-    for y in range(current_year - 1, year - 1, -1):
-        if y in inflation_data:
-            cost /= (1 + inflation_data[y])
+    # `inflation_index` is a cumulative price index (see build_price_index)
+    cost = base_cost * inflation_index[year] / inflation_index[current_year]
 
     return round(cost, 2)
 
+@instrumented('car_payment')
 def determine_car_payment(
     model_year=None,
     used_flag=True,
@@ -48,8 +30,8 @@ def determine_car_payment(
     loan_term=5,
     purchase_year=None
 ):
-    inflation_data = load_inflation_data()
-    if inflation_data is None:
+    inflation_index = price_index()
+    if inflation_index is None:
         return None, None, None
 
     current_year = datetime.now().year
@@ -70,7 +52,7 @@ def determine_car_payment(
             monthly_amortized_cost = total_cost / (years_owned * 12)
         else:
             # If neither purchase price nor payment is provided, estimate based on model year
-            total_cost = calculate_car_cost(model_year, used_flag, inflation_data)
+            total_cost = calculate_car_cost(model_year, used_flag, inflation_index)
             monthly_payment = total_cost / (loan_term * 12)
             monthly_amortized_cost = total_cost / (years_owned * 12)
     elif payment_provided is not None:
@@ -105,41 +87,12 @@ def determine_car_payment(
 
     return round(total_cost, 2), round(monthly_payment, 2), round(monthly_amortized_cost, 2)
 
-def calculate_paid_off_costs(purchase_price, payment_provided, model_year, used_flag, years_owned, inflation_data, financed, interest_rate, loan_term, purchase_year):
-    current_year = datetime.now().year
-    if purchase_price is not None:
-        if financed and purchase_year and (current_year - purchase_year) < loan_term:
-            total_cost, monthly_payment = calculate_financed_costs(purchase_price, financed, interest_rate, loan_term, years_owned)
-        else:
-            total_cost = purchase_price
-            monthly_payment = total_cost / (years_owned * 12)
-    elif payment_provided is not None:
-        monthly_payment = payment_provided
-        total_cost = monthly_payment * loan_term * 12
-    else:
-        model_year = model_year or (purchase_year if purchase_year else current_year - 7)
-        total_cost = calculate_car_cost(model_year, used_flag, inflation_data)
-        monthly_payment = total_cost / (years_owned * 12)
-
-    if total_cost is None:
-        return None, None
-
-    return total_cost, monthly_payment
-
-def calculate_financed_costs(purchase_price, financed, interest_rate, loan_term, years_owned):
-    if financed:
-        monthly_payment = calculate_monthly_payment(purchase_price, interest_rate, loan_term)
-        total_cost = monthly_payment * loan_term * 12
-    else:
-        total_cost = purchase_price
-        monthly_payment = total_cost / (years_owned * 12)
-    return total_cost, monthly_payment
-
 def calculate_monthly_payment(principal, annual_interest_rate, loan_term_years):
     monthly_rate = annual_interest_rate / 12
     num_payments = loan_term_years * 12
     return (principal * monthly_rate * (1 + monthly_rate) ** num_payments) / ((1 + monthly_rate) ** num_payments - 1)
 
+@instrumented('insurance')
 def determine_fees_insurance(insurance_monthly=None, insurance_type='min', people_split=1, registration_fee=None):
     cost_of_registration = 289  # dollars per year
     min_car_ins_cal, avg_ful_ins_cal = 50, 190  # dollars per month for minimum/full coverage
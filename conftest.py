@@ -0,0 +1,18 @@
+import pytest
+from data_processing import add_duration_to_va, process_data, stream_segments
+from synthetic import write_export
+
+# Shared test fixtures; at the top level, this file also puts the repo on sys.path.
+
+@pytest.fixture(scope='session')
+def export(tmp_path_factory):
+    # A synthetic export for the tests that only read it.
+    path = tmp_path_factory.mktemp('export') / 'export.json'
+    write_export(path, 2000)
+    return str(path)
+
+@pytest.fixture(scope='session')
+def timeline(export):
+    # (va, timelinePaths) for `export`, with durations added.
+    va, timelinePaths = process_data(stream_segments(export))
+    return add_duration_to_va(va), timelinePaths
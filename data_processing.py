@@ -1,9 +1,18 @@
+import codecs
+import contextlib
+import gc
+import io
 import json
-from datetime import datetime
-import pandas as pd
+import re
+from itertools import islice
 import numpy as np
-from time_utils import get_day_of_week, calculate_duration
+from instrumentation import count, instrumented, instrumented_iter
+from timeline import TimelineBuilder, TimelinePathsBuilder, PARSE_BATCH
+from time_utils import MISSING_TIME, parse_cutoff, parse_timestamps, days_of_week, durations
 
+DEFAULT_CUTOFF = "2024-02-01T06:00:00-07:00"
+
+@instrumented('ingest')
 def load_json_data(filename):
     try:
         with open(filename, 'r') as file:
@@ -15,26 +24,243 @@ def load_json_data(filename):
         print(f"Error: The file '{filename}' is not a valid JSON file.")
     return None
 
-def process_data(data):
-    visits_activities = []
-    timelinePaths = []
-    for item in data["semanticSegments"]:
-        if is_after(item["startTime"], "2024-02-01T06:00:00-07:00"):
+class TimelineFormatError(ValueError):
+    # The export is not JSON, or ends part way through its semanticSegments.
+    pass
+
+def stream_segments(filename, chunk_size=1 << 16):
+    return iter(SegmentReader(filename, chunk_size=chunk_size))
+
+class SegmentReader:
+    # Segments one at a time; `last_offset` is where a later read can resume.
+    def __init__(self, filename, offset=0, chunk_size=1 << 16):
+        self.filename = filename
+        self.offset = offset
+        self.chunk_size = chunk_size
+        self.last = None
+        self.last_offset = None
+
+    def __iter__(self):
+        # A truncated export raises instead of ending the stream early.
+        try:
+            with open(self.filename, 'rb') as file:
+                file.seek(self.offset)
+                stream = _JSONStream(file, self.chunk_size, self.offset)
+                elements = stream.elements() if self.offset else stream.array("semanticSegments")
+                yield from instrumented_iter('ingest', elements)
+                self.last, self.last_offset = stream.last, stream.last_offset()
+        except FileNotFoundError:
+            print(f"Error: The file '{self.filename}' was not found.")
+            raise
+        except (json.JSONDecodeError, UnicodeDecodeError) as error:
+            # JSONDecodeError positions are relative to the buffer; keep the message.
+            reason = error.msg if isinstance(error, json.JSONDecodeError) else error.reason
+            print(f"Error: The file '{self.filename}' is not a valid JSON file.")
+            raise TimelineFormatError(f"'{self.filename}' is not a complete timeline export ({reason})") from error
+
+def iter_json_array(file, key, chunk_size=1 << 16):
+    # Yields the elements of the top-level array `key` one at a time.
+    return _JSONStream(file, chunk_size).array(key)
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+class _JSONStream:
+    # JSON from a file, a buffer at a time; `offset` is the buffer's byte offset.
+    def __init__(self, file, chunk_size, offset=0):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = None if isinstance(file, io.TextIOBase) else codecs.getincrementaldecoder('utf-8')()
+        self.offset = self.read = offset
+        self.last = None
+        self.mark = None  # buffer index where `last` starts, or None once resolved to mark_offset
+        self.mark_offset = None
+
+    def fill(self):
+        # Grow reads with the buffer, so a value larger than a chunk decodes in linear time.
+        size = max(self.chunk_size, len(self.buffer) - self.pos)
+        if self.decoder is None:
+            chunk = self.file.read(size)
+        else:
+            decoded = self.read - len(self.decoder.getstate()[0])
+            while True:
+                data = self.file.read(size)
+                self.read += len(data)
+                chunk = self.decoder.decode(data, final=not data)
+                if chunk or not data:
+                    break
+        if not chunk:
+            self.eof = True
+            return False
+        if self.decoder is not None:
+            if self.mark is not None and self.mark < self.pos:
+                self.mark_offset = self.offset + _utf8_length(self.buffer[:self.mark])
+                self.mark = None
+            elif self.mark is not None:
+                self.mark -= self.pos
+            self.offset = decoded - _utf8_length(self.buffer[self.pos:])
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def last_offset(self):
+        if self.mark is None:
+            return self.mark_offset
+        return self.offset + _utf8_length(self.buffer[:self.mark])
+
+    def array(self, key):
+        # The elements of the array under `key` in the object read next.
+        self.expect('{')
+        if self.peek() == '}':
+            return
+        while True:
+            name = self.value()
+            self.expect(':')
+            if name == key:
+                self.expect('[')
+                yield from self.elements()
+                return
+            self.value()
+            if self.peek() != ',':
+                self.expect('}')
+                return
+            self.pos += 1
+
+    def peek(self):
+        while True:
+            self.pos = _whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            reason = f"Expecting '{char}'" if found else f"File ends where '{char}' was expected"
+            raise json.JSONDecodeError(reason, self.buffer, self.pos)
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number running into the end of the buffer may be cut short.
+            if end == len(self.buffer) and not self.eof and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def elements(self):
+        # The values of the array being read, decoded from the buffer where
+        # they end inside it.
+        scan = _decoder.scan_once
+        skip = _whitespace.match
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            buffer = self.buffer
+            start = skip(buffer, self.pos).end()
+            try:
+                value, end = scan(buffer, start)
+            except (StopIteration, json.JSONDecodeError):
+                end = None
+            if end is not None:
+                after = end if buffer[end:end + 1] == ',' else skip(buffer, end).end()
+                if after < len(buffer) and buffer[after] in ',]':
+                    self.pos = after + 1
+                    self.last, self.mark = value, start
+                    yield value
+                    if buffer[after] == ']':
+                        return
+                    continue
+            # Not the last element, so its start need not be kept.
+            self.pos, self.mark = start, None
+            if self.fill():
+                continue
+            self.last, self.mark = self.value(), start
+            yield self.last
+            if self.peek() != ',':
+                self.expect(']')
+                return
+            self.pos += 1
+
+def _utf8_length(text):
+    return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+@instrumented('flatten')
+def process_data(segments, cutoff=DEFAULT_CUTOFF):
+    if isinstance(segments, dict):
+        segments = segments["semanticSegments"]
+    visits_activities = TimelineBuilder()
+    timelinePaths = TimelinePathsBuilder()
+    with paused_gc():
+        for item, start_time, start_offset in filter_segments_after(segments, cutoff):
             if item.get('timelinePath') is not None:
-                timelinePaths.append(item)
-            if item.get("activity") is not None:   
-                visits_activities.append(flatten_activity(item))
-            if item.get("visit") is not None:  
-                visits_activities.append(flatten_visit(item))
-    print("\nAnalyzed Google Timeline Data")
-    print("  Total Events:", len(visits_activities))
-    print("  Total timelinePaths:", len(timelinePaths))
-    return visits_activities, timelinePaths
-
-def is_after(date_str, compare_str):
-    date_time = datetime.fromisoformat(date_str)
-    compare_time = datetime.fromisoformat(compare_str)
-    return date_time > compare_time
+                timelinePaths.append(item, start_time, start_offset)
+            if item.get("activity") is not None:
+                visits_activities.append_activity(item, start_time, start_offset)
+            if item.get("visit") is not None:
+                visits_activities.append_visit(item, start_time, start_offset)
+        return visits_activities.build(), timelinePaths.build()
+
+def iter_timeline_chunks(segments, cutoff=DEFAULT_CUTOFF, chunk_size=PARSE_BATCH):
+    # process_data as Timeline chunks of about `chunk_size` rows.
+    if isinstance(segments, dict):
+        segments = segments["semanticSegments"]
+    builder = TimelineBuilder()
+    segments = filter_segments_after(segments, cutoff)
+    finished = False
+    while not finished:
+        # Paused only while a chunk is read.
+        with paused_gc():
+            finished = True
+            for item, start_time, start_offset in segments:
+                if item.get("activity") is not None:
+                    builder.append_activity(item, start_time, start_offset)
+                if item.get("visit") is not None:
+                    builder.append_visit(item, start_time, start_offset)
+                if len(builder) >= chunk_size:
+                    finished = False
+                    break
+            chunk = builder.build_chunk() if len(builder) else None
+        if chunk is not None:
+            yield chunk
+
+@contextlib.contextmanager
+def paused_gc():
+    # The segments are acyclic, so the cyclic collector only slows this down.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def filter_segments_after(segments, cutoff, batch_size=4096):
+    # (segment, start_time, start_offset) for segments starting after `cutoff`.
+    cutoff_time = parse_cutoff(cutoff)
+    segments = iter(segments)
+    while True:
+        batch = list(islice(segments, batch_size))
+        if not batch:
+            return
+        start_times, start_offsets = parse_timestamps([item.get("startTime") for item in batch])
+        keep = np.flatnonzero(start_times > cutoff_time)
+        count('segments_read', len(batch))
+        count('segments_kept', len(keep))
+        for i, start_time, start_offset in zip(keep.tolist(), start_times[keep].tolist(), start_offsets[keep].tolist()):
+            yield batch[i], start_time, start_offset
 
 def flatten_activity(activity_dict):
     start_time = activity_dict.get('startTime')
@@ -102,30 +328,15 @@ def flatten_visit(visit_dict):
         'placeLatLng': place_lat_lng
     }
 
+@instrumented('durations')
 def add_duration_to_va(va):
-    for entry in va:
-        start_time = entry.get('startTime')
-        end_time = entry.get('endTime')
-
-        if start_time:
-            entry['day-of-week'] = get_day_of_week(start_time)
-
-        if start_time and end_time:
-            seconds = calculate_duration(start_time, end_time)
-            entry['duration'] = seconds
-
+    va.columns['day_of_week'] = days_of_week(va.start_time, va.start_offset)
+    va.columns['duration'] = durations(va.start_time, va.end_time)
     return va
 
 def check_missing_times(va):
-    missing_times_indices = []
-    for index, entry in enumerate(va):
-        start_time = entry.get('startTime')
-        end_time = entry.get('endTime')
-
-        if start_time is None or end_time is None or \
-           (isinstance(start_time, float) and np.isnan(start_time)) or \
-           (isinstance(end_time, float) and np.isnan(end_time)):
-            missing_times_indices.append(index)
-    
+    missing = (va.start_time == MISSING_TIME) | (va.end_time == MISSING_TIME)
+    missing_times_indices = np.flatnonzero(missing).tolist()
+
     print(f"{len(missing_times_indices)} items missing start/end")
-    return missing_times_indices
\ No newline at end of file
+    return missing_times_indices
@@ -1,33 +1,53 @@
-from time_utils import find_min_max_dates
+import numpy as np
+import fuel_prices
+import reference_data
+from instrumentation import instrumented
+from time_utils import MISSING_TIME, civil_from_days, find_min_max_dates, local_days
 
+DEFAULT_STATE = "CA"
+FUEL_GRADES = ('Regular', 'MidGrade', 'Premium', 'Diesel')
+FALLBACK_FUEL_PRICE = 4.50  # dollars per gallon, used when no price is available
+
+# Constants
+WEAR_COST_CONSTANTS = {
+    'cost_of_maint_year': 400,  # dollars per year for 10,000 miles
+    'cost_of_tire': 400,  # dollars per change
+    'cost_of_brake_change': 1000,  # dollars per change
+    'brake_rate': 60000,  # longevity in miles
+    'tire_rate': 60000,  # longevity in miles
+    'cost_to_park': 80,  # dollars a month for 10,000 miles per year
+}
+
+@instrumented('emissions')
 def calculate_emissions_and_costs(va, vehicle_mpg=24.4, vehicle_kerb_w=3500, miles_driven_correction=1.0):
-    passenger_va = [entry for entry in va if entry.get('topCandidateType') == 'IN_PASSENGER_VEHICLE']
+    passenger = va.where('top_candidate_type', 'IN_PASSENGER_VEHICLE')
+    min_date, max_date = find_min_max_dates(va)
+    meters = va.distance[passenger]
+    prices = trip_fuel_prices(va.start_lat[passenger], va.start_lng[passenger])
+    fuel_price = average_fuel_price(float((meters * prices).sum()), float(meters.sum()))
+    return summarize_emissions_and_costs(float(meters.sum()), min_date, max_date, vehicle_mpg, vehicle_kerb_w,
+                                         miles_driven_correction, fuel_price)
 
-    kms_driven = sum([item['distanceMeters'] for item in passenger_va]) / 1000
+@instrumented('emissions_summary')
+def summarize_emissions_and_costs(passenger_meters, min_date, max_date, vehicle_mpg=24.4, vehicle_kerb_w=3500,
+                                  miles_driven_correction=1.0, fuel_price=None):
+    # `fuel_price` is the distance-weighted dollars per gallon over the trips
+    # (see trip_fuel_prices); None prices every mile in DEFAULT_STATE.
+    kms_driven = passenger_meters / 1000
     miles_driven = kms_driven / 1.6 * miles_driven_correction
 
-    min_date, max_date = find_min_max_dates(va)
     fraction_of_year_equivalent = (max_date - min_date).days / 365
 
-    # Emission constants
-    kCO2 = 11.14  # Well to pump CO2 in kg per gallon
-    break_particulates = 25.85  # Sum of PM2.5 and PM10 light duty vehicle per mile MOVES
-    tire_particulates = 11.5  # Based on MOVES 2014 light duty truck
-    total_particulates = tire_particulates + break_particulates
-
     # Calculate emissions for actual miles driven
-    gallons_burned = miles_driven / vehicle_mpg
-    CO2kgs_released = gallons_burned * kCO2
-    mgs_released = miles_driven * total_particulates
+    gallons_burned, CO2kgs_released, mgs_released = calculate_emissions(miles_driven, vehicle_mpg)
 
     # Calculate emissions for Bay Area average miles driven in same period of time
     bay_area_miles = 10000 * fraction_of_year_equivalent
-    bay_area_gallons_burned = bay_area_miles / vehicle_mpg
-    bay_area_CO2kgs_released = bay_area_gallons_burned * kCO2
-    bay_area_mgs_released = bay_area_miles * total_particulates
+    bay_area_gallons_burned, bay_area_CO2kgs_released, bay_area_mgs_released = \
+        calculate_emissions(bay_area_miles, vehicle_mpg)
 
     # Calculate wear costs
-    wear_cost = determine_wear_costs(miles_driven, vehicle_mpg, "CA")
+    wear_cost = determine_wear_costs(miles_driven, vehicle_mpg, DEFAULT_STATE, fuel_price)
 
     results = {
         "miles_driven": round(miles_driven, 0),
@@ -43,26 +63,82 @@ def calculate_emissions_and_costs(va, vehicle_mpg=24.4, vehicle_kerb_w=3500, mil
 
     return results
 
-def determine_wear_costs(miles_driven, vehicle_mpg, state):
-    # Constants
-    cost_of_maint_year = 400  # dollars per year for 10,000 miles
-    cost_of_tire = 400  # dollars per change
-    cost_of_brake_change = 1000  # dollars per change
-    brake_rate = 60000  # longevity in miles
-    tire_rate = 60000  # longevity in miles
-    cost_to_park = 80  # dollars a month for 10,000 miles per year
+def calculate_emissions(miles_driven, vehicle_mpg, vehicle_kerb_w=None):
+    # Tire particulates scale with `vehicle_kerb_w` (pounds) when given.
+    # Emission constants
+    kCO2 = 11.14  # Well to pump CO2 in kg per gallon
+    break_particulates = 25.85  # Sum of PM2.5 and PM10 light duty vehicle per mile MOVES
+    tire_particulates = 11.5  # Based on MOVES 2014 light duty truck
+    if vehicle_kerb_w is not None:
+        tire_particulates = tire_particulates * vehicle_kerb_w / 3500
+    total_particulates = tire_particulates + break_particulates
+
+    gallons_burned = miles_driven / vehicle_mpg
+    CO2kgs_released = gallons_burned * kCO2
+    mgs_released = miles_driven * total_particulates
+    return gallons_burned, CO2kgs_released, mgs_released
+
+def determine_wear_costs(miles_driven, vehicle_mpg, state, fuel_price=None, constants=None, date=None):
+    # `constants` overrides any of WEAR_COST_CONSTANTS, e.g. with arrays of draws.
+    # Without `fuel_price`, fuel is priced in `state` on `date` (see state_based_calc).
+    constants = WEAR_COST_CONSTANTS if constants is None else {**WEAR_COST_CONSTANTS, **constants}
+    cost_of_maint_year = constants['cost_of_maint_year']
+    cost_of_tire = constants['cost_of_tire']
+    cost_of_brake_change = constants['cost_of_brake_change']
+    brake_rate = constants['brake_rate']
+    tire_rate = constants['tire_rate']
+    cost_to_park = constants['cost_to_park']
 
     maintenance_cost = (miles_driven / 10000) * cost_of_maint_year
     tire_wear_cost = (miles_driven / tire_rate) * cost_of_tire
     brake_wear_cost = (miles_driven / brake_rate) * cost_of_brake_change
-    fuel_cost = (miles_driven / vehicle_mpg) * state_based_calc(state)
+    fuel_cost = (miles_driven / vehicle_mpg) * (fuel_price if fuel_price is not None else state_based_calc(state, date=date))
     parking_cost = (miles_driven / 10000) * (cost_to_park * 12)
 
     total_cost = maintenance_cost + tire_wear_cost + brake_wear_cost + fuel_cost + parking_cost
 
     return total_cost
 
-def state_based_calc(state):
-    # This function should be implemented to return the correct fuel cost based on the state
-    # For now, we'll use a placeholder value
-    return 4.50  # dollars per gallon
\ No newline at end of file
+def state_based_calc(state, grade='Regular', date=None):
+    # Price per gallon in `state` on `date`, or the latest price.
+    price = fuel_prices.price_provider().prices([(state, grade, date)])[0]
+    if price is None:
+        return FALLBACK_FUEL_PRICE
+    return price
+
+def average_fuel_price(cost_meters, meters, grade='Regular'):
+    # Distance-weighted price per gallon, or the DEFAULT_STATE price without distance.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price = np.where(np.asarray(meters) > 0, np.divide(cost_meters, meters),
+                         state_based_calc(DEFAULT_STATE, grade))
+    return float(price) if price.ndim == 0 else price
+
+def trip_fuel_prices(start_lats, start_lngs, grade='Regular', default_state=DEFAULT_STATE, start_times=None,
+                     start_offsets=None):
+    # Price per gallon of each trip in the state it starts in, on its local
+    # date when start times are given. Unmatched trips use `default_state`.
+    count = len(start_lats)
+    if not count:
+        return np.zeros(0)
+    index = reference_data.state_index()
+    names = (index.names if index is not None else []) + [default_state]
+    states = index.lookup(start_lats, start_lngs) if index is not None else np.full(count, -1)
+    states = np.where(states < 0, len(names) - 1, states)
+    if start_times is None:
+        pairs, inverse = np.unique(states, return_inverse=True)
+        keys = [(names[state], grade, None) for state in pairs.tolist()]
+    else:
+        # Day 0 stands for a missing start time, priced at the latest price.
+        start_times = np.asarray(start_times)
+        known = start_times != MISSING_TIME
+        days = local_days(start_times, np.asarray(start_offsets))
+        first_day = days[known].min() - 1 if known.any() else 0
+        days = np.where(known, days - first_day, 0)
+        pairs, inverse = np.unique(days * len(names) + states, return_inverse=True)
+        years, months, month_days = civil_from_days(pairs // len(names) + first_day)
+        keys = [(names[state], grade, f"{year:04d}-{month:02d}-{day:02d}" if code >= len(names) else None)
+                for code, state, year, month, day in zip(pairs.tolist(), (pairs % len(names)).tolist(),
+                                                         years.tolist(), months.tolist(), month_days.tolist())]
+    prices = fuel_prices.price_provider().prices(keys)
+    lookup = np.array([price if price is not None else FALLBACK_FUEL_PRICE for price in prices], dtype=np.float64)
+    return lookup[inverse.reshape(-1)]
@@ -0,0 +1,160 @@
+from datetime import datetime
+import numpy as np
+from reference_data import price_index
+
+AVG_CAR_PAY_USED, AVG_CAR_PAY_NEW = 523, 735  # US AVG 2024 per month for used/new cars
+BASE_COST_USED, BASE_COST_NEW = 25571, 48644  # Used or new car average for 2024
+
+# Array versions of car_cost_calculator's payment functions. Parameters are
+# broadcast together; scenarios the scalar functions fail on come back NaN.
+
+def determine_car_payments(
+    model_year=None,
+    used_flag=True,
+    payment_provided=None,
+    has_monthly_payment=None,
+    car_paid_off=False,
+    purchase_price=None,
+    years_owned=5,
+    interest_rate=0.05,
+    financed=True,
+    loan_term=5,
+    purchase_year=None
+):
+    # Returns (total_cost, monthly_payment, monthly_amortized_cost) arrays.
+    model_year, payment_provided, purchase_price, years_owned, interest_rate, loan_term, purchase_year = (
+        _optional(values) for values in (model_year, payment_provided, purchase_price, years_owned, interest_rate,
+                                         loan_term, purchase_year))
+    used_flag, has_monthly_payment, car_paid_off, financed = (
+        _flag(values) for values in (used_flag, has_monthly_payment, car_paid_off, financed))
+    shape = np.broadcast_shapes(model_year.shape, used_flag.shape, payment_provided.shape,
+                                has_monthly_payment.shape, car_paid_off.shape, purchase_price.shape,
+                                years_owned.shape, interest_rate.shape, financed.shape, loan_term.shape,
+                                purchase_year.shape)
+
+    inflation_index = price_index()
+    if inflation_index is None:
+        return np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+
+    current_year = datetime.now().year
+    has_model_year = ~np.isnan(model_year)
+    has_payment = ~np.isnan(payment_provided)
+    has_price = ~np.isnan(purchase_price)
+    average_payment = np.where(used_flag, AVG_CAR_PAY_USED, AVG_CAR_PAY_NEW)
+
+    # Determine if the car is currently paid off based on purchase year and loan term
+    known_term = _truthy(purchase_year) & _truthy(loan_term)
+    car_paid_off = np.where(known_term, (current_year - purchase_year) >= loan_term, car_paid_off)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        term_months = loan_term * 12
+        growth = (1 + interest_rate / 12) ** term_months
+        financed_payment = calculate_monthly_payments(purchase_price, interest_rate, loan_term)
+        estimated_cost = calculate_car_costs(model_year, used_flag, inflation_index)
+
+        # The branches of determine_car_payment in order; the first that applies wins.
+        paid_off_price = car_paid_off & has_price
+        paid_off_payment = car_paid_off & ~has_price & has_payment
+        paid_off_estimate = car_paid_off & ~has_price & ~has_payment
+        open_payment = ~car_paid_off & has_payment
+        average = ~car_paid_off & ~has_payment & has_monthly_payment
+        priced = ~car_paid_off & ~has_payment & ~average & has_price & has_model_year
+        priced_financed = priced & financed
+
+        monthly_payment = np.select(
+            [paid_off_price, paid_off_payment | open_payment, paid_off_estimate, average, priced_financed, priced],
+            [purchase_price / term_months, payment_provided, estimated_cost / term_months, average_payment,
+             financed_payment, purchase_price / term_months],
+            0.8 * average_payment)
+        total_cost = np.select([paid_off_price, paid_off_estimate, priced & ~priced_financed],
+                               [purchase_price, estimated_cost, purchase_price],
+                               monthly_payment * loan_term * 12)
+
+        # Handle discrepancies between provided values
+        check = _truthy(purchase_price) & _truthy(payment_provided) & _truthy(interest_rate)
+        discrepant = check & (np.abs(financed_payment - payment_provided) > 1)
+        if discrepant.any():
+            print(f"Warning: Provided monthly payment doesn't match calculated payment in "
+                  f"{int(np.broadcast_to(discrepant, shape).sum())} scenarios.")
+            monthly_payment = np.where(discrepant, np.maximum(financed_payment, payment_provided), monthly_payment)
+            total_cost = np.where(discrepant, monthly_payment * loan_term * 12, total_cost)
+        monthly_amortized_cost = total_cost / (years_owned * 12)
+
+        # Scenarios where the scalar function divides by zero or has no car cost estimate
+        failed = (((paid_off_price | paid_off_estimate | (priced & ~priced_financed)) & (term_months == 0)) |
+                  ((priced_financed | check) & (growth == 1)) | (paid_off_estimate & np.isnan(estimated_cost)) |
+                  (years_owned * 12 == 0))
+        results = (np.where(failed, np.nan, values) for values in (total_cost, monthly_payment, monthly_amortized_cost))
+        return tuple(round_cents(np.broadcast_to(values, shape)) for values in results)
+
+def calculate_monthly_payments(principal, annual_interest_rate, loan_term_years):
+    monthly_rate = np.asarray(annual_interest_rate, dtype=np.float64) / 12
+    num_payments = np.asarray(loan_term_years, dtype=np.float64) * 12
+    growth = (1 + monthly_rate) ** num_payments
+    return (principal * monthly_rate * growth) / (growth - 1)
+
+def calculate_car_costs(year, used_flag, inflation_index):
+    # calculate_car_cost over arrays; years outside the index come back NaN.
+    current_year = datetime.now().year
+    first_year = min(inflation_index)
+    index = np.array([inflation_index.get(y, np.nan) for y in range(first_year, current_year + 1)])
+    year = np.asarray(year, dtype=np.float64)
+    known = (year >= 1929) & (year <= current_year) & (year >= first_year) & (year == np.floor(year))
+    position = np.where(known, year - first_year, 0).astype(np.int64)
+    base_cost = np.where(used_flag, BASE_COST_USED, BASE_COST_NEW)
+    cost = base_cost * index[position] / index[current_year - first_year]
+    return round_cents(np.where(known, cost, np.nan))
+
+def financing_grid(**parameters):
+    # Every combination of the list parameters, one axis each, e.g.
+    # financing_grid(purchase_price=[20000, 30000], loan_term=[3, 5, 7]).
+    swept = {name: np.asarray(values) for name, values in parameters.items() if np.ndim(values) > 0}
+    axes = [np.reshape(values, [-1 if axis == position else 1 for axis in range(len(swept))])
+            for position, values in enumerate(swept.values())]
+    total_cost, monthly_payment, monthly_amortized_cost = determine_car_payments(**{**parameters,
+                                                                                   **dict(zip(swept, axes))})
+    grid = {name: np.broadcast_to(axis, total_cost.shape) for name, axis in zip(swept, axes)}
+    grid.update({'total_cost': total_cost, 'monthly_payment': monthly_payment,
+                 'monthly_amortized_cost': monthly_amortized_cost})
+    return grid
+
+def round_cents(values):
+    # round(value, 2) over an array, bit for bit; np.round differs near half cents.
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        return _round_cents(values.reshape(-1)).reshape(values.shape)
+
+def _round_cents(values):
+    scaled = values * 100
+    cents = np.rint(scaled)
+    # Only products that landed exactly on a half cent can be on the wrong side.
+    ties = np.flatnonzero(np.abs(scaled - cents) == 0.5)
+    if len(ties):
+        value, product = values[ties], scaled[ties]
+        split = 134217729.0 * value
+        high = split - (split - value)
+        error = (high * 100 - product) + (value - high) * 100
+        remainder = product - cents[ties]
+        cents[ties] += ((remainder == 0.5) & (error > 0)).astype(np.float64) - ((remainder == -0.5) & (error < 0))
+    rounded = cents / 100
+    large = np.abs(scaled) >= 2.0 ** 52
+    rounded[large] = values[large]
+    return rounded
+
+def _optional(values):
+    # None -> NaN, so "not provided" survives broadcasting as a float.
+    if values is None:
+        return np.float64(np.nan)
+    array = np.asarray(values)
+    if array.dtype == object:
+        array = np.array([np.nan if value is None else value for value in array.ravel()],
+                         dtype=np.float64).reshape(array.shape)
+    return array.astype(np.float64)
+
+def _flag(values):
+    # Python truthiness of each element; None and NaN are false.
+    array = _optional(values)
+    return _truthy(array)
+
+def _truthy(array):
+    return (array != 0) & ~np.isnan(array)
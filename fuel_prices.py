@@ -0,0 +1,225 @@
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as Date, datetime
+from urllib.parse import urlsplit
+import reference_data
+from state_index import state_name
+
+ENV_FUEL_PRICE_URL = 'SMOLWAYS_FUEL_PRICE_URL'  # HTTP feed to price fuel from instead of the WPR file
+RESOLUTIONS = ('month', 'day')
+
+# Fuel price providers: prices(keys) maps (state, grade, date) keys to dollars
+# per gallon, or None; a None date asks for the latest price.
+
+class WPRFileProvider:
+    # The WPR gas price table, priced from the last survey on or before a date.
+    def __init__(self, filename=reference_data.GAS_PRICES_FILE):
+        self.filename = filename
+        self.surveys = {}  # grade -> [(YYYYMM, {state: price, None: average})], oldest first
+
+    def _grade_surveys(self, grade):
+        if grade not in self.surveys:
+            table = (reference_data.gas_prices() if self.filename == reference_data.GAS_PRICES_FILE
+                     else reference_data.load_state_table(self.filename))
+            if not table:
+                return None
+            prefix = f"GasPrices_AvgPrice{grade}_"
+            surveys = []
+            for column in sorted(key for key in next(iter(table.values())) if key.startswith(prefix)):
+                prices = {state: row[column] for state, row in table.items()}
+                prices[None] = sum(prices.values()) / len(prices)
+                surveys.append((int(column[len(prefix):]), prices))
+            self.surveys[grade] = surveys
+        return self.surveys[grade]
+
+    def prices(self, keys):
+        return [self._price(state, grade, date) for state, grade, date in keys]
+
+    def _price(self, state, grade, date):
+        surveys = self._grade_surveys(grade)
+        if not surveys:
+            return None
+        prices = surveys[-1][1]
+        if date is not None:
+            month = _month(date)
+            prices = next((prices for survey, prices in reversed(surveys) if survey <= month), surveys[0][1])
+        return prices.get(state_name(state), prices[None])
+
+class HTTPPriceProvider:
+    # POSTs {"prices": [{"state", "grade", "date"}, ...]} to `url`, expecting
+    # {"prices": [price or null, ...]}; misses and failures use `fallback`.
+    def __init__(self, url, ttl=3600, max_entries=4096, batch_size=500, max_connections=4, timeout=10,
+                 resolution='month', fallback=None, headers=None, negative_ttl=60, max_failures=3,
+                 retry_after=30):
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"unknown resolution '{resolution}', expected one of {', '.join(RESOLUTIONS)}")
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"fuel price feed must be an http(s) URL, got '{url}'")
+        self.url = url
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host, self.port = parts.hostname, parts.port
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.resolution = resolution
+        self.fallback = fallback if fallback is not None else WPRFileProvider()
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self.cache = OrderedDict()  # key -> (price or None for a miss, expiry on the monotonic clock)
+        self.lock = threading.Lock()
+        self.connections = queue.LifoQueue()
+        self.fetches = 0
+        self.failures = 0  # failed fetches in a row
+        self.closed_until = 0.0  # no fetches before this, on the monotonic clock
+
+    def prices(self, keys):
+        keys = [self._key(*key) for key in keys]
+        now = time.monotonic()
+        found, missing = {}, []
+        with self.lock:
+            for key in dict.fromkeys(keys):
+                entry = self.cache.get(key)
+                if entry is not None and entry[1] > now:
+                    self.cache.move_to_end(key)
+                    found[key] = entry[0]
+                else:
+                    missing.append(key)
+            if now < self.closed_until:
+                found.update(dict.fromkeys(missing))
+                missing = []
+
+        batches = [missing[start:start + self.batch_size] for start in range(0, len(missing), self.batch_size)]
+        if len(batches) > 1:
+            with ThreadPoolExecutor(min(self.max_connections, len(batches))) as pool:
+                answers = list(pool.map(self._fetch, batches))
+        else:
+            answers = [self._fetch(batch) for batch in batches]
+
+        now = time.monotonic()
+        with self.lock:
+            for batch, prices in zip(batches, answers):
+                for key, price in zip(batch, prices or [None] * len(batch)):
+                    found[key] = price
+                    self.cache[key] = (price, now + (self.ttl if price is not None else self.negative_ttl))
+                    self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        unpriced = [key for key, price in found.items() if price is None]
+        if unpriced:
+            found.update(zip(unpriced, self.fallback.prices(unpriced)))
+        return [found[key] for key in keys]
+
+    def _key(self, state, grade, date):
+        if date is not None:
+            date = _iso_date(date)
+            date = date[:7] if self.resolution == 'month' else date
+        return state_name(state), grade, date
+
+    def _fetch(self, batch):
+        # The prices for one batch, or None when the feed could not answer.
+        body = json.dumps({'prices': [{'state': state, 'grade': grade, 'date': date}
+                                      for state, grade, date in batch]}).encode('utf-8')
+        # A reused connection may have been closed; retry once on a fresh one.
+        for attempt in range(2):
+            connection = self._connection(fresh=attempt > 0)
+            try:
+                connection.request('POST', self.path, body, self.headers)
+                response = connection.getresponse()
+                payload = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                continue
+            self._release(connection)
+            if response.status != 200:
+                return self._failed(f"fuel price feed at {self.url} answered {response.status}")
+            try:
+                prices = json.loads(payload)['prices']
+            except (ValueError, KeyError, TypeError):
+                prices = None
+            if not isinstance(prices, list) or len(prices) != len(batch):
+                return self._failed(f"unexpected answer from the fuel price feed at {self.url}")
+            with self.lock:
+                self.fetches += 1
+                self.failures = 0
+            return [float(price) if isinstance(price, (int, float)) else None for price in prices]
+        return self._failed(f"fuel price feed at {self.url} is unreachable")
+
+    def _failed(self, reason):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.closed_until = time.monotonic() + self.retry_after
+                reason += f", {self.failures} times in a row; not trying again for {self.retry_after}s"
+        print(f"Warning: {reason}; using {self._fallback_name()}.")
+        return None
+
+    def _connection(self, fresh=False):
+        if not fresh:
+            try:
+                return self.connections.get_nowait()
+            except queue.Empty:
+                pass
+        return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, connection):
+        if self.connections.qsize() < self.max_connections:
+            self.connections.put_nowait(connection)
+        else:
+            connection.close()
+
+    def _fallback_name(self):
+        return type(self.fallback).__name__
+
+    def close(self):
+        while True:
+            try:
+                self.connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+            self.failures = 0
+            self.closed_until = 0.0
+
+# The provider state_based_calc and trip_fuel_prices use: the WPR file, or
+# the HTTP feed named by SMOLWAYS_FUEL_PRICE_URL, until set_price_provider().
+_provider = None
+
+def price_provider():
+    global _provider
+    if _provider is None:
+        url = os.environ.get(ENV_FUEL_PRICE_URL)
+        _provider = HTTPPriceProvider(url) if url else WPRFileProvider()
+    return _provider
+
+def set_price_provider(provider):
+    # Returns the provider it replaces; None restores the default.
+    global _provider
+    previous, _provider = _provider, provider
+    return previous
+
+def _iso_date(value):
+    if isinstance(value, (Date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+def _month(value):
+    # YYYYMM as an int, to compare with the WPR survey columns.
+    iso = _iso_date(value)
+    return int(iso[:4]) * 100 + int(iso[5:7])
@@ -0,0 +1,193 @@
+import contextlib
+import functools
+import itertools
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+ENV_TRACE = 'SMOLWAYS_TRACE'  # trace file; setting it turns tracing on
+ENV_TRACE_FORMAT = 'SMOLWAYS_TRACE_FORMAT'  # 'json' (default) or 'chrome'
+ENV_TRACE_MEMORY = 'SMOLWAYS_TRACE_MEMORY'  # set, and not 0, to track peak memory per stage
+ENV_PROFILE = 'SMOLWAYS_PROFILE'  # cProfile stats file
+FORMATS = ('json', 'chrome')
+
+# Per-stage timers, counters, peak memory and cProfile capture. Tracing is
+# off until enable() or configure(); until then stage() and count() do nothing.
+
+_tracer = None
+_NO_STAGE = contextlib.nullcontext()
+
+def stage(name, **args):
+    if _tracer is None:
+        return _NO_STAGE
+    return _tracer.stage(name, args)
+
+def count(name, amount=1):
+    if _tracer is not None:
+        _tracer.counters[name] = _tracer.counters.get(name, 0) + amount
+
+def instrumented(name):
+    # Times every call as stage `name`; for generators use instrumented_iter.
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with _tracer.stage(name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def instrumented_iter(name, iterable, batch=1 << 12):
+    # Times pulling items from `iterable`, `batch` at a time, as stage `name`.
+    if _tracer is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            items = list(itertools.islice(iterator, batch))
+        yield from items
+        if len(items) < batch:
+            return
+
+def enabled():
+    return _tracer is not None
+
+def enable(output=None, format='json', memory=False, profile=None):
+    # Starts a trace, replacing any running one.
+    global _tracer
+    if format not in FORMATS:
+        raise ValueError(f"unknown trace format '{format}', expected one of {', '.join(FORMATS)}")
+    if _tracer is not None:
+        disable()
+    _tracer = Tracer(output, format, memory, profile)
+    return _tracer
+
+def configure(output=None, format=None, memory=False, profile=None):
+    # Command-line options, falling back to the SMOLWAYS_* variables.
+    output = output or os.environ.get(ENV_TRACE) or None
+    format = format or os.environ.get(ENV_TRACE_FORMAT) or 'json'
+    memory = memory or os.environ.get(ENV_TRACE_MEMORY, '') not in ('', '0')
+    profile = profile or os.environ.get(ENV_PROFILE) or None
+    if output is None and profile is None:
+        return None
+    return enable(output, format, memory, profile)
+
+def disable():
+    # Stops tracing, writes the trace and profile, and returns the trace.
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer.finish() if tracer is not None else None
+
+class Tracer:
+    def __init__(self, output=None, format='json', memory=False, profile=None):
+        self.output = output
+        self.format = format
+        self.profile = profile
+        self.events = []
+        self.counters = {}
+        self.stack = []  # [name, start ns, peak bytes of finished children] per open stage
+        self.started = datetime.now(timezone.utc)
+        self.origin = time.perf_counter_ns()
+        # tracemalloc and cProfile are imported only when asked for
+        self.memory = memory
+        if memory:
+            import tracemalloc
+        self.owns_tracemalloc = memory and not tracemalloc.is_tracing()
+        if self.owns_tracemalloc:
+            tracemalloc.start()
+        self.profiler = None
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextlib.contextmanager
+    def stage(self, name, args):
+        if self.memory:
+            self._fold_peak()
+        frame = [name, time.perf_counter_ns(), 0]
+        self.stack.append(frame)
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            self.stack.pop()
+            event = {
+                'name': name,
+                'path': '/'.join([parent[0] for parent in self.stack] + [name]),
+                'start': (frame[1] - self.origin) / 1e9,
+                'seconds': (end - frame[1]) / 1e9,
+            }
+            if self.memory:
+                import tracemalloc
+                # tracemalloc keeps a single peak; fold it into the parent stage
+                peak = max(frame[2], tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+                if self.stack:
+                    self.stack[-1][2] = max(self.stack[-1][2], peak)
+                event['peak_bytes'] = peak
+            if resource is not None:
+                event['max_rss_bytes'] = _max_rss()
+            if args:
+                event['args'] = args
+            self.events.append(event)
+
+    def _fold_peak(self):
+        import tracemalloc
+        if self.stack:
+            self.stack[-1][2] = max(self.stack[-1][2], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    def finish(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.profile)
+        if self.owns_tracemalloc:
+            import tracemalloc
+            tracemalloc.stop()
+        trace = self.chrome_trace() if self.format == 'chrome' else self.trace()
+        if self.output:
+            with open(self.output, 'w') as file:
+                json.dump(trace, file, indent=2)
+        return trace
+
+    def trace(self):
+        # Stages in the order they finished, so children come before parents.
+        return {
+            'started': self.started.isoformat(timespec='milliseconds'),
+            'seconds': (time.perf_counter_ns() - self.origin) / 1e9,
+            'pid': os.getpid(),
+            'stages': self.events,
+            'counters': dict(self.counters),
+            'max_rss_bytes': _max_rss() if resource is not None else None,
+            'profile': self.profile,
+        }
+
+    def chrome_trace(self):
+        # Trace Event Format, for chrome://tracing and Perfetto.
+        pid = os.getpid()
+        events = []
+        for event in sorted(self.events, key=lambda event: event['start']):
+            args = {key: event[key] for key in ('peak_bytes', 'max_rss_bytes') if key in event}
+            args.update(event.get('args', {}))
+            events.append({'name': event['name'], 'ph': 'X', 'ts': event['start'] * 1e6,
+                           'dur': event['seconds'] * 1e6, 'pid': pid, 'tid': 0, 'args': args})
+        if self.counters:
+            end = (time.perf_counter_ns() - self.origin) / 1e3
+            events.append({'name': 'counters', 'ph': 'C', 'ts': end, 'pid': pid, 'tid': 0,
+                           'args': dict(self.counters)})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'started': self.started.isoformat(timespec='milliseconds')}}
+
+def _max_rss():
+    # ru_maxrss is kilobytes on Linux and bytes on macOS.
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if os.uname().sysname == 'Darwin' else usage * 1024
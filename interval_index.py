@@ -0,0 +1,145 @@
+import numpy as np
+from time_utils import MISSING_TIME, durations, parse_cutoff
+
+# Time-range queries over entries as [start, end) intervals. Bounds may be
+# ISO-8601 strings, datetimes or epoch milliseconds; None leaves a side open.
+
+class IntervalIndex:
+    # Entries sorted by start time, with the running maximum of their end times
+    # bounding the stretch a window query has to look at.
+    def __init__(self, start_times, end_times):
+        start_times = np.asarray(start_times)
+        end_times = np.asarray(end_times)
+        rows = np.flatnonzero((start_times != MISSING_TIME) & (end_times != MISSING_TIME))
+        self.rows = rows[np.argsort(start_times[rows], kind='stable')]
+        self.starts = start_times[self.rows]
+        self.ends = end_times[self.rows]
+        self.max_ends = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+        self.sorted_ends = np.sort(self.ends)
+
+    @classmethod
+    def from_timeline(cls, va):
+        return cls(va.start_time, va.end_time)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def overlapping(self, start=None, end=None):
+        # Rows of the entries that overlap [start, end), in start-time order.
+        start, end = _bounds(start, end)
+        stop = np.searchsorted(self.starts, end, 'left')
+        first = np.searchsorted(self.max_ends[:stop], start, 'right')
+        hits = self.ends[first:stop] > start
+        return self.rows[first:stop][hits]
+
+    def count_overlapping(self, start=None, end=None):
+        # Entries starting before the window ends, less those over before it begins.
+        start, end = _bounds(start, end)
+        if end <= start:
+            return 0
+        return int(np.searchsorted(self.starts, end, 'left') - np.searchsorted(self.sorted_ends, start, 'right'))
+
+    def containing(self, start=None, end=None):
+        # Rows of the entries that lie entirely within [start, end].
+        start, end = _bounds(start, end)
+        first = np.searchsorted(self.starts, start, 'left')
+        stop = np.searchsorted(self.starts, end, 'right')
+        hits = self.ends[first:stop] <= end
+        return self.rows[first:stop][hits]
+
+    def at(self, time):
+        # Rows of the entries in progress at `time`.
+        time, _ = _bounds(time, None)
+        return self.overlapping(time, time + 1)
+
+def segments_between(va, start=None, end=None, index=None):
+    # What the user was doing between `start` and `end`: the overlapping
+    # entries as a Timeline, in start-time order.
+    index = index or IntervalIndex.from_timeline(va)
+    return va.take(index.overlapping(start, end))
+
+def find_duplicates(va):
+    # True for every entry that repeats an earlier one exactly: same kind,
+    # start, end, activity type and place.
+    keys = np.stack([va.kind.astype(np.int64), va.start_time, va.end_time,
+                     va.top_candidate_type.astype(np.int64), va.place_id.astype(np.int64)])
+    order = np.lexsort(keys[::-1])
+    sorted_keys = keys[:, order]
+    repeated = np.zeros(len(va), dtype=bool)
+    if len(va) > 1:
+        repeated[order[1:]] = (sorted_keys[:, 1:] == sorted_keys[:, :-1]).all(axis=0)
+    return repeated
+
+def overlap_groups(va):
+    # Group id per entry: overlapping or copied entries with the same kind, level,
+    # type and place share one. Entries missing a time are left on their own.
+    n = len(va)
+    timed = (va.start_time != MISSING_TIME) & (va.end_time != MISSING_TIME)
+    groups = np.arange(n, dtype=np.int64)
+    rows = np.flatnonzero(timed)
+    if not len(rows):
+        return groups
+
+    key_columns = [va.kind[rows], va.hierarchy_level[rows], va.top_candidate_type[rows], va.place_id[rows]]
+    order = np.lexsort([va.end_time[rows], va.start_time[rows]] + key_columns[::-1])
+    rows = rows[order]
+    keys = np.stack([column[order].astype(np.int64) for column in key_columns])
+    new_key = np.ones(len(rows), dtype=bool)
+    new_key[1:] = (keys[:, 1:] != keys[:, :-1]).any(axis=0)
+
+    # Ranks stand in for the times so that a per-key offset keeps the running
+    # maximum of end times from carrying over from one key to the next.
+    _, ranks = np.unique(np.concatenate([va.start_time[rows], va.end_time[rows]]), return_inverse=True)
+    start_ranks, end_ranks = ranks[:len(rows)], ranks[len(rows):]
+    key_offset = (np.cumsum(new_key) - 1) * (2 * len(rows) + 1)
+    reach = np.maximum.accumulate(key_offset + np.maximum(end_ranks, start_ranks))
+    new_group = new_key.copy()
+    new_group[1:] |= key_offset[1:] + start_ranks[1:] >= reach[:-1]
+    # Zero-length copies overlap nothing but are still duplicates.
+    new_group[1:] &= ~((start_ranks[1:] == start_ranks[:-1]) & (end_ranks[1:] == end_ranks[:-1]) & ~new_key[1:])
+    first_row = rows[np.flatnonzero(new_group)]
+    groups[rows] = first_row[np.cumsum(new_group) - 1]
+    return groups
+
+def merge_overlapping(va):
+    # Keeps the most probable entry of each overlap group, stretched over the
+    # group's span. Returns the merged Timeline and the number removed.
+    groups = overlap_groups(va)
+    if not len(va):
+        return va, 0
+    order = np.lexsort([np.nan_to_num(va.probability, nan=-1.0), groups])
+    last = np.ones(len(va), dtype=bool)
+    last[:-1] = groups[order][1:] != groups[order][:-1]
+    keep = np.sort(order[last])
+
+    merged = va.take(keep)
+    timed = (merged.start_time != MISSING_TIME) & (merged.end_time != MISSING_TIME)
+    rows = np.flatnonzero((va.start_time != MISSING_TIME) & (va.end_time != MISSING_TIME))
+    if len(rows):
+        earliest = _first_of_groups(groups[rows], va.start_time[rows], rows)
+        latest = _first_of_groups(groups[rows], -va.end_time[rows], rows)
+        kept_groups = groups[keep][timed]
+        group_ids = np.unique(groups[rows])
+        earliest = earliest[np.searchsorted(group_ids, kept_groups)]
+        latest = latest[np.searchsorted(group_ids, kept_groups)]
+        start_time, start_offset = merged.start_time.copy(), merged.start_offset.copy()
+        end_time, end_offset = merged.end_time.copy(), merged.end_offset.copy()
+        start_time[timed], start_offset[timed] = va.start_time[earliest], va.start_offset[earliest]
+        end_time[timed], end_offset[timed] = va.end_time[latest], va.end_offset[latest]
+        merged.columns.update({'start_time': start_time, 'start_offset': start_offset,
+                               'end_time': end_time, 'end_offset': end_offset})
+    if 'duration' in merged.columns:
+        merged.columns['duration'] = durations(merged.start_time, merged.end_time)
+    return merged, len(va) - len(keep)
+
+def _first_of_groups(groups, values, rows):
+    # For each group id in ascending order, the row with the smallest value.
+    order = np.lexsort([values, groups])
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = groups[order][1:] != groups[order][:-1]
+    return rows[order[first]]
+
+def _bounds(start, end):
+    start = parse_cutoff(start)
+    end = np.iinfo(np.int64).max if end is None else parse_cutoff(end)
+    return start, end
@@ -0,0 +1,8 @@
+def jsonable(value):
+    # json.dumps default for NumPy scalars and arrays, datetimes, and the np.nan
+    # Timeline.row uses for missing fields.
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
@@ -1,56 +1,214 @@
+import argparse
 import json
-from data_processing import load_json_data, process_data, add_duration_to_va
-from car_cost_calculator import determine_car_payment, determine_fees_insurance
-from emissions_calculator import calculate_emissions_and_costs
-from analysis import analyze_activity_sequences, filter_passenger_vehicle_entries
-from time_utils import find_min_max_dates
+import instrumentation
+from json_utils import jsonable
+
+# Commands import what they need when run, so financing starts without NumPy.
+
+# Defaults for every parameter; --config files override these, and flags the file.
+DEFAULTS = {
+    'file': 'data/location-history.json',
+    'vehicle_mpg': 24.4,
+    'vehicle_kerb_w': 3500,
+    'miles_driven_correction': 1.0,
+    'model_year': 2017,
+    'used_flag': False,
+    'car_paid_off': True,
+    'purchase_price': 23500,
+    'years_owned': 7,
+    'interest_rate': 0.00,
+    'financed': True,
+    'loan_term': 5,
+    'purchase_year': 2017,
+    'payment_provided': 325,
+    'has_monthly_payment': False,
+    'insurance_monthly': 182,
+    'insurance_type': 'max',
+    'people_split': 2,
+    'registration_fee': None,
+}
+TIMELINE_OPTIONS = ('cutoff', 'cache_dir')  # passed to load_timeline only when given
+
+def _flag(value):
+    lowered = value.strip().lower()
+    if lowered in ('true', 'yes', '1'):
+        return True
+    if lowered in ('false', 'no', '0'):
+        return False
+    raise argparse.ArgumentTypeError(f"expected true or false, got '{value}'")
+
+def _optional(convert):
+    def parse(value):
+        return None if value.strip().lower() in ('none', 'null', '') else convert(value)
+    parse.__name__ = convert.__name__
+    return parse
+
+def _cutoff(value):
+    # 'none' reads the whole export.
+    if value.strip().lower() in ('none', 'null', ''):
+        return None
+    from time_utils import parse_timestamps
+    try:
+        parse_timestamps([value])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an ISO-8601 time or none, got '{value}'")
+    return value
+
+def _correction(value):
+    return 'auto' if value.strip().lower() == 'auto' else float(value)
+
+VEHICLE_OPTIONS = {
+    'vehicle_mpg': (float, "miles per gallon"),
+    'vehicle_kerb_w': (float, "kerb weight in pounds"),
+    'miles_driven_correction': (_correction, "factor on reported distances, or 'auto' to derive it from timelinePaths"),
+}
+CAR_OPTIONS = {
+    'model_year': (_optional(int), None),
+    'used_flag': (_flag, None),
+    'car_paid_off': (_flag, None),
+    'purchase_price': (_optional(float), None),
+    'years_owned': (int, None),
+    'interest_rate': (float, "annual rate, e.g. 0.05"),
+    'financed': (_flag, None),
+    'loan_term': (int, "years"),
+    'purchase_year': (_optional(int), None),
+    'payment_provided': (_optional(float), "monthly payment, or none"),
+    'has_monthly_payment': (_flag, None),
+}
+INSURANCE_OPTIONS = {
+    'insurance_monthly': (_optional(float), "dollars per month, or none for the state average"),
+    'insurance_type': (str, "min or max coverage"),
+    'people_split': (int, "people sharing the insurance"),
+    'registration_fee': (_optional(float), "dollars per year, or none for the default"),
+}
+
+def main(params=DEFAULTS):
+    from data_processing import add_duration_to_va
+    from aggregation import aggregate
+    from car_cost_calculator import determine_car_payment, determine_fees_insurance
+    from emissions_calculator import summarize_emissions_and_costs
+    from report import report_reducers, total_costs_between
 
-def main():
     # Load and process data
-    data = load_json_data("data/location-history.json")
-    va, timelinePaths = process_data(data)
+    va, timelinePaths = _load(params)
+    print_timeline_summary(va, timelinePaths)
     va = add_duration_to_va(va)
-    passenger_va = filter_passenger_vehicle_entries(va)
+
+    # One pass over the timeline collects everything the report needs
+    aggregates = aggregate([va], report_reducers())
+    min_date, max_date = aggregates['date_span']
 
     # Analyze activity sequences
-    sequence_analysis = analyze_activity_sequences(va)
+    sequence_analysis = aggregates['sequences']
     # print("\nActivity Sequence Analysis:")
     # for key, value in sequence_analysis.items():
     #     print(f"  {key.replace('_', ' ').title()}: {value}")
 
     # Calculate emissions and costs
-    emissions_costs = calculate_emissions_and_costs(va, vehicle_mpg=24.4, vehicle_kerb_w=3500)
+    emissions_costs = summarize_emissions_and_costs(aggregates['passenger_meters'], min_date, max_date,
+                                                    fuel_price=aggregates['fuel_price'],
+                                                    **_vehicle_params(params, va, timelinePaths))
     print_emissions_costs(emissions_costs)
 
     # Car payment calculation
-    car_params = {
-    'model_year': 2017,
-    'used_flag': False,
-    'car_paid_off': True,
-    'purchase_price': 23500,
-    'years_owned': 7,
-    'interest_rate': 0.00,
-    'financed': True,
-    'loan_term': 5,  # Adding loan term (in years)
-    'purchase_year': 2017,  # Adding purchase year
-    'payment_provided': 325,  # Adding payment_provided (set to None if not provided)
-    'has_monthly_payment': False  # Adding has_monthly_payment flag
-    }
-
+    car_params = {key: params[key] for key in CAR_OPTIONS}
     total_cost, monthly_payment, monthly_amortized_cost = determine_car_payment(**car_params)
 
     # Print car payment details
     print_car_payment_details(car_params, total_cost, monthly_payment, monthly_amortized_cost)
 
     # Calculate insurance costs
-    insurance_cost = determine_fees_insurance(
-        insurance_monthly=182,
-        insurance_type='max',
-        people_split=2
-    )
+    insurance_cost = determine_fees_insurance(**{key: params[key] for key in INSURANCE_OPTIONS})
 
     # Calculate total costs
-    calculate_total_costs(emissions_costs, monthly_amortized_cost, va, car_params['years_owned'], insurance_cost)
+    total_costs = total_costs_between(emissions_costs, monthly_amortized_cost, min_date, max_date,
+                                      car_params['years_owned'], insurance_cost)
+    print_total_costs(total_costs)
+
+def report_json(params):
+    from report import build_report
+
+    va, timelinePaths = _load(params)
+    print_json(build_report(va, params, timelinePaths=timelinePaths))
+
+def ingest(params):
+    # Parses the export into the timeline cache, or brings it up to date.
+    va, timelinePaths = _load(params)
+    print_timeline_summary(va, timelinePaths)
+
+def emissions(params, as_json=False):
+    from aggregation import aggregate, PassengerDistance, FuelPrice, DateSpan
+    from emissions_calculator import summarize_emissions_and_costs
+
+    va, timelinePaths = _load(params)
+    aggregates = aggregate([va], {'passenger_meters': PassengerDistance(), 'fuel_price': FuelPrice(),
+                                  'date_span': DateSpan()})
+    min_date, max_date = aggregates['date_span']
+    emissions_costs = summarize_emissions_and_costs(aggregates['passenger_meters'], min_date, max_date,
+                                                    fuel_price=aggregates['fuel_price'],
+                                                    **_vehicle_params(params, va, timelinePaths))
+    if as_json:
+        print_json(emissions_costs)
+    else:
+        print_emissions_costs(emissions_costs)
+
+def financing(params, as_json=False):
+    from car_cost_calculator import determine_car_payment, determine_fees_insurance
+
+    car_params = {key: params[key] for key in CAR_OPTIONS}
+    total_cost, monthly_payment, monthly_amortized_cost = determine_car_payment(**car_params)
+    insurance_cost = determine_fees_insurance(**{key: params[key] for key in INSURANCE_OPTIONS})
+    if as_json:
+        print_json({'total_cost': total_cost, 'monthly_payment': monthly_payment,
+                    'monthly_amortized_cost': monthly_amortized_cost, **insurance_cost})
+    else:
+        print_car_payment_details(car_params, total_cost, monthly_payment, monthly_amortized_cost)
+        print(f"  Annual Insurance Cost: ${insurance_cost['annual_insurance_cost']:,.2f}")
+        print(f"  Registration Fee: ${insurance_cost['registration_fee']:,.2f}")
+
+QUERIES = ('places', 'routes', 'place', 'segments')
+
+def query(params, what, place_id=None, top=10, by=None, start=None, end=None):
+    # Top places or routes, one place, or the entries in [start, end), as JSON.
+    va, timelinePaths = _load(params)
+    if what == 'segments':
+        from interval_index import segments_between
+        entries = segments_between(va, start, end)
+        print_json([entries.row(i) for i in range(len(entries))])
+        return
+
+    from aggregation import aggregate
+    from places import PlaceIndex
+    vehicle_params = _vehicle_params(params, va, timelinePaths)
+    index = PlaceIndex(vehicle_mpg=vehicle_params['vehicle_mpg'],
+                       miles_driven_correction=vehicle_params['miles_driven_correction'])
+    aggregate([va], {'places': index})
+    if what == 'places':
+        print_json(index.top_places(top, by or 'visits'))
+    elif what == 'routes':
+        print_json(index.top_routes(top, by or 'trips'))
+    else:
+        print_json({'place': index.place(place_id), 'trips_to': index.trips_to(place_id),
+                    'trips_from': index.trips_from(place_id)})
+
+def _load(params):
+    from timeline_cache import load_timeline
+    return load_timeline(params['file'], **{key: params[key] for key in TIMELINE_OPTIONS if key in params})
+
+def _vehicle_params(params, va, timelinePaths):
+    vehicle_params = {key: params[key] for key in VEHICLE_OPTIONS}
+    if vehicle_params['miles_driven_correction'] == 'auto':
+        from tracks import derive_miles_correction
+        vehicle_params['miles_driven_correction'] = derive_miles_correction(va, timelinePaths) or 1.0
+    return vehicle_params
+
+def print_json(value):
+    print(json.dumps(value, indent=2, default=jsonable))
+
+def print_timeline_summary(va, timelinePaths):
+    print("\nAnalyzed Google Timeline Data")
+    print("  Total Events:", len(va))
+    print("  Total timelinePaths:", len(timelinePaths))
 
 def print_emissions_costs(emissions_costs):
     print("\nEmissions and Costs Data:")
@@ -78,28 +236,99 @@ def print_car_payment_details(params, total_cost, monthly_payment, monthly_amort
     if params['car_paid_off']:
         print(f"\nNote: This car is paid off. The monthly payment shown is the equivalent cost spread over the ownership period.")
 
-def calculate_total_costs(costs, monthly_amortized_cost, va, years_owned, insurance_cost):
-    min_date, max_date = find_min_max_dates(va)
-    days_used = (max_date - min_date).days
-    miles_driven = costs["miles_driven"]
-    
-    annual_miles_driven = miles_driven / (days_used / 365.0)
-    annual_wear_cost = costs["wear_cost"] / (days_used / 365.0)
-    
-    wear_cost_mile = annual_wear_cost / annual_miles_driven
-    ownership_cost_mile = (monthly_amortized_cost * 12 * years_owned) / (annual_miles_driven * years_owned)
-    
-    annual_insurance_cost = insurance_cost['annual_insurance_cost']
-    registration_fee = insurance_cost['registration_fee']
-    fees_cost_mile = (annual_insurance_cost + registration_fee) / annual_miles_driven
-    
-    per_mile_cost = wear_cost_mile + ownership_cost_mile + fees_cost_mile
-    
+def print_total_costs(total_costs):
     print(f"\nTotal Costs:")
-    print(f"  Days Used: {days_used}")
-    print(f"  Annual Miles Driven: {annual_miles_driven:.2f}")
-    print(f"  Annual Wear Cost: ${annual_wear_cost:.2f}")
-    print(f"  Per Mile Cost: ${per_mile_cost:.2f}")
+    print(f"  Days Used: {total_costs['days_used']}")
+    print(f"  Annual Miles Driven: {total_costs['annual_miles_driven']:.2f}")
+    print(f"  Annual Wear Cost: ${total_costs['annual_wear_cost']:.2f}")
+    print(f"  Per Mile Cost: ${total_costs['per_mile_cost']:.2f}")
+
+def load_config(filename):
+    # A JSON object of parameters, e.g. {"vehicle_mpg": 30, "loan_term": 6}.
+    with open(filename, 'r') as file:
+        config = json.load(file)
+    if not isinstance(config, dict):
+        raise ValueError(f"'{filename}' must hold a JSON object of parameters")
+    unknown = set(config) - set(DEFAULTS) - set(TIMELINE_OPTIONS)
+    if unknown:
+        raise ValueError(f"unknown parameters in '{filename}': {', '.join(sorted(unknown))}")
+    return config
+
+def build_parser():
+    # Parameter flags default to SUPPRESS, so only the ones given override the config file.
+    def options(*tables, timeline=True, as_json=True):
+        common = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+        common.add_argument('--config', help="JSON file of parameters")
+        if timeline:
+            common.add_argument('--file', help=f"timeline export (default {DEFAULTS['file']})")
+            common.add_argument('--cutoff', type=_cutoff,
+                                help="ignore segments starting before this ISO-8601 time, or none")
+            common.add_argument('--cache-dir', help="where processed timelines are cached")
+        if as_json:
+            common.add_argument('--json', action='store_true', help="print the results as JSON")
+        for table in tables:
+            for name, (convert, help) in table.items():
+                common.add_argument('--' + name.replace('_', '-'), type=convert, help=help)
+        return [common]
+
+    # report is the default command, so its flags also work without one.
+    report_options = options(VEHICLE_OPTIONS, CAR_OPTIONS, INSURANCE_OPTIONS)
+    parser = argparse.ArgumentParser(description="Cost and emissions of driving, from a Google Timeline export.",
+                                     parents=report_options)
+    parser.add_argument('--trace', help=f"write a per-stage trace to this file (or set {instrumentation.ENV_TRACE})")
+    parser.add_argument('--trace-format', choices=instrumentation.FORMATS, help="json (default) or chrome")
+    parser.add_argument('--trace-memory', action='store_true', help="track peak memory per stage")
+    parser.add_argument('--profile', help="write cProfile stats to this file")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    commands.add_parser('ingest', parents=options(as_json=False), help="parse an export into the timeline cache")
+    commands.add_parser('report', parents=report_options,
+                        help="the full cost and emissions report (the default)")
+    commands.add_parser('emissions', parents=options(VEHICLE_OPTIONS), help="miles, fuel, CO2 and wear cost")
+    commands.add_parser('financing', parents=options(CAR_OPTIONS, INSURANCE_OPTIONS, timeline=False),
+                        help="car payment and insurance, without reading a timeline")
+    query_parser = commands.add_parser('query', parents=options(VEHICLE_OPTIONS, as_json=False),
+                                       help="places, routes and time ranges in the timeline")
+    query_parser.add_argument('what', choices=QUERIES)
+    query_parser.add_argument('place_id', nargs='?', help="for 'place'")
+    query_parser.add_argument('--top', type=int, default=10)
+    query_parser.add_argument('--by', help="places: visits or dwell; routes: trips, meters or cost")
+    query_parser.add_argument('--start', help="for 'segments', ISO-8601")
+    query_parser.add_argument('--end', help="for 'segments', ISO-8601")
+    return parser
+
+def run(argv=None):
+    parser = build_parser()
+    args = vars(parser.parse_args(argv))
+    command = args.pop('command') or 'report'
+    params = dict(DEFAULTS)
+    if args.get('config'):
+        try:
+            params.update(load_config(args['config']))
+        except (OSError, ValueError) as error:
+            parser.error(str(error))
+    params.update({key: args.pop(key) for key in set(DEFAULTS) | set(TIMELINE_OPTIONS) if key in args})
+    if command == 'query' and args['what'] == 'place' and not args.get('place_id'):
+        parser.error("query place needs a PLACE_ID")
+
+    instrumentation.configure(args['trace'], args['trace_format'], args['trace_memory'], args['profile'])
+    try:
+        with instrumentation.stage(command):
+            if command == 'ingest':
+                ingest(params)
+            elif command == 'report':
+                if args.get('json'):
+                    report_json(params)
+                else:
+                    main(params)
+            elif command == 'emissions':
+                emissions(params, args.get('json', False))
+            elif command == 'financing':
+                financing(params, args.get('json', False))
+            else:
+                query(params, args['what'], args['place_id'], args['top'], args['by'], args['start'], args['end'])
+    finally:
+        instrumentation.disable()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    run()
@@ -0,0 +1,110 @@
+import numpy as np
+from car_cost_calculator import determine_car_payment, determine_fees_insurance
+from emissions_calculator import (DEFAULT_STATE, average_fuel_price, calculate_emissions, determine_wear_costs,
+                                  summarize_emissions_and_costs, trip_fuel_prices)
+from report import split_params, total_costs_between
+from time_utils import find_min_max_dates
+
+# Replacement modes with assumed per-mile costs (dollars) and CO2 (kg per
+# passenger-mile); override by passing a dict of the same shape.
+MODES = {
+    'walking': {'cost_per_mile': 0.0, 'CO2_kg_per_mile': 0.0},
+    'cycling': {'cost_per_mile': 0.05, 'CO2_kg_per_mile': 0.0},
+    'transit': {'cost_per_mile': 0.30, 'CO2_kg_per_mile': 0.10},
+}
+
+class ModeShift:
+    # What if short drives were taken in another mode. Trips are sorted by
+    # distance with prefix sums, so any distance range is two binary searches.
+    def __init__(self, trip_meters, trip_fuel_prices, min_date, max_date, monthly_amortized_cost, insurance_cost,
+                 years_owned=5, vehicle_mpg=24.4, vehicle_kerb_w=3500, miles_driven_correction=1.0):
+        order = np.argsort(trip_meters, kind='stable')
+        self.meters = np.asarray(trip_meters, dtype=np.float64)[order]
+        prices = np.asarray(trip_fuel_prices, dtype=np.float64)[order]
+        self.cumulative_meters = np.concatenate([[0.0], np.cumsum(self.meters)])
+        self.cumulative_cost_meters = np.concatenate([[0.0], np.cumsum(self.meters * prices)])
+        self.min_date, self.max_date = min_date, max_date
+        self.monthly_amortized_cost = monthly_amortized_cost
+        self.insurance_cost = insurance_cost
+        self.years_owned = years_owned
+        self.vehicle_mpg = vehicle_mpg
+        self.vehicle_kerb_w = vehicle_kerb_w
+        self.miles_driven_correction = miles_driven_correction
+
+    @classmethod
+    def from_timeline(cls, va, params=None, activity_type='IN_PASSENGER_VEHICLE'):
+        # `params` as for build_report.
+        vehicle_params, car_params, insurance_params = split_params(params or {})
+        rows = va.where('top_candidate_type', activity_type)
+        min_date, max_date = find_min_max_dates(va)
+        _, _, monthly_amortized_cost = determine_car_payment(**car_params)
+        return cls(va.distance[rows], trip_fuel_prices(va.start_lat[rows], va.start_lng[rows]), min_date, max_date,
+                   monthly_amortized_cost, determine_fees_insurance(**insurance_params),
+                   car_params.get('years_owned', 5), **vehicle_params)
+
+    def __len__(self):
+        return len(self.meters)
+
+    def _range(self, min_km, max_km):
+        # Positions bounding the trips with min_km <= distance < max_km.
+        lower = np.searchsorted(self.meters, np.asarray(min_km, dtype=np.float64) * 1000, 'left')
+        upper = np.searchsorted(self.meters, np.asarray(max_km, dtype=np.float64) * 1000, 'left')
+        return lower, np.maximum(upper, lower)
+
+    def _miles(self, meters):
+        return meters / 1000 / 1.6 * self.miles_driven_correction
+
+    def query(self, max_km, mode='cycling', min_km=0.0, modes=MODES):
+        # Report figures for the driving left after trips in [min_km, max_km) go by `mode`.
+        lower, upper = self._range(min_km, max_km)
+        replaced_meters = self.cumulative_meters[upper] - self.cumulative_meters[lower]
+        replaced_cost_meters = self.cumulative_cost_meters[upper] - self.cumulative_cost_meters[lower]
+        remaining_meters = self.cumulative_meters[-1] - replaced_meters
+        remaining_cost_meters = self.cumulative_cost_meters[-1] - replaced_cost_meters
+        fuel_price = average_fuel_price(remaining_cost_meters, remaining_meters)
+
+        emissions_costs = summarize_emissions_and_costs(float(remaining_meters), self.min_date, self.max_date,
+                                                        self.vehicle_mpg, self.vehicle_kerb_w,
+                                                        self.miles_driven_correction, fuel_price)
+        result = {
+            'trips_replaced': int(upper - lower),
+            'miles_replaced': float(self._miles(replaced_meters)),
+            'mode': mode,
+            'mode_cost': float(self._miles(replaced_meters) * modes[mode]['cost_per_mile']),
+            'mode_CO2_kgs_released': float(self._miles(replaced_meters) * modes[mode]['CO2_kg_per_mile']),
+        }
+        result.update(emissions_costs)
+        if emissions_costs['miles_driven']:
+            result.update(total_costs_between(emissions_costs, self.monthly_amortized_cost, self.min_date,
+                                              self.max_date, self.years_owned, self.insurance_cost))
+        return result
+
+    def curve(self, max_kms, mode='cycling', min_km=0.0, modes=MODES):
+        # query() over an array of thresholds, unrounded.
+        lower, upper = self._range(min_km, max_kms)
+        replaced_meters = self.cumulative_meters[upper] - self.cumulative_meters[lower]
+        replaced_cost_meters = self.cumulative_cost_meters[upper] - self.cumulative_cost_meters[lower]
+        remaining_meters = self.cumulative_meters[-1] - replaced_meters
+        remaining_cost_meters = self.cumulative_cost_meters[-1] - replaced_cost_meters
+        miles = self._miles(remaining_meters)
+        replaced_miles = self._miles(replaced_meters)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fuel_price = average_fuel_price(remaining_cost_meters, remaining_meters)
+            _, CO2kgs, _ = calculate_emissions(miles, self.vehicle_mpg)
+            wear_cost = determine_wear_costs(miles, self.vehicle_mpg, DEFAULT_STATE, fuel_price)
+            years = (self.max_date - self.min_date).days / 365.0
+            annual_fixed = (self.monthly_amortized_cost * 12 + self.insurance_cost['annual_insurance_cost'] +
+                            self.insurance_cost['registration_fee'])
+            per_mile_cost = np.where(miles > 0, (wear_cost / years + annual_fixed) / (miles / years), np.nan)
+        return {
+            'max_km': np.asarray(max_kms, dtype=np.float64),
+            'trips_replaced': upper - lower,
+            'miles_replaced': replaced_miles,
+            'miles_driven': miles,
+            'CO2_kgs_released': CO2kgs,
+            'wear_cost': wear_cost,
+            'mode_cost': replaced_miles * modes[mode]['cost_per_mile'],
+            'mode_CO2_kgs_released': replaced_miles * modes[mode]['CO2_kg_per_mile'],
+            'per_mile_cost': per_mile_cost,
+        }
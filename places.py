@@ -0,0 +1,194 @@
+import heapq
+from array import array
+import numpy as np
+from emissions_calculator import average_fuel_price, determine_wear_costs, trip_fuel_prices
+from time_utils import MISSING_TIME, to_datetime
+from timeline import VISIT
+
+class PlaceIndex:
+    # Reducer indexing visits by placeId and passenger-vehicle trips by the
+    # top-level visits they run between, with totals per origin and destination.
+    def __init__(self, activity_type='IN_PASSENGER_VEHICLE', vehicle_mpg=24.4, miles_driven_correction=1.0):
+        self.activity_type = activity_type
+        self.vehicle_mpg = vehicle_mpg
+        self.miles_driven_correction = miles_driven_correction
+        self.places = {}  # placeId -> [visits, dwell ms, (first start, offset), (last end, offset), semantic type, lat, lng]
+        self.visit_times = {}  # placeId -> (start times, end times)
+        self.routes = {}  # (origin, destination) -> [trips, meters, price-weighted meters]
+        self.inbound = {}  # destination -> same
+        self.outbound = {}  # origin -> same
+        self.origin = None  # place of the last top-level visit seen
+        self.pending = [0, 0.0, 0.0]  # trips since that visit, waiting for the next one
+
+    def update(self, chunk):
+        visits = chunk.kind == VISIT
+        self._index_visits(chunk, np.flatnonzero(visits & (chunk.place_id >= 0) & (chunk.start_time != MISSING_TIME) &
+                                                 (chunk.end_time != MISSING_TIME)))
+        self._index_trips(chunk, visits & (chunk.hierarchy_level <= 0))
+
+    def result(self):
+        # The index itself, so the queries below run on the aggregate.
+        return self
+
+    def _index_visits(self, chunk, rows):
+        # Visits missing a time have no dwell and are left out.
+        if not len(rows):
+            return
+        codes, starts, ends = chunk.place_id[rows], chunk.start_time[rows], chunk.end_time[rows]
+        by_start = rows[np.lexsort((starts, codes))]
+        by_end = rows[np.lexsort((ends, codes))]
+        keys, group_start, counts = np.unique(chunk.place_id[by_start], return_index=True, return_counts=True)
+        dwell = np.add.reduceat(chunk.end_time[by_start] - chunk.start_time[by_start], group_start)
+        first, last = by_start[group_start], by_end[group_start + counts - 1]
+        for key, start, count, place_dwell, i, j in zip(keys.tolist(), group_start.tolist(), counts.tolist(),
+                                                        dwell.tolist(), first.tolist(), last.tolist()):
+            place_id = chunk.categories['place_id'][key]
+            group = by_start[start:start + count]
+            first_seen = (int(chunk.start_time[i]), int(chunk.start_offset[i]))
+            last_seen = (int(chunk.end_time[j]), int(chunk.end_offset[j]))
+            place = self.places.get(place_id)
+            if place is None:
+                place = self.places[place_id] = [0, 0, first_seen, last_seen, None, None, None]
+                self.visit_times[place_id] = (array('q'), array('q'))
+            place[0] += count
+            place[1] += place_dwell
+            place[2] = min(place[2], first_seen)
+            place[3] = max(place[3], last_seen)
+            semantic_type = chunk.semantic_type[group[-1]]
+            if semantic_type >= 0:
+                place[4] = chunk.categories['semantic_type'][semantic_type]
+            if not np.isnan(chunk.place_lat[group[-1]]):
+                place[5], place[6] = float(chunk.place_lat[group[-1]]), float(chunk.place_lng[group[-1]])
+            visit_starts, visit_ends = self.visit_times[place_id]
+            visit_starts.frombytes(chunk.start_time[group].tobytes())
+            visit_ends.frombytes(chunk.end_time[group].tobytes())
+
+    def _index_trips(self, chunk, visits):
+        # Trips after the chunk's last visit wait in `pending` for the next chunk.
+        trips = chunk.where('top_candidate_type', self.activity_type)
+        if not visits.any():
+            self._add_pending(trips, chunk)
+            return
+        positions = np.arange(len(chunk))
+        previous = np.maximum.accumulate(np.where(visits, positions, -1))
+        following = np.minimum.accumulate(np.where(visits, positions, len(chunk))[::-1])[::-1]
+        labels = np.array(chunk.categories['place_id'] + [None], dtype=object)
+        visit_rows = np.flatnonzero(visits)
+
+        first_visit = labels[chunk.place_id[visit_rows[0]]]
+        self._add_route(self.origin, first_visit, self.pending)
+        self.pending = [0, 0.0, 0.0]
+
+        closed = trips & (previous >= 0) & (following < len(chunk))
+        rows = np.flatnonzero(closed)
+        if len(rows):
+            meters = np.nan_to_num(chunk.distance[rows])
+            prices = trip_fuel_prices(chunk.start_lat[rows], chunk.start_lng[rows])
+            pairs = np.stack([chunk.place_id[previous[rows]], chunk.place_id[following[rows]]], axis=1)
+            pairs, index = np.unique(pairs, axis=0, return_inverse=True)
+            index = index.reshape(-1)
+            counts = np.bincount(index, minlength=len(pairs))
+            route_meters = np.bincount(index, weights=meters, minlength=len(pairs))
+            cost_meters = np.bincount(index, weights=meters * prices, minlength=len(pairs))
+            for (origin, destination), count, pair_meters, pair_cost_meters in zip(
+                    pairs.tolist(), counts.tolist(), route_meters.tolist(), cost_meters.tolist()):
+                self._add_route(labels[origin], labels[destination], (count, pair_meters, pair_cost_meters))
+
+        # Trips before the chunk's first visit went with `pending` above.
+        before = trips & (previous < 0)
+        before_rows = np.flatnonzero(before)
+        if len(before_rows):
+            meters = np.nan_to_num(chunk.distance[before_rows])
+            prices = trip_fuel_prices(chunk.start_lat[before_rows], chunk.start_lng[before_rows])
+            self._add_route(self.origin, first_visit, (len(before_rows), float(meters.sum()),
+                                                       float((meters * prices).sum())))
+        self.origin = labels[chunk.place_id[visit_rows[-1]]]
+        self._add_pending(trips & (following >= len(chunk)), chunk)
+
+    def _add_pending(self, rows, chunk):
+        rows = np.flatnonzero(rows)
+        if not len(rows):
+            return
+        meters = np.nan_to_num(chunk.distance[rows])
+        prices = trip_fuel_prices(chunk.start_lat[rows], chunk.start_lng[rows])
+        self.pending[0] += len(rows)
+        self.pending[1] += float(meters.sum())
+        self.pending[2] += float((meters * prices).sum())
+
+    def _add_route(self, origin, destination, totals):
+        # Trips from or to a visit without a placeId are not counted.
+        if origin is None or destination is None or not totals[0]:
+            return
+        for table, key in ((self.routes, (origin, destination)), (self.inbound, destination),
+                           (self.outbound, origin)):
+            entry = table.setdefault(key, [0, 0.0, 0.0])
+            entry[0] += totals[0]
+            entry[1] += totals[1]
+            entry[2] += totals[2]
+
+    def place(self, place_id):
+        # Visit count, dwell, first and last seen for one place, or None.
+        place = self.places.get(place_id)
+        if place is None:
+            return None
+        visits, dwell, first_seen, last_seen, semantic_type, lat, lng = place
+        return {
+            'placeId': place_id,
+            'semanticType': semantic_type,
+            'placeLatLng': (lat, lng) if lat is not None else None,
+            'visits': visits,
+            'dwell_hours': dwell / 3600000,
+            'first_seen': to_datetime(*first_seen),
+            'last_seen': to_datetime(*last_seen),
+        }
+
+    def visits(self, place_id):
+        # Start and end times (epoch milliseconds) of every visit to a place.
+        starts, ends = self.visit_times.get(place_id, (array('q'), array('q')))
+        return np.frombuffer(starts, dtype=np.int64).copy(), np.frombuffer(ends, dtype=np.int64).copy()
+
+    def top_places(self, n=10, by='visits'):
+        column = {'visits': 0, 'dwell': 1}[by]
+        return [self.place(place_id) for place_id in
+                heapq.nlargest(n, self.places, key=lambda place_id: self.places[place_id][column])]
+
+    def route(self, origin, destination):
+        return self._figures(self.routes.get((origin, destination)), origin=origin, destination=destination)
+
+    def trips_to(self, place_id):
+        return self._figures(self.inbound.get(place_id), destination=place_id)
+
+    def trips_from(self, place_id):
+        return self._figures(self.outbound.get(place_id), origin=place_id)
+
+    def top_routes(self, n=10, by='trips'):
+        # Busiest routes (commutes) by trip count, distance or cost.
+        column = {'trips': 0, 'meters': 1, 'cost': 2}[by]
+        pairs = heapq.nlargest(n, self.routes, key=lambda pair: self.routes[pair][column])
+        return [self.route(origin, destination) for origin, destination in pairs]
+
+    def _figures(self, totals, **keys):
+        trips, meters, cost_meters = totals or (0, 0.0, 0.0)
+        miles = meters / 1000 / 1.6 * self.miles_driven_correction
+        fuel_price = average_fuel_price(cost_meters, meters)
+        figures = dict(keys)
+        figures.update({
+            'trips': trips,
+            'miles': miles,
+            'cost': determine_wear_costs(miles, self.vehicle_mpg, None, fuel_price) if meters else 0.0,
+        })
+        return figures
+
+    def matrix(self):
+        # The route matrix in coordinate form, indexing into `place_ids`.
+        place_ids = sorted(set(self.places) | {place_id for pair in self.routes for place_id in pair})
+        position = {place_id: i for i, place_id in enumerate(place_ids)}
+        pairs = sorted(self.routes, key=lambda pair: (position[pair[0]], position[pair[1]]))
+        return {
+            'place_ids': place_ids,
+            'origin': np.array([position[origin] for origin, _ in pairs], dtype=np.int32),
+            'destination': np.array([position[destination] for _, destination in pairs], dtype=np.int32),
+            'trips': np.array([self.routes[pair][0] for pair in pairs], dtype=np.int64),
+            'meters': np.array([self.routes[pair][1] for pair in pairs], dtype=np.float64),
+            'cost_meters': np.array([self.routes[pair][2] for pair in pairs], dtype=np.float64),
+        }
@@ -0,0 +1,111 @@
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+
+DATA_DIR = 'data'
+GAS_PRICES_FILE = 'WPR_Gas Price by State 2024.csv'
+USED_CAR_PRICES_FILE = 'WPR_Used Car Prices by State 2024.csv'
+# Optional Census state boundaries as GeoJSON; without them trips are priced
+# in emissions_calculator.DEFAULT_STATE.
+STATE_BOUNDARIES_FILE = 'us_states.geojson'
+
+# Reference tables from data/, each read once per process on first use.
+_tables = {}
+
+def preload():
+    inflation_rates()
+    price_index()
+    gas_prices()
+    used_car_prices()
+    state_index()
+
+def clear():
+    _tables.clear()
+
+def _cached(name, loader):
+    if name not in _tables:
+        _tables[name] = loader()
+    return _tables[name]
+
+def inflation_rates():
+    return _cached('inflation_rates', load_inflation_data)
+
+def price_index():
+    return _cached('price_index', lambda: build_price_index(inflation_rates()))
+
+def gas_prices():
+    return _cached('gas_prices', lambda: load_state_table(GAS_PRICES_FILE))
+
+def used_car_prices():
+    return _cached('used_car_prices', lambda: load_state_table(USED_CAR_PRICES_FILE))
+
+def state_index():
+    return _cached('state_index', load_state_index)
+
+def load_inflation_data():
+    inflation_data = {}
+    csv_path = os.path.join(DATA_DIR, 'inflation_rate_year.csv')
+
+    try:
+        with open(csv_path, 'r') as file:
+            csv_reader = csv.reader(file)
+            next(csv_reader)  # Skip header
+            for row in csv_reader:
+                inflation_data[int(row[0])] = float(row[1])
+        return inflation_data
+    except FileNotFoundError:
+        print(f"Error: The file 'inflation_rate_year.csv' was not found in the 'data' directory.")
+    except ValueError:
+        print("Error: Invalid data in the CSV file.")
+    return None
+
+def build_price_index(inflation_data, last_year=None):
+    # Cumulative price level at the start of each year; missing years count as no inflation.
+    if inflation_data is None:
+        return None
+    last_year = max(last_year or datetime.now().year, max(inflation_data)) + 1
+    first_year = min(inflation_data)
+    index = {first_year: 1.0}
+    for year in range(first_year, last_year):
+        index[year + 1] = index[year] * (1 + inflation_data.get(year, 0.0))
+    return index
+
+def deflate(value, from_year, to_year, index=None):
+    # Expresses `value` in `from_year` dollars as `to_year` dollars.
+    index = index or price_index()
+    return value * index[to_year] / index[from_year]
+
+def load_state_table(filename):
+    # WPR per-state tables: state name -> {column: value}.
+    path = os.path.join(DATA_DIR, filename)
+    try:
+        with open(path, 'r', newline='') as file:
+            rows = json.load(file) if filename.endswith('.json') else csv.DictReader(file)
+            return {row.pop('state'): {key: _number(value) for key, value in row.items()} for row in rows}
+    except FileNotFoundError:
+        print(f"Error: The file '{filename}' was not found in the 'data' directory.")
+    except (KeyError, ValueError, TypeError, AttributeError):
+        print(f"Error: Invalid data in '{filename}'.")
+    return None
+
+def load_state_index():
+    path = os.path.join(DATA_DIR, STATE_BOUNDARIES_FILE)
+    if not os.path.exists(path):
+        # On stderr, like the error below, to keep it out of --json output.
+        print(f"Warning: '{STATE_BOUNDARIES_FILE}' was not found in the 'data' directory; "
+              f"every trip is priced in the default state.", file=sys.stderr)
+        return None
+    from state_index import StateIndex  # numpy, only needed once there are boundaries to load
+    try:
+        return StateIndex.from_geojson(path)
+    except (OSError, ValueError, KeyError, TypeError):
+        print(f"Error: Invalid state boundaries in '{STATE_BOUNDARIES_FILE}'.", file=sys.stderr)
+    return None
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
@@ -0,0 +1,111 @@
+from aggregation import aggregate, EventCount, PassengerDistance, FuelPrice, DateSpan, DriveDays, ActivitySequences
+from car_cost_calculator import determine_car_payment, determine_fees_insurance
+from data_processing import DEFAULT_CUTOFF, iter_timeline_chunks
+from emissions_calculator import summarize_emissions_and_costs
+from instrumentation import instrumented
+from rollups import Rollup, rollup_series
+from tracks import derive_miles_correction
+from time_utils import find_min_max_dates
+
+VEHICLE_PARAMS = ('vehicle_mpg', 'vehicle_kerb_w', 'miles_driven_correction')
+CAR_PARAMS = ('model_year', 'used_flag', 'payment_provided', 'has_monthly_payment', 'car_paid_off',
+              'purchase_price', 'years_owned', 'interest_rate', 'financed', 'loan_term', 'purchase_year')
+INSURANCE_PARAMS = ('insurance_monthly', 'insurance_type', 'people_split', 'registration_fee')
+
+def split_params(params):
+    # The vehicle, car and insurance keyword arguments in a flat params dict.
+    # None and 'auto' vehicle values are left to the functions' defaults.
+    return ({key: params[key] for key in VEHICLE_PARAMS if params.get(key) not in (None, 'auto')},
+            {key: params[key] for key in CAR_PARAMS if key in params},
+            {key: params[key] for key in INSURANCE_PARAMS if key in params})
+
+def report_reducers(periods=()):
+    reducers = {
+        'events': EventCount(),
+        'passenger_meters': PassengerDistance(),
+        'fuel_price': FuelPrice(),
+        'date_span': DateSpan(),
+        'sequences': ActivitySequences(),
+        'drive_days': DriveDays(),
+    }
+    for period in periods:
+        reducers[f'rollup_{period}'] = Rollup(period)
+    return reducers
+
+@instrumented('report')
+def build_report(va, params, periods=(), timelinePaths=None):
+    # The cost and emissions report for one timeline, without printing.
+    # `params` is a flat dict of VEHICLE_PARAMS, CAR_PARAMS and INSURANCE_PARAMS.
+    if params.get('miles_driven_correction') == 'auto':
+        correction = derive_miles_correction(va, timelinePaths) if timelinePaths is not None else None
+        params = {**params, 'miles_driven_correction': correction}
+    return report_from_aggregates(aggregate([va], report_reducers(periods)), params)
+
+@instrumented('report')
+def stream_report(segments, params, cutoff=DEFAULT_CUTOFF, periods=()):
+    # build_report straight off the segment stream.
+    return report_from_aggregates(aggregate(iter_timeline_chunks(segments, cutoff), report_reducers(periods)),
+                                  params)
+
+def report_from_aggregates(aggregates, params):
+    # 'auto' corrections need the GPS tracks, which only build_report has.
+    vehicle_params, car_params, insurance_params = split_params(params)
+    if not aggregates['events']:
+        raise ValueError("no timeline entries after the cutoff")
+
+    min_date, max_date = aggregates['date_span']
+    emissions_costs = summarize_emissions_and_costs(aggregates['passenger_meters'], min_date, max_date,
+                                                    fuel_price=aggregates['fuel_price'], **vehicle_params)
+    total_cost, monthly_payment, monthly_amortized_cost = determine_car_payment(**car_params)
+    insurance_cost = determine_fees_insurance(**insurance_params)
+    total_costs = total_costs_between(emissions_costs, monthly_amortized_cost, min_date, max_date,
+                                      car_params.get('years_owned', 5), insurance_cost)
+
+    report = {'events': aggregates['events'], 'drive_days': aggregates['drive_days']}
+    report.update(emissions_costs)
+    report.update({
+        'car_total_cost': total_cost,
+        'monthly_payment': monthly_payment,
+        'monthly_amortized_cost': monthly_amortized_cost,
+    })
+    report.update(insurance_cost)
+    report.update(total_costs)
+    report.update(aggregates['sequences'])
+
+    rollups = {name[len('rollup_'):]: rollup for name, rollup in aggregates.items() if name.startswith('rollup_')}
+    if rollups:
+        annual_fixed_cost = (monthly_amortized_cost * 12 + insurance_cost['annual_insurance_cost'] +
+                             insurance_cost['registration_fee'])
+        series_params = {key: vehicle_params[key] for key in ('vehicle_mpg', 'miles_driven_correction')
+                         if key in vehicle_params}
+        report['rollups'] = {period: rollup_series(rollup, annual_fixed_cost=annual_fixed_cost, **series_params)
+                             for period, rollup in rollups.items()}
+    return report
+
+def calculate_total_costs(costs, monthly_amortized_cost, va, years_owned, insurance_cost):
+    min_date, max_date = find_min_max_dates(va)
+    return total_costs_between(costs, monthly_amortized_cost, min_date, max_date, years_owned, insurance_cost)
+
+@instrumented('total_costs')
+def total_costs_between(costs, monthly_amortized_cost, min_date, max_date, years_owned, insurance_cost):
+    days_used = (max_date - min_date).days
+    miles_driven = costs["miles_driven"]
+
+    annual_miles_driven = miles_driven / (days_used / 365.0)
+    annual_wear_cost = costs["wear_cost"] / (days_used / 365.0)
+
+    wear_cost_mile = annual_wear_cost / annual_miles_driven
+    ownership_cost_mile = (monthly_amortized_cost * 12 * years_owned) / (annual_miles_driven * years_owned)
+
+    annual_insurance_cost = insurance_cost['annual_insurance_cost']
+    registration_fee = insurance_cost['registration_fee']
+    fees_cost_mile = (annual_insurance_cost + registration_fee) / annual_miles_driven
+
+    per_mile_cost = wear_cost_mile + ownership_cost_mile + fees_cost_mile
+
+    return {
+        'days_used': days_used,
+        'annual_miles_driven': annual_miles_driven,
+        'annual_wear_cost': annual_wear_cost,
+        'per_mile_cost': per_mile_cost,
+    }
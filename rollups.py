@@ -0,0 +1,139 @@
+import csv
+import os
+import numpy as np
+from emissions_calculator import (DEFAULT_STATE, average_fuel_price, calculate_emissions, determine_wear_costs,
+                                  trip_fuel_prices)
+from time_utils import MISSING_TIME, civil_from_days, days_from_civil, local_days
+
+PERIODS = ('day', 'week', 'month')
+SERIES_FIELDS = ('period', 'start', 'days', 'entries', 'trips', 'miles', 'gallons_burned', 'CO2_tons_released',
+                 'dust_pounds_released', 'wear_cost', 'per_mile_cost')
+
+# Daily, ISO-weekly and monthly driving figures by local start date. Bucket
+# keys are day numbers (of the Monday for weeks) or year * 12 + month - 1.
+
+class Rollup:
+    # Reducer keeping passenger-vehicle meters, price-weighted meters, trips and
+    # entries per bucket; retract() takes a chunk back out.
+    def __init__(self, period='day', activity_type='IN_PASSENGER_VEHICLE', grade='Regular'):
+        if period not in PERIODS:
+            raise ValueError(f"unknown rollup period '{period}', expected one of {', '.join(PERIODS)}")
+        self.period = period
+        self.activity_type = activity_type
+        self.grade = grade
+        self.buckets = {}  # key -> [meters, trips, entries, cost_meters]
+
+    def update(self, chunk):
+        self._add(chunk, 1)
+
+    def retract(self, chunk):
+        self._add(chunk, -1)
+
+    def _add(self, chunk, sign):
+        has_start = chunk.start_time != MISSING_TIME
+        if not has_start.any():
+            return
+        days = local_days(chunk.start_time[has_start], chunk.start_offset[has_start])
+        keys, index = np.unique(bucket_keys(days, self.period), return_inverse=True)
+        passenger = chunk.where('top_candidate_type', self.activity_type)[has_start]
+        trip_meters = np.where(passenger, chunk.distance[has_start], 0.0)
+        prices = np.zeros(len(passenger))
+        rows = np.flatnonzero(has_start)[passenger]
+        prices[passenger] = trip_fuel_prices(chunk.start_lat[rows], chunk.start_lng[rows], self.grade, DEFAULT_STATE,
+                                             chunk.start_time[rows], chunk.start_offset[rows])
+        meters = np.bincount(index, weights=trip_meters, minlength=len(keys))
+        cost_meters = np.bincount(index, weights=trip_meters * prices, minlength=len(keys))
+        trips = np.bincount(index, weights=passenger, minlength=len(keys)).astype(np.int64)
+        entries = np.bincount(index, minlength=len(keys))
+        for key, bucket_meters, bucket_trips, bucket_entries, bucket_cost_meters in zip(
+                keys.tolist(), meters.tolist(), trips.tolist(), entries.tolist(), cost_meters.tolist()):
+            bucket = self.buckets.setdefault(key, [0.0, 0, 0, 0.0])
+            bucket[0] += sign * bucket_meters
+            bucket[1] += sign * bucket_trips
+            bucket[2] += sign * bucket_entries
+            bucket[3] += sign * bucket_cost_meters
+            if bucket[2] <= 0:
+                del self.buckets[key]
+
+    def result(self):
+        keys = np.array(sorted(self.buckets), dtype=np.int64)
+        values = [self.buckets[key] for key in keys.tolist()]
+        return {
+            'period': self.period,
+            'key': keys,
+            'meters': np.array([value[0] for value in values], dtype=np.float64),
+            'trips': np.array([value[1] for value in values], dtype=np.int64),
+            'entries': np.array([value[2] for value in values], dtype=np.int64),
+            'cost_meters': np.array([value[3] for value in values], dtype=np.float64),
+        }
+
+def bucket_keys(days, period):
+    days = np.asarray(days, dtype=np.int64)
+    if period == 'day':
+        return days
+    if period == 'week':
+        # 1970-01-01 was a Thursday, so (days + 3) % 7 counts from Monday.
+        return days - (days + 3) % 7
+    year, month, _ = civil_from_days(days)
+    return year * 12 + month - 1
+
+def bucket_bounds(keys, period):
+    # First local day number of every bucket and the number of days it spans.
+    keys = np.asarray(keys, dtype=np.int64)
+    if period == 'day':
+        return keys, np.ones(len(keys), dtype=np.int64)
+    if period == 'week':
+        return keys, np.full(len(keys), 7, dtype=np.int64)
+    starts = days_from_civil(keys // 12, keys % 12 + 1, 1)
+    following = days_from_civil((keys + 1) // 12, (keys + 1) % 12 + 1, 1)
+    return starts, following - starts
+
+def bucket_labels(keys, period):
+    starts, _ = bucket_bounds(keys, period)
+    if period == 'week':
+        # The ISO week belongs to the year its Thursday falls in.
+        thursdays = starts + 3
+        iso_year, _, _ = civil_from_days(thursdays)
+        week = (thursdays - days_from_civil(iso_year, 1, 1)) // 7 + 1
+        return [f"{y}-W{w:02d}" for y, w in zip(iso_year.tolist(), week.tolist())]
+    year, month, day = civil_from_days(starts)
+    if period == 'month':
+        return [f"{y}-{m:02d}" for y, m in zip(year.tolist(), month.tolist())]
+    return [f"{y}-{m:02d}-{d:02d}" for y, m, d in zip(year.tolist(), month.tolist(), day.tolist())]
+
+def rollup_series(rollup, vehicle_mpg=24.4, miles_driven_correction=1.0, annual_fixed_cost=0.0):
+    # Per-bucket report columns, as summarize_emissions_and_costs computes them;
+    # `annual_fixed_cost` is spread over the days of each bucket.
+    period = rollup['period']
+    starts, days = bucket_bounds(rollup['key'], period)
+    year, month, day = civil_from_days(starts)
+    miles = rollup['meters'] / 1000 / 1.6 * miles_driven_correction
+    gallons_burned, CO2kgs_released, mgs_released = calculate_emissions(miles, vehicle_mpg)
+    fuel_price = average_fuel_price(rollup['cost_meters'], rollup['meters'])
+    wear_cost = determine_wear_costs(miles, vehicle_mpg, DEFAULT_STATE, fuel_price)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_mile_cost = np.where(miles > 0, (wear_cost + annual_fixed_cost * days / 365.0) / miles, np.nan)
+    return {
+        'period': bucket_labels(rollup['key'], period),
+        'start': [f"{y}-{m:02d}-{d:02d}" for y, m, d in zip(year.tolist(), month.tolist(), day.tolist())],
+        'days': days,
+        'entries': rollup['entries'],
+        'trips': rollup['trips'],
+        'miles': miles,
+        'gallons_burned': gallons_burned,
+        'CO2_tons_released': CO2kgs_released * 0.001,
+        'dust_pounds_released': mgs_released * 0.000001 / 2.2,
+        'wear_cost': wear_cost,
+        'per_mile_cost': per_mile_cost,
+    }
+
+def write_series_csv(series, filename):
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    columns = [series[field] for field in SERIES_FIELDS]
+    columns = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns]
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(SERIES_FIELDS)
+        writer.writerows(zip(*columns))
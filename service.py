@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+import reference_data
+from data_processing import DEFAULT_CUTOFF, stream_segments
+from json_utils import jsonable
+from report import VEHICLE_PARAMS, CAR_PARAMS, INSURANCE_PARAMS, stream_report
+
+READ_CHUNK = 1 << 16
+MAX_HEAD_BYTES = 1 << 16
+MAX_UPLOAD_BYTES = 1 << 30
+HEAD_TIMEOUT = 30  # seconds to send the request line and headers
+REPORT_OPTIONS = VEHICLE_PARAMS + CAR_PARAMS + INSURANCE_PARAMS + ('cutoff',)
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 408: 'Request Timeout',
+           413: 'Payload Too Large', 422: 'Unprocessable Entity', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+# POST /report?vehicle_mpg=30 with an export as the body, and GET /health.
+# Identical requests in flight share one computation.
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ReportService:
+    def __init__(self, workers=None, max_pending=64, max_upload=MAX_UPLOAD_BYTES, spool_dir=None):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_upload = max_upload
+        self.spool_dir = spool_dir
+        self.executor = None
+        self.worker_count = 0
+        self.in_flight = {}  # report key -> future of its report
+        self.pending = 0
+        self.served = self.deduplicated = self.rejected = 0
+
+    def start(self):
+        reference_data.preload()
+        self.worker_count = self.workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.worker_count, initializer=reference_data.preload)
+        # Fork the workers before listening, so they hold no client sockets.
+        self.executor.submit(int).result()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+            self.worker_count = 0
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        if self.executor is None:
+            self.start()
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD_BYTES)
+
+    async def handle(self, reader, writer):
+        status, headers = 200, {}
+        try:
+            body, headers = await self.respond(reader)
+        except HTTPError as error:
+            status, body = error.status, {'error': str(error)}
+        except Exception as error:
+            status, body = 500, {'error': f"{type(error).__name__}: {error}"}
+        payload = json.dumps(body, default=jsonable).encode('utf-8')
+        head = [f"HTTP/1.1 {status} {REASONS[status]}", 'Content-Type: application/json',
+                f"Content-Length: {len(payload)}", 'Connection: close']
+        head.extend(f"{name}: {value}" for name, value in headers.items())
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def respond(self, reader):
+        try:
+            method, target, headers = await asyncio.wait_for(_read_head(reader), HEAD_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPError(408, "timed out waiting for the request headers") from None
+        url = urlsplit(target)
+        if url.path == '/health':
+            if method != 'GET':
+                raise HTTPError(405, "use GET for /health")
+            return self.health(), {}
+        if url.path != '/report':
+            raise HTTPError(404, f"no such endpoint '{url.path}'")
+        if method != 'POST':
+            raise HTTPError(405, "POST the export to /report")
+        params = _report_params(url.query)
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPError(503, "too many reports in progress, try again later")
+        self.pending += 1
+        try:
+            key, report = await self.report(reader, headers, params)
+        finally:
+            self.pending -= 1
+        self.served += 1
+        return report, {'X-Report-Key': key}
+
+    async def report(self, reader, headers, params):
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8'))
+        descriptor, path = tempfile.mkstemp(suffix='.json', dir=self.spool_dir)
+        handed_over = False
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                async for chunk in _read_body(reader, headers, self.max_upload):
+                    digest.update(chunk)
+                    file.write(chunk)
+            key = digest.hexdigest()
+            future = self.in_flight.get(key)
+            if future is None:
+                future = asyncio.get_running_loop().run_in_executor(self.executor, run_report, path, params)
+                self.in_flight[key] = future
+                future.add_done_callback(lambda _: self._finished(key, path))
+                handed_over = True
+            else:
+                self.deduplicated += 1
+            # Shielded, so a client hanging up does not cancel a report others wait on.
+            try:
+                return key, await asyncio.shield(future)
+            except ValueError as error:
+                raise HTTPError(422, str(error)) from None
+        finally:
+            if not handed_over:
+                os.remove(path)
+
+    def _finished(self, key, path):
+        self.in_flight.pop(key, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def health(self):
+        return {'status': 'ok', 'workers': self.worker_count,
+                'pending': self.pending, 'in_flight': len(self.in_flight), 'served': self.served,
+                'deduplicated': self.deduplicated, 'rejected': self.rejected}
+
+def run_report(path, params):
+    # Runs in a worker process.
+    params = dict(params)
+    cutoff = params.pop('cutoff', DEFAULT_CUTOFF)
+    return stream_report(stream_segments(path), params, cutoff)
+
+def _report_params(query):
+    params = {}
+    for name, value in parse_qsl(query, keep_blank_values=True):
+        if name not in REPORT_OPTIONS:
+            raise HTTPError(400, f"unknown parameter '{name}'")
+        try:
+            params[name] = json.loads(value)
+        except ValueError:
+            params[name] = value
+    return params
+
+async def _read_head(reader):
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise HTTPError(400, "request headers too large") from None
+    except asyncio.IncompleteReadError:
+        raise HTTPError(400, "incomplete request") from None
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line") from None
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    return method.upper(), target, headers
+
+async def _read_body(reader, headers, limit):
+    # Yields the request body in chunks, from a Content-Length or chunked upload.
+    received = 0
+    try:
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if not size:
+                    while (await reader.readline()).strip():  # trailers
+                        pass
+                    return
+                received += size
+                if received > limit:
+                    raise HTTPError(413, f"uploads are limited to {limit} bytes")
+                while size:
+                    chunk = await reader.read(min(size, READ_CHUNK))
+                    if not chunk:
+                        raise HTTPError(422, "upload ended early, the export is incomplete")
+                    size -= len(chunk)
+                    yield chunk
+                await reader.readexactly(2)
+        else:
+            try:
+                remaining = int(headers['content-length'])
+            except (KeyError, ValueError):
+                raise HTTPError(400, "send a Content-Length or a chunked upload") from None
+            if remaining > limit:
+                raise HTTPError(413, f"uploads are limited to {limit} bytes")
+            while remaining:
+                chunk = await reader.read(min(remaining, READ_CHUNK))
+                if not chunk:
+                    raise HTTPError(422, "upload ended early, the export is incomplete")
+                remaining -= len(chunk)
+                yield chunk
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+        raise HTTPError(400, "malformed chunked upload") from None
+
+async def _serve_forever(service, host, port):
+    server = await service.serve(host, port)
+    print(f"Serving reports on http://{host}:{port}/report ({service.worker_count} workers)")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the cost and emissions report over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--max-pending', type=int, default=64, help="reports accepted at once before answering 503")
+    parser.add_argument('--max-upload', type=int, default=MAX_UPLOAD_BYTES, help="largest upload in bytes")
+    parser.add_argument('--spool-dir', help="where uploads are kept while their report runs")
+    args = parser.parse_args()
+    service = ReportService(args.workers, args.max_pending, args.max_upload, args.spool_dir)
+    try:
+        asyncio.run(_serve_forever(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
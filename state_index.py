@@ -0,0 +1,178 @@
+import json
+import numpy as np
+
+CELL_DEGREES = 0.25
+POINT_BATCH = 1 << 16
+
+STATE_ABBREVIATIONS = {
+    'AL': 'Alabama', 'AK': 'Alaska', 'AZ': 'Arizona', 'AR': 'Arkansas', 'CA': 'California', 'CO': 'Colorado',
+    'CT': 'Connecticut', 'DE': 'Delaware', 'DC': 'District of Columbia', 'FL': 'Florida', 'GA': 'Georgia',
+    'HI': 'Hawaii', 'ID': 'Idaho', 'IL': 'Illinois', 'IN': 'Indiana', 'IA': 'Iowa', 'KS': 'Kansas',
+    'KY': 'Kentucky', 'LA': 'Louisiana', 'ME': 'Maine', 'MD': 'Maryland', 'MA': 'Massachusetts',
+    'MI': 'Michigan', 'MN': 'Minnesota', 'MS': 'Mississippi', 'MO': 'Missouri', 'MT': 'Montana',
+    'NE': 'Nebraska', 'NV': 'Nevada', 'NH': 'New Hampshire', 'NJ': 'New Jersey', 'NM': 'New Mexico',
+    'NY': 'New York', 'NC': 'North Carolina', 'ND': 'North Dakota', 'OH': 'Ohio', 'OK': 'Oklahoma',
+    'OR': 'Oregon', 'PA': 'Pennsylvania', 'RI': 'Rhode Island', 'SC': 'South Carolina', 'SD': 'South Dakota',
+    'TN': 'Tennessee', 'TX': 'Texas', 'UT': 'Utah', 'VT': 'Vermont', 'VA': 'Virginia', 'WA': 'Washington',
+    'WV': 'West Virginia', 'WI': 'Wisconsin', 'WY': 'Wyoming', 'PR': 'Puerto Rico',
+}
+
+def state_name(state):
+    # Accepts a postal abbreviation or a full name.
+    return STATE_ABBREVIATIONS.get(state.upper(), state) if isinstance(state, str) else state
+
+class StateIndex:
+    # Point-to-state lookup on a grid: a point takes its cell center's state,
+    # changed by any boundary edge crossed on the way from the center.
+    def __init__(self, names, polygons, cell_degrees=CELL_DEGREES):
+        # `polygons` is a list of (state number, ring) with rings as (n, 2)
+        # arrays of lng, lat; holes are rings like any other (even-odd rule).
+        self.names = list(names)
+        self.cell = cell_degrees
+        edges = []
+        for state, ring in polygons:
+            ring = np.asarray(ring, dtype=np.float64)
+            if len(ring) < 3:
+                continue
+            closed = np.vstack([ring, ring[:1]]) if (ring[0] != ring[-1]).any() else ring
+            segment = np.hstack([closed[:-1], closed[1:], np.full((len(closed) - 1, 1), state)])
+            edges.append(segment[(segment[:, 0] != segment[:, 2]) | (segment[:, 1] != segment[:, 3])])
+        edges = np.vstack(edges) if edges else np.zeros((0, 5))
+        self.x1, self.y1, self.x2, self.y2 = (edges[:, i] for i in range(4))
+        self.edge_state = edges[:, 4].astype(np.int32)
+
+        if len(edges):
+            self.lng0 = np.floor(min(self.x1.min(), self.x2.min()) / self.cell) * self.cell
+            self.lat0 = np.floor(min(self.y1.min(), self.y2.min()) / self.cell) * self.cell
+            self.columns = int(np.ceil((max(self.x1.max(), self.x2.max()) - self.lng0) / self.cell)) + 1
+            self.rows = int(np.ceil((max(self.y1.max(), self.y2.max()) - self.lat0) / self.cell)) + 1
+        else:
+            self.lng0 = self.lat0 = 0.0
+            self.columns = self.rows = 0
+        self._bucket_edges()
+        self._center_states()
+
+    @classmethod
+    def from_geojson(cls, filename, name_property=None, cell_degrees=CELL_DEGREES):
+        # Polygon and MultiPolygon features, named by NAME or `name_property`.
+        with open(filename, 'r') as file:
+            features = json.load(file)['features']
+        names, polygons = [], []
+        for feature in features:
+            properties = feature.get('properties') or {}
+            name = properties.get(name_property) if name_property else properties.get('NAME', properties.get('name'))
+            geometry = feature.get('geometry') or {}
+            parts = geometry.get('coordinates') or []
+            if geometry.get('type') == 'Polygon':
+                parts = [parts]
+            elif geometry.get('type') != 'MultiPolygon':
+                continue
+            if name not in names:
+                names.append(name)
+            state = names.index(name)
+            polygons.extend((state, ring) for polygon in parts for ring in polygon)
+        return cls(names, polygons, cell_degrees)
+
+    def _bucket_edges(self):
+        # Every cell an edge's bounding box touches, as a CSR edge list per cell.
+        if not len(self.x1):
+            self.cell_start = np.zeros(1, dtype=np.int64)
+            self.cell_edges = np.zeros(0, dtype=np.int64)
+            return
+        col_lo, col_hi = (self._column(np.minimum(self.x1, self.x2)), self._column(np.maximum(self.x1, self.x2)))
+        row_lo, row_hi = (self._row(np.minimum(self.y1, self.y2)), self._row(np.maximum(self.y1, self.y2)))
+        widths, heights = col_hi - col_lo + 1, row_hi - row_lo + 1
+        counts = widths * heights
+        edge = np.repeat(np.arange(len(counts)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = (row_lo[edge] + within // widths[edge]) * self.columns + col_lo[edge] + within % widths[edge]
+        order = np.argsort(cells, kind='stable')
+        self.cell_edges = edge[order]
+        self.cell_start = np.searchsorted(cells[order], np.arange(self.rows * self.columns + 1))
+
+    def _center_states(self):
+        # Scanline through every row of cell centers: per state, the number of
+        # its edges crossed to the west of a center is odd inside the state.
+        self.center_state = np.full(self.rows * self.columns, -1, dtype=np.int32)
+        center_x = self.lng0 + (np.arange(self.columns) + 0.5) * self.cell
+        for row in range(self.rows):
+            y = self.lat0 + (row + 0.5) * self.cell
+            crossing = (self.y1 <= y) != (self.y2 <= y)
+            if not crossing.any():
+                continue
+            x1, y1, x2, y2 = self.x1[crossing], self.y1[crossing], self.x2[crossing], self.y2[crossing]
+            x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            states = self.edge_state[crossing]
+            for state in np.unique(states).tolist():
+                inside = np.searchsorted(np.sort(x[states == state]), center_x) % 2 == 1
+                self.center_state[row * self.columns:(row + 1) * self.columns][inside] = state
+
+    def _column(self, lng):
+        return np.floor((lng - self.lng0) / self.cell).astype(np.int64)
+
+    def _row(self, lat):
+        return np.floor((lat - self.lat0) / self.cell).astype(np.int64)
+
+    def lookup(self, lats, lngs):
+        # State number for every point, -1 outside all states or for NaN.
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        states = np.full(len(lats), -1, dtype=np.int32)
+        for start in range(0, len(lats), POINT_BATCH):
+            batch = slice(start, start + POINT_BATCH)
+            states[batch] = self._lookup_batch(lats[batch], lngs[batch])
+        return states
+
+    def lookup_names(self, lats, lngs):
+        lookup = np.array(self.names + [None], dtype=object)
+        return lookup[self.lookup(lats, lngs)]
+
+    def _lookup_batch(self, lats, lngs):
+        states = np.full(len(lats), -1, dtype=np.int32)
+        if not self.rows:
+            return states
+        with np.errstate(invalid='ignore'):
+            column, row = self._column(np.nan_to_num(lngs, nan=-1e9)), self._row(np.nan_to_num(lats, nan=-1e9))
+        valid = (column >= 0) & (column < self.columns) & (row >= 0) & (row < self.rows)
+        points = np.flatnonzero(valid)
+        cells = row[points] * self.columns + column[points]
+        states[points] = self.center_state[cells]
+
+        # Pair every point with the edges of its cell and count, per state, the
+        # edges crossed by the segment from the cell center to the point.
+        counts = self.cell_start[cells + 1] - self.cell_start[cells]
+        if not counts.sum():
+            return states
+        pair_point = np.repeat(np.arange(len(points)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        edge = self.cell_edges[np.repeat(self.cell_start[cells], counts) + within]
+        px, py = lngs[points][pair_point], lats[points][pair_point]
+        cx = self.lng0 + (column[points][pair_point] + 0.5) * self.cell
+        cy = self.lat0 + (row[points][pair_point] + 0.5) * self.cell
+        crossed = _segments_cross(cx, cy, px, py, self.x1[edge], self.y1[edge], self.x2[edge], self.y2[edge])
+        if not crossed.any():
+            return states
+
+        key = pair_point[crossed].astype(np.int64) * len(self.names) + self.edge_state[edge[crossed]]
+        keys, crossings = np.unique(key, return_counts=True)
+        flipped = keys[crossings % 2 == 1]
+        flipped_point, flipped_state = flipped // len(self.names), (flipped % len(self.names)).astype(np.int32)
+        base = states[points]
+        # Leaving the center's state, or entering another one.
+        leaving = flipped_state == base[flipped_point]
+        base[flipped_point[leaving]] = -1
+        base[flipped_point[~leaving]] = flipped_state[~leaving]
+        states[points] = base
+        return states
+
+def _segments_cross(ax, ay, bx, by, cx, cy, dx, dy):
+    # True where segment a-b crosses segment c-d. Edges are half-open in y so
+    # a crossing exactly through a shared vertex counts once.
+    def orientation(px, py, qx, qy, rx, ry):
+        return (qx - px) * (ry - py) - (qy - py) * (rx - px)
+
+    d1 = orientation(ax, ay, bx, by, cx, cy)
+    d2 = orientation(ax, ay, bx, by, dx, dy)
+    d3 = orientation(cx, cy, dx, dy, ax, ay)
+    d4 = orientation(cx, cy, dx, dy, bx, by)
+    return ((d1 > 0) != (d2 > 0)) & ((d3 > 0) != (d4 > 0))
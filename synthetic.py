@@ -0,0 +1,157 @@
+import argparse
+import json
+import math
+import random
+from datetime import datetime, timedelta
+
+DEFAULT_START = "2024-02-02T00:00:00-07:00"  # just after DEFAULT_CUTOFF, so every segment is kept
+
+# Places one synthetic user moves between: placeId -> (semantic type, lat, lng).
+PLACES = {
+    'ChIJhome': ('INFERRED_HOME', 37.8044, -122.2712),
+    'ChIJwork': ('INFERRED_WORK', 37.7900, -122.4000),
+    'ChIJgym': ('UNKNOWN', 37.8100, -122.2600),
+    'ChIJshop': ('UNKNOWN', 37.7749, -122.4194),
+    'ChIJcafe': ('UNKNOWN', 37.8070, -122.2690),
+    'ChIJpark': ('UNKNOWN', 37.7694, -122.4862),
+    'ChIJfamily': ('UNKNOWN', 38.5816, -121.4944),
+}
+# Mode -> (speed in km/h, longest trip in km it is used for, relative weight)
+MODES = {
+    'WALKING': (5, 2, 3),
+    'CYCLING': (16, 8, 2),
+    'IN_BUS': (25, 40, 2),
+    'IN_PASSENGER_VEHICLE': (45, 1000, 5),
+}
+PATH_POINTS = 30  # most points recorded for one timelinePath
+
+# Synthetic exports for tests and benchmarks: days from home to a few places
+# and back, each move an activity followed by its timelinePath.
+
+def generate_segments(count, seed=0, start=DEFAULT_START):
+    # Yields `count` segments in time order.
+    rng = random.Random(seed)
+    day = datetime.fromisoformat(start).replace(hour=0, minute=0, second=0, microsecond=0)
+    now = datetime.fromisoformat(start)
+    produced = 0
+    while True:
+        segments, now = _day(rng, day, now)
+        for segment in segments:
+            if produced == count:
+                return
+            produced += 1
+            yield segment
+        day += timedelta(days=1)
+
+def write_export(filename, count, seed=0, start=DEFAULT_START):
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write('{"semanticSegments": [')
+        for i, segment in enumerate(generate_segments(count, seed, start)):
+            if i:
+                file.write(', ')
+            file.write(json.dumps(segment, ensure_ascii=False))
+        file.write(']}')
+
+def _day(rng, day, now):
+    # The segments from `now`, at home, until getting home again on `day`,
+    # and the time of that arrival.
+    places = ['ChIJhome']
+    if day.weekday() < 5 and rng.random() < 0.9:
+        places.append('ChIJwork')
+    others = [place for place in PLACES if place not in ('ChIJhome', 'ChIJwork', 'ChIJfamily')]
+    places.extend(rng.sample(others, rng.randint(0, 2)))
+    if day.weekday() >= 5 and rng.random() < 0.1:
+        places.append('ChIJfamily')
+
+    segments = []
+    leave_home = max(now, day + timedelta(hours=rng.uniform(6.5, 9)))
+    for place, next_place in zip(places, places[1:] + ['ChIJhome']):
+        if place == 'ChIJhome':
+            end = leave_home
+        elif place == 'ChIJwork':
+            end = now + timedelta(hours=rng.uniform(6, 9))
+        else:
+            end = now + timedelta(minutes=rng.uniform(20, 90))
+        segments.append(_visit(rng, place, now, end))
+        trip = _trip(rng, place, next_place, end)
+        segments.extend(trip)
+        now = _parse(trip[0]['endTime'])
+    return segments, now
+
+def _visit(rng, place, start, end):
+    semantic_type, lat, lng = PLACES[place]
+    return {
+        **_times(start, end),
+        'visit': {
+            'hierarchyLevel': 0,
+            'probability': round(rng.uniform(0.6, 0.99), 3),
+            'topCandidate': {
+                'placeId': place,
+                'semanticType': semantic_type,
+                'probability': round(rng.uniform(0.4, 0.99), 3),
+                'placeLocation': {'latLng': _lat_lng(lat, lng)},
+            },
+        },
+    }
+
+def _trip(rng, origin, destination, start):
+    # The activity segment and its timelinePath.
+    _, lat1, lng1 = PLACES[origin]
+    _, lat2, lng2 = PLACES[destination]
+    meters = _haversine(lat1, lng1, lat2, lng2) * rng.uniform(1.2, 1.5)
+    modes = [mode for mode, (_, longest, _) in MODES.items() if meters / 1000 <= longest]
+    mode = rng.choices(modes, [MODES[mode][2] for mode in modes])[0]
+    minutes = max(2.0, meters / 1000 / MODES[mode][0] * 60 * rng.uniform(0.9, 1.4))
+    end = start + timedelta(minutes=minutes)
+
+    points = min(PATH_POINTS, max(2, int(minutes // 2)))
+    path = []
+    for i in range(points):
+        fraction = i / (points - 1)
+        path.append({
+            'point': f"{lat1 + (lat2 - lat1) * fraction + rng.gauss(0, 0.0005):.6f}°, "
+                     f"{lng1 + (lng2 - lng1) * fraction + rng.gauss(0, 0.0005):.6f}°",
+            'time': _format(start + (end - start) * fraction),
+        })
+    activity = {
+        **_times(start, end),
+        'activity': {
+            'start': {'latLng': _lat_lng(lat1, lng1)},
+            'end': {'latLng': _lat_lng(lat2, lng2)},
+            'distanceMeters': meters,
+            'probability': round(rng.uniform(0.7, 0.99), 3),
+            'topCandidate': {'type': mode, 'probability': round(rng.uniform(0.3, 0.95), 3)},
+        },
+    }
+    return [activity, {'startTime': _format(start), 'endTime': _format(end), 'timelinePath': path}]
+
+def _times(start, end):
+    return {
+        'startTime': _format(start),
+        'endTime': _format(end),
+        'startTimeTimezoneUtcOffsetMinutes': int(start.utcoffset().total_seconds() // 60),
+        'endTimeTimezoneUtcOffsetMinutes': int(end.utcoffset().total_seconds() // 60),
+    }
+
+def _format(moment):
+    return moment.isoformat(timespec='milliseconds')
+
+def _parse(value):
+    return datetime.fromisoformat(value)
+
+def _lat_lng(lat, lng):
+    return f"{lat:.7g}°, {lng:.7g}°"
+
+def _haversine(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic semanticSegments export.")
+    parser.add_argument('output')
+    parser.add_argument('--segments', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', default=DEFAULT_START, help="ISO-8601 time of the first day")
+    args = parser.parse_args()
+    write_export(args.output, args.segments, args.seed, args.start)
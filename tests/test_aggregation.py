@@ -0,0 +1,133 @@
+import itertools
+import random
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from aggregation import ActivitySequences, DateSpan, DriveDays, EventCount, FuelPrice, PassengerDistance, aggregate
+from analysis import analyze_activity_sequences, run_lengths
+from emissions_calculator import DEFAULT_STATE, state_based_calc, trip_fuel_prices
+from timeline import TimelineBuilder
+
+# The baseline functions the reducers replaced, over the flattened entry dicts.
+
+def baseline_sequences(entries):
+    sequence = [entry['semanticType'] for entry in entries]
+    last, visits, activities, visit_count, activity_count = '', [], [], 0, 0
+    for item in sequence:
+        if item == last:
+            if item == 'visit':
+                visit_count += 1
+            elif item == 'activity':
+                activity_count += 1
+        else:
+            visits.append(visit_count)
+            activities.append(activity_count)
+            visit_count = activity_count = 0
+        last = item
+    visits.append(visit_count)
+    activities.append(activity_count)
+
+    non_zero = [a for a in activities if a > 0]
+    zero_gaps, zero_count = [], 0
+    for a in activities:
+        if a == 0:
+            zero_count += 1
+        elif zero_count > 0:
+            zero_gaps.append(zero_count)
+            zero_count = 0
+    if zero_count > 0:
+        zero_gaps.append(zero_count)
+    return {
+        "total_consecutive_visits": sum(visits),
+        "total_consecutive_activities": sum(activities),
+        "average_activities_in_groups": sum(non_zero) / len(non_zero) if non_zero else None,
+        "average_gaps_between_activities": sum(zero_gaps) / len(zero_gaps) if zero_gaps else None,
+    }
+
+def baseline_min_max_dates(entries):
+    return datetime.fromisoformat(entries[0]['startTime']), datetime.fromisoformat(entries[-1]['endTime'])
+
+def baseline_drive_days(entries):
+    return len({datetime.fromisoformat(entry['startTime']).date() for entry in entries
+                if entry.get('topCandidateType') == 'IN_PASSENGER_VEHICLE' and entry.get('startTime')})
+
+def baseline_passenger_meters(entries):
+    return sum(entry['distanceMeters'] for entry in entries if entry.get('topCandidateType') == 'IN_PASSENGER_VEHICLE')
+
+@pytest.fixture(scope='module')
+def entries():
+    # Runs of visits, activities, other semantic types and missing ones (np.nan,
+    # as the baseline flatten_visit left them), across time zones and midnight.
+    rng = random.Random(7)
+    now = datetime(2024, 3, 1, 5, 0, tzinfo=timezone(timedelta(hours=-8)))
+    entries = []
+    for _ in range(3000):
+        kind = rng.choices(['visit', 'activity', 'HOME', np.nan], [3, 4, 1, 1])[0]
+        if rng.random() < 0.05:
+            now = now.astimezone(timezone(timedelta(minutes=rng.choice([-480, -420, 0, 330]))))
+        end = now + timedelta(minutes=rng.randrange(1, 600), milliseconds=rng.randrange(1000))
+        entry = {'semanticType': kind, 'startTime': now.isoformat(timespec='milliseconds'),
+                 'endTime': end.isoformat(timespec='milliseconds')}
+        if kind == 'activity':
+            entry.update({'topCandidateType': rng.choice(['IN_PASSENGER_VEHICLE', 'WALKING', 'IN_BUS']),
+                          'distanceMeters': rng.uniform(100, 50000),
+                          'startLatLng': f"{rng.uniform(33, 41):.6f}°, {rng.uniform(-123, -115):.6f}°"})
+        entries.append(entry)
+        now = end
+    return entries
+
+@pytest.fixture(scope='module')
+def va(entries):
+    builder = TimelineBuilder()
+    for entry in entries:
+        builder.append(entry)
+    return builder.build()
+
+def reducers():
+    return {'events': EventCount(), 'passenger_meters': PassengerDistance(), 'fuel_price': FuelPrice(),
+            'date_span': DateSpan(), 'drive_days': DriveDays(), 'sequences': ActivitySequences()}
+
+def chunked(va, sizes):
+    start = 0
+    for size in itertools.cycle(sizes):
+        if start >= len(va):
+            return
+        yield va.take(slice(start, start + size))
+        start += size
+
+@pytest.mark.parametrize('sizes', [[3000], [1], [2, 1, 5], [97], [1000, 1, 1, 999]])
+def test_reducers_match_the_baseline_functions(entries, va, sizes):
+    results = aggregate(chunked(va, sizes), reducers())
+    assert results['events'] == len(entries)
+    assert results['passenger_meters'] == pytest.approx(baseline_passenger_meters(entries))
+    assert results['date_span'] == baseline_min_max_dates(entries)
+    assert results['drive_days'] == baseline_drive_days(entries)
+    assert results['sequences'] == pytest.approx(baseline_sequences(entries))
+    assert analyze_activity_sequences(va) == pytest.approx(baseline_sequences(entries))
+
+def test_fuel_price_is_weighted_by_distance(entries, va):
+    drives = [entry for entry in entries if entry.get('topCandidateType') == 'IN_PASSENGER_VEHICLE']
+    lat_lngs = np.array([[float(part.strip(' °')) for part in entry['startLatLng'].split(',')] for entry in drives])
+    prices = trip_fuel_prices(lat_lngs[:, 0].astype(np.float32), lat_lngs[:, 1].astype(np.float32))
+    meters = np.array([entry['distanceMeters'] for entry in drives])
+    expected = (meters * prices).sum() / meters.sum()
+    assert aggregate(chunked(va, [97]), {'price': FuelPrice()})['price'] == pytest.approx(expected)
+    # Without passenger trips it is the default state's price.
+    assert aggregate([], {'price': FuelPrice()})['price'] == state_based_calc(DEFAULT_STATE)
+
+def test_empty_timeline(va):
+    results = aggregate([va.take(slice(0, 0))], reducers())
+    assert results['events'] == 0 and results['date_span'] == (None, None) and results['drive_days'] == 0
+    assert results['sequences'] == baseline_sequences([])
+
+def test_run_lengths():
+    rng = random.Random(3)
+    codes = np.array([rng.choice([-1, 0, 0, 1, 2]) for _ in range(500)])
+    starts, lengths, values = run_lengths(codes)
+    expected = [(key, len(list(group))) for key, group in itertools.groupby(codes.tolist())]
+    assert list(zip(values.tolist(), lengths.tolist())) == expected
+    assert starts.tolist() == np.cumsum([0] + [length for _, length in expected])[:-1].tolist()
+    # Breaks start a run even inside equal values: every -1 stands alone.
+    _, lengths, values = run_lengths(codes, codes < 0)
+    assert (lengths[values < 0] == 1).all() and lengths.sum() == len(codes)
+    assert [array.size for array in run_lengths([])] == [0, 0, 0]
@@ -0,0 +1,27 @@
+import csv
+import pytest
+from batch import run_batch
+from synthetic import write_export
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_bad_exports_are_reported_in_the_error_column(tmp_path, workers):
+    exports = tmp_path / 'exports'
+    exports.mkdir()
+    write_export(exports / 'good.json', 300)
+    text = (exports / 'good.json').read_text(encoding='utf-8')
+    (exports / 'truncated.json').write_text(text[:len(text) // 2], encoding='utf-8')
+    segment = text.index('{"startTime"', 5000)
+    (exports / 'corrupt.json').write_text(text[:segment] + '#' + text[segment + 1:], encoding='utf-8')
+    output = tmp_path / 'report.csv'
+
+    assert run_batch(str(exports), output=str(output), workers=workers) == (1, 2)
+
+    with open(output, newline='') as file:
+        rows = {row['user']: row for row in csv.DictReader(file)}
+    assert rows['good']['error'] == '' and int(rows['good']['events']) > 0
+    assert rows['truncated']['error'].startswith("TimelineFormatError: ")
+    assert 'truncated.json' in rows['truncated']['error']
+    assert rows['corrupt']['error'].startswith("TimelineFormatError: ")
+    assert "Expecting value" in rows['corrupt']['error']
+    # A bad export yields no partial results.
+    assert rows['truncated']['events'] == '' and rows['corrupt']['events'] == ''
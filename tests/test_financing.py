@@ -0,0 +1,66 @@
+import math
+import random
+from datetime import datetime
+import numpy as np
+from car_cost_calculator import determine_car_payment
+from financing import determine_car_payments, financing_grid, round_cents
+
+YEAR = datetime.now().year
+
+CHOICES = {
+    'model_year': [None, 1920, 2010, 2020, YEAR, YEAR + 1],
+    'used_flag': [True, False],
+    'payment_provided': [None, 0, 400, 612.37],
+    'has_monthly_payment': [None, True, False],
+    'car_paid_off': [True, False],
+    'purchase_price': [None, 0, 18000, 31999.99],
+    'years_owned': [0, 3, 5],
+    'interest_rate': [0, 0.05, 0.0725],
+    'financed': [True, False],
+    'loan_term': [0, 3, 5, 7],
+    'purchase_year': [None, 2015, YEAR - 2],
+}
+
+def scalar(case):
+    # determine_car_payment, with the scenarios it fails on as NaN.
+    try:
+        return determine_car_payment(**case)
+    except (ZeroDivisionError, TypeError):
+        return (math.nan,) * 3
+
+def test_matches_the_scalar_function():
+    rng = random.Random(4)
+    cases = [{name: rng.choice(values) for name, values in CHOICES.items()} for _ in range(3000)]
+    columns = {name: np.array([case[name] for case in cases], dtype=object) for name in CHOICES}
+    results = determine_car_payments(**columns)
+    for i, case in enumerate(cases):
+        expected = scalar(case)
+        for values, value in zip(results, expected):
+            assert values[i] == value or (math.isnan(values[i]) and math.isnan(value)), case
+    # Enough of every outcome to mean something.
+    failed = np.isnan(results[0])
+    assert 100 < failed.sum() < 2900
+
+def test_grid_matches_the_scalar_function():
+    grid = financing_grid(purchase_price=[20000, 30000.5], interest_rate=[0.0, 0.031, 0.1], loan_term=[3, 5],
+                          model_year=2020, used_flag=False)
+    assert grid['total_cost'].shape == (2, 3, 2)
+    for index in np.ndindex(grid['total_cost'].shape):
+        expected = scalar({'purchase_price': float(grid['purchase_price'][index]),
+                           'interest_rate': float(grid['interest_rate'][index]),
+                           'loan_term': int(grid['loan_term'][index]), 'model_year': 2020, 'used_flag': False})
+        actual = (grid['total_cost'][index], grid['monthly_payment'][index], grid['monthly_amortized_cost'][index])
+        assert np.array_equal(actual, expected, equal_nan=True)
+
+def test_round_cents_matches_round():
+    rng = random.Random(9)
+    values = [0.005, 1.005, 2.675, -2.675, 0.125, 1e15 + 0.5, 2.0 ** 53, -0.0, math.nan, math.inf]
+    # Half cents and their neighbours, where scaling by 100 rounds either way.
+    for _ in range(20000):
+        value = rng.randrange(-10 ** 8, 10 ** 8) / 100 + 0.005
+        values.extend([value, math.nextafter(value, math.inf), math.nextafter(value, -math.inf)])
+    values.extend(rng.uniform(-1e6, 1e6) for _ in range(5000))
+    rounded = round_cents(values)
+    for value, result in zip(values, rounded.tolist()):
+        assert result == round(value, 2) or (math.isnan(value) and math.isnan(result)), value
+    assert round_cents(np.array([[1.005, 2.675]])).shape == (1, 2)
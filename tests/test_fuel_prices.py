@@ -0,0 +1,99 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import fuel_prices
+from fuel_prices import HTTPPriceProvider
+
+class Feed(BaseHTTPRequestHandler):
+    # Prices states from server.table, or answers server.status instead of 200.
+    def do_POST(self):
+        keys = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['prices']
+        self.server.requests.append([key['state'] for key in keys])
+        if self.server.status != 200:
+            self.send_response(self.server.status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        payload = json.dumps({'prices': [self.server.table.get(key['state']) for key in keys]}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+class Fallback:
+    def prices(self, keys):
+        return [1.0] * len(keys)
+
+@pytest.fixture
+def feed():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Feed)
+    server.requests, server.status = [], 200
+    server.table = {'California': 4.89, 'Texas': 2.99, 'Ohio': 3.19}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(fuel_prices.time, 'monotonic', lambda: now[0])
+    return now
+
+def provider(feed, **options):
+    return HTTPPriceProvider(f"http://127.0.0.1:{feed.server_address[1]}/prices", fallback=Fallback(), **options)
+
+def keys(*states):
+    return [(state, 'Regular', '2024-06-15') for state in states]
+
+def test_prices_are_cached_until_the_ttl_expires(feed, clock):
+    prices = provider(feed, ttl=60)
+    assert prices.prices(keys('CA', 'TX', 'CA')) == [4.89, 2.99, 4.89]
+    clock[0] += 59
+    feed.table['California'] = 5.09
+    assert prices.prices(keys('CA')) == [4.89]
+    assert feed.requests == [['California', 'Texas']]
+    clock[0] += 2
+    assert prices.prices(keys('CA')) == [5.09]
+    assert feed.requests[1:] == [['California']]
+    prices.close()
+
+def test_least_recently_used_keys_are_evicted(feed, clock):
+    prices = provider(feed, max_entries=2)
+    prices.prices(keys('CA', 'TX'))
+    prices.prices(keys('CA'))  # Texas is now the least recently used
+    prices.prices(keys('OH'))
+    assert prices.prices(keys('CA', 'TX', 'OH')) == [4.89, 2.99, 3.19]
+    assert feed.requests == [['California', 'Texas'], ['Ohio'], ['Texas']]
+    prices.close()
+
+def test_misses_and_failures_fall_back_and_are_cached_briefly(feed, clock):
+    prices = provider(feed, negative_ttl=10, max_failures=2, retry_after=30)
+    assert prices.prices(keys('CA', 'NV')) == [4.89, 1.0]  # Nevada is not in the feed
+    assert prices.prices(keys('NV')) == [1.0]
+    assert feed.requests == [['California', 'Nevada']]
+
+    feed.status = 503
+    clock[0] += 11
+    assert prices.prices(keys('NV')) == [1.0]
+    assert prices.prices(keys('NV')) == [1.0]  # the failure is cached as a miss
+    assert len(feed.requests) == 2
+    clock[0] += 11
+    assert prices.prices(keys('NV', 'TX')) == [1.0, 1.0]
+    assert len(feed.requests) == 3
+    # Two failures in a row: the feed is left alone, even for keys never asked for.
+    assert prices.prices(keys('OH')) == [1.0]
+    assert len(feed.requests) == 3
+    assert prices.prices(keys('CA')) == [4.89]  # still cached
+
+    feed.status = 200
+    clock[0] += 30
+    assert prices.prices(keys('OH', 'TX')) == [3.19, 2.99]
+    assert len(feed.requests) == 4 and prices.failures == 0
+    prices.close()
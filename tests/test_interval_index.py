@@ -0,0 +1,115 @@
+import random
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from interval_index import IntervalIndex, find_duplicates, merge_overlapping, overlap_groups, segments_between
+from time_utils import MISSING_TIME
+from timeline import TimelineBuilder
+
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+MINUTE = 60000
+START_MS = int(START.timestamp() * 1000)
+
+def iso(minutes):
+    return (START + timedelta(minutes=minutes)).isoformat(timespec='milliseconds')
+
+@pytest.fixture(scope='module')
+def va():
+    # Short entries on a crowded timeline, so that overlaps, copies, touching
+    # ends and zero-length entries all come up, and a few missing times.
+    rng = random.Random(11)
+    builder = TimelineBuilder()
+    for _ in range(400):
+        start = rng.randrange(0, 600)
+        end = start + rng.choice([0, 1, 5, 10, 30, 90])
+        entry = {'startTime': iso(start) if rng.random() > 0.03 else None,
+                 'endTime': iso(end) if rng.random() > 0.03 else None}
+        if rng.random() < 0.5:
+            entry.update({'semanticType': 'activity', 'topCandidateType': rng.choice(['WALKING', 'IN_BUS']),
+                          'activityProbability': rng.random()})
+        else:
+            entry.update({'semanticType': 'HOME', 'placeId': rng.choice(['a', 'b']),
+                          'hierarchyLevel': rng.choice([0, 1]), 'visitProbability': rng.random()})
+        builder.append(entry)
+    return builder.build()
+
+def brute_overlapping(va, start, end):
+    return [i for i in range(len(va)) if va.start_time[i] != MISSING_TIME and va.end_time[i] != MISSING_TIME
+            and va.start_time[i] < end and va.end_time[i] > start]
+
+def windows():
+    rng = random.Random(5)
+    for _ in range(300):
+        start = START_MS + rng.randrange(-60, 700) * MINUTE
+        yield start, start + rng.choice([0, 1, 7, 60, 300]) * MINUTE
+
+def test_overlapping_matches_a_scan(va):
+    index = IntervalIndex.from_timeline(va)
+    for start, end in windows():
+        rows = index.overlapping(start, end)
+        assert sorted(rows.tolist()) == brute_overlapping(va, start, end)
+        assert (np.diff(va.start_time[rows]) >= 0).all()
+        assert index.count_overlapping(start, end) == (len(rows) if end > start else 0)
+        inside = [i for i in range(len(va)) if va.start_time[i] != MISSING_TIME and va.end_time[i] != MISSING_TIME
+                  and va.start_time[i] >= start and va.end_time[i] <= end]
+        assert sorted(index.containing(start, end).tolist()) == inside
+        assert sorted(index.at(start).tolist()) == brute_overlapping(va, start, start + 1)
+
+def test_open_and_iso_bounds(va):
+    index = IntervalIndex.from_timeline(va)
+    timed = int(((va.start_time != MISSING_TIME) & (va.end_time != MISSING_TIME)).sum())
+    assert len(index) == timed and len(index.overlapping()) == timed
+    assert index.overlapping("2024-03-01T02:00:00Z").tolist() == index.overlapping(START_MS + 120 * MINUTE).tolist()
+    assert index.overlapping(end="2024-02-29T16:00:00-08:00").tolist() == \
+           index.overlapping(None, START_MS).tolist()
+    assert len(segments_between(va, START + timedelta(hours=1), START + timedelta(hours=2))) == \
+           len(brute_overlapping(va, START_MS + 60 * MINUTE, START_MS + 120 * MINUTE))
+
+def brute_groups(va):
+    # Union-find over pairs with the same key that overlap or are exact copies.
+    parent = list(range(len(va)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    keys = list(zip(va.kind.tolist(), va.hierarchy_level.tolist(), va.top_candidate_type.tolist(),
+                    va.place_id.tolist()))
+    starts, ends = va.start_time.tolist(), va.end_time.tolist()
+    timed = [i for i in range(len(va)) if starts[i] != MISSING_TIME and ends[i] != MISSING_TIME]
+    for a in timed:
+        for b in timed:
+            if a < b and keys[a] == keys[b]:
+                same = starts[a] == starts[b] and ends[a] == ends[b]
+                if same or (starts[a] < ends[b] and starts[b] < ends[a]):
+                    parent[find(a)] = find(b)
+    return [find(i) for i in range(len(va))]
+
+def partition(labels):
+    groups = {}
+    for i, label in enumerate(labels):
+        groups.setdefault(label, set()).add(i)
+    return sorted(map(sorted, groups.values()))
+
+def test_overlap_groups_match_union_find(va):
+    assert partition(overlap_groups(va).tolist()) == partition(brute_groups(va))
+
+def test_merge_keeps_the_most_probable_entry_over_the_group_span(va):
+    groups = partition(brute_groups(va))
+    merged, removed = merge_overlapping(va)
+    assert removed == len(va) - len(groups) and len(merged) == len(groups)
+    spans = {}
+    for group in groups:
+        timed = all(va.start_time[i] != MISSING_TIME and va.end_time[i] != MISSING_TIME for i in group)
+        best = max(group, key=lambda i: (va.probability[i], i))
+        spans[best] = (min(va.start_time[i] for i in group), max(va.end_time[i] for i in group)) if timed else \
+                      (va.start_time[best], va.end_time[best])
+    # The kept entries stay in their original order.
+    for row, best in enumerate(sorted(spans)):
+        assert (merged.start_time[row], merged.end_time[row]) == spans[best]
+        assert merged.probability[row] == va.probability[best] and merged.place_id[row] == va.place_id[best]
+
+def test_find_duplicates(va):
+    copies = va.take(np.array([0, 1, 0, 2, 1]))
+    assert find_duplicates(copies).tolist() == [False, False, True, False, True]
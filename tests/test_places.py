@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from aggregation import aggregate
+from emissions_calculator import trip_fuel_prices
+from places import PlaceIndex
+from time_utils import MISSING_TIME
+from timeline import VISIT
+
+def brute_routes(va):
+    # Walks the timeline: each trip goes from the last top-level visit before it
+    # to the first one after it.
+    trips = va.where('top_candidate_type', 'IN_PASSENGER_VEHICLE')
+    prices = dict(zip(np.flatnonzero(trips).tolist(),
+                      trip_fuel_prices(va.start_lat[trips], va.start_lng[trips]).tolist()))
+    routes, origin, pending = {}, None, []
+    for i in range(len(va)):
+        if va.kind[i] == VISIT and va.hierarchy_level[i] <= 0:
+            place = va.categories['place_id'][va.place_id[i]] if va.place_id[i] >= 0 else None
+            if origin is not None and place is not None and pending:
+                route = routes.setdefault((origin, place), [0, 0.0, 0.0])
+                for trip in pending:
+                    meters = float(np.nan_to_num(va.distance[trip]))
+                    route[0] += 1
+                    route[1] += meters
+                    route[2] += meters * prices[trip]
+            origin, pending = place, []
+        elif trips[i]:
+            pending.append(i)
+    return routes
+
+def chunked(va, size):
+    return (va.take(slice(start, start + size)) for start in range(0, len(va), size))
+
+@pytest.mark.parametrize('size', [1, 7, 250, 100000])
+def test_routes_match_a_walk_of_the_timeline(timeline, size):
+    va, _ = timeline
+    index = aggregate(chunked(va, size), {'places': PlaceIndex()})['places']
+    expected = brute_routes(va)
+    assert index.routes.keys() == expected.keys()
+    for pair, (trips, meters, cost_meters) in expected.items():
+        assert index.routes[pair][0] == trips
+        assert index.routes[pair][1:] == pytest.approx([meters, cost_meters])
+    for origin in {origin for origin, _ in expected}:
+        assert index.trips_from(origin)['trips'] == sum(value[0] for pair, value in expected.items() if pair[0] == origin)
+    matrix = index.matrix()
+    assert matrix['trips'].sum() == sum(value[0] for value in expected.values())
+    assert [(matrix['place_ids'][o], matrix['place_ids'][d]) for o, d in zip(matrix['origin'], matrix['destination'])] \
+           == sorted(expected, key=lambda pair: (matrix['place_ids'].index(pair[0]), matrix['place_ids'].index(pair[1])))
+
+def test_place_visits(timeline):
+    va, _ = timeline
+    index = aggregate(chunked(va, 97), {'places': PlaceIndex()})['places']
+    for place_id in ('ChIJhome', 'ChIJwork'):
+        code = va.categories['place_id'].index(place_id)
+        rows = np.flatnonzero((va.kind == VISIT) & (va.place_id == code) & (va.start_time != MISSING_TIME) &
+                              (va.end_time != MISSING_TIME))
+        place = index.place(place_id)
+        assert place['visits'] == len(rows)
+        assert place['dwell_hours'] == pytest.approx((va.end_time[rows] - va.start_time[rows]).sum() / 3600000)
+        starts, ends = index.visits(place_id)
+        assert sorted(starts.tolist()) == sorted(va.start_time[rows].tolist())
+    assert index.top_places(1)[0]['placeId'] == 'ChIJhome'
+    assert index.place('nowhere') is None and index.route('nowhere', 'ChIJhome')['trips'] == 0
@@ -0,0 +1,38 @@
+from datetime import datetime
+import pytest
+import reference_data
+from car_cost_calculator import calculate_car_cost
+from reference_data import build_price_index, deflate, inflation_rates, price_index
+
+def loop_deflated(base_cost, year, inflation_data):
+    # The per-year loop calculate_car_cost used before the price index.
+    cost = base_cost
+    for y in range(datetime.now().year - 1, year - 1, -1):
+        if y in inflation_data:
+            cost /= (1 + inflation_data[y])
+    return round(cost, 2)
+
+def test_car_cost_matches_the_yearly_loop():
+    rates = inflation_rates()
+    for year in range(1929, datetime.now().year + 1):
+        for used_flag, base_cost in ((True, 25571), (False, 48644)):
+            assert calculate_car_cost(year, used_flag, price_index()) == \
+                   pytest.approx(loop_deflated(base_cost, year, rates), abs=0.01)
+
+def test_deflate_with_gaps_in_the_table():
+    index = build_price_index({2000: 0.1, 2002: 0.5}, last_year=2004)
+    assert index == pytest.approx({2000: 1.0, 2001: 1.1, 2002: 1.1, 2003: 1.65, 2004: 1.65, 2005: 1.65})
+    assert deflate(165, 2003, 2000, index) == pytest.approx(100)
+    assert deflate(100, 2000, 2004, index) == pytest.approx(165)
+    assert build_price_index(None) is None
+
+def test_tables_load_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(reference_data, 'load_inflation_data', lambda: calls.append(1) or {2020: 0.0})
+    reference_data.clear()
+    try:
+        assert inflation_rates() is inflation_rates()
+        price_index()
+        assert len(calls) == 1
+    finally:
+        reference_data.clear()
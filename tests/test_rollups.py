@@ -0,0 +1,46 @@
+import calendar
+from datetime import date, timedelta
+import numpy as np
+from aggregation import aggregate
+from rollups import Rollup, bucket_bounds, bucket_keys, bucket_labels
+
+EPOCH = date(1970, 1, 1)
+
+def test_iso_weeks_across_year_boundaries():
+    # Every day from late 2014 to early 2027, which takes in 53-week years
+    # (2015, 2020, 2026) and years whose week 1 starts in December.
+    dates = [date(2014, 12, 20) + timedelta(days=n) for n in range(4400)]
+    days = np.array([(day - EPOCH).days for day in dates])
+    keys = bucket_keys(days, 'week')
+    mondays = [day - timedelta(days=day.weekday()) for day in dates]
+    assert keys.tolist() == [(monday - EPOCH).days for monday in mondays]
+    labels = bucket_labels(keys, 'week')
+    assert labels == [f"{day.isocalendar()[0]}-W{day.isocalendar()[1]:02d}" for day in dates]
+    assert bucket_labels(bucket_keys([(date(2021, 1, 3) - EPOCH).days], 'week'), 'week') == ['2020-W53']
+    assert bucket_labels(bucket_keys([(date(2024, 12, 30) - EPOCH).days], 'week'), 'week') == ['2025-W01']
+
+def test_month_keys():
+    dates = [date(1969, 11, 1) + timedelta(days=n) for n in range(0, 25000, 13)]
+    days = np.array([(day - EPOCH).days for day in dates])
+    keys = bucket_keys(days, 'month')
+    assert keys.tolist() == [day.year * 12 + day.month - 1 for day in dates]
+    starts, spans = bucket_bounds(keys, 'month')
+    assert starts.tolist() == [(day.replace(day=1) - EPOCH).days for day in dates]
+    assert spans.tolist() == [calendar.monthrange(day.year, day.month)[1] for day in dates]
+    assert bucket_labels(keys[:2], 'month') == ['1969-11', '1969-11']
+    assert bucket_labels([2024 * 12 + 1], 'month') == ['2024-02']
+
+def test_rollup_retract_undoes_update(timeline):
+    va, _ = timeline
+    rollup = Rollup('week')
+    aggregate([va], {'weeks': rollup})
+    before = {key: list(value) for key, value in rollup.buckets.items()}
+    extra = va.take(slice(0, 50))
+    rollup.update(extra)
+    rollup.retract(extra)
+    assert rollup.buckets.keys() == before.keys()
+    for key, value in before.items():
+        assert np.allclose(rollup.buckets[key], value)
+    result = rollup.result()
+    assert result['entries'].sum() == len(va)
+    assert result['trips'].sum() == int(va.where('top_candidate_type', 'IN_PASSENGER_VEHICLE').sum())
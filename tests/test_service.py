@@ -0,0 +1,55 @@
+import asyncio
+import json
+from data_processing import stream_segments
+from json_utils import jsonable
+from report import stream_report
+from service import ReportService
+
+async def post(port, target, body, length=None):
+    # `length` over len(body) sends a Content-Length the upload falls short of.
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    length = len(body) if length is None else length
+    writer.write(f"POST {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {length}\r\n\r\n".encode('latin-1')
+                 + body)
+    await writer.drain()
+    if length > len(body):
+        writer.write_eof()
+    response = await reader.read()
+    writer.close()
+    head, payload = response.split(b'\r\n\r\n', 1)
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split(' ')[1]), headers, json.loads(payload)
+
+def test_reports_run_in_the_worker_pool(export, tmp_path):
+    with open(export, 'rb') as file:
+        body = file.read()
+    spool = tmp_path / 'spool'
+    spool.mkdir()
+
+    async def scenario():
+        service = ReportService(workers=2, spool_dir=str(spool))
+        server = await service.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            responses = await asyncio.gather(*[post(port, '/report?vehicle_mpg=30', body) for _ in range(3)])
+            other = await post(port, '/report?vehicle_mpg=40', body)
+            truncated = await post(port, '/report', body[:len(body) // 2])
+            cut_off = await post(port, '/report', body[:len(body) // 2], length=len(body))
+            return responses, other, truncated, cut_off, service.health()
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.close()
+
+    responses, other, truncated, cut_off, health = asyncio.run(scenario())
+    expected = json.loads(json.dumps(stream_report(stream_segments(export), {'vehicle_mpg': 30}), default=jsonable))
+    for status, headers, report in responses:
+        assert status == 200
+        assert report == expected
+        assert headers['X-Report-Key'] == responses[0][1]['X-Report-Key']
+    assert other[0] == 200 and other[1]['X-Report-Key'] != responses[0][1]['X-Report-Key']
+    assert truncated[0] == 422 and 'not a complete timeline export' in truncated[2]['error']
+    assert cut_off[0] == 422 and 'ended early' in cut_off[2]['error']
+    assert health['workers'] == 2 and health['served'] == 4
+    assert list(spool.iterdir()) == []  # the spooled uploads are removed
@@ -0,0 +1,71 @@
+import json
+import math
+import random
+import numpy as np
+import pytest
+import reference_data
+from state_index import StateIndex
+
+def star(x, y, radius, points=7):
+    # A concave ring around (x, y), as lng, lat pairs.
+    return [(x + radius * (1 if i % 2 else 0.4) * math.cos(math.pi * i / points),
+             y + radius * (1 if i % 2 else 0.4) * math.sin(math.pi * i / points)) for i in range(2 * points)]
+
+def square(x, y, size):
+    return [(x, y), (x + size, y), (x + size, y + size), (x, y + size)]
+
+# Two stars for state 0, one of them closed explicitly; a square with a
+# square hole for state 1; a triangle for state 2 inside that hole. No vertex
+# falls on a cell center, where the even-odd rule is ambiguous.
+POLYGONS = [(0, star(-120.3, 37.2, 1.3)), (0, star(-116.0, 35.0, 0.6) + star(-116.0, 35.0, 0.6)[:1]),
+            (1, square(-119.1, 33.05, 2.0)), (1, square(-118.6, 33.45, 1.0)),
+            (2, [(-118.45, 33.6), (-117.7, 33.6), (-118.05, 34.3)])]
+
+def ray_casting(lat, lng):
+    # Even-odd rule per state with a ray to the east, over every edge.
+    inside = []
+    for state in range(3):
+        crossings = 0
+        for number, ring in POLYGONS:
+            if number != state:
+                continue
+            for (x1, y1), (x2, y2) in zip(ring, ring[1:] + ring[:1]):
+                if (y1 <= lat) != (y2 <= lat) and lng < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+                    crossings += 1
+        if crossings % 2:
+            inside.append(state)
+    return inside[-1] if inside else -1
+
+@pytest.mark.parametrize('cell_degrees', [0.25, 0.07, 3.0])
+def test_lookup_matches_ray_casting(cell_degrees):
+    index = StateIndex(['A', 'B', 'C'], POLYGONS, cell_degrees)
+    rng = random.Random(2)
+    lats = [rng.uniform(32.0, 39.0) for _ in range(3000)] + [np.nan, 37.2]
+    lngs = [rng.uniform(-122.0, -115.0) for _ in range(3000)] + [-120.3, np.nan]
+    states = index.lookup(lats, lngs)
+    assert states.tolist() == [ray_casting(lat, lng) for lat, lng in zip(lats[:-2], lngs[:-2])] + [-1, -1]
+    assert {0, 1, 2, -1} <= set(states.tolist())
+    assert index.lookup_names([37.2, 33.2, 34.0, 50.0], [-120.3, -118.8, -118.0, -100.0]).tolist() == \
+           ['A', 'B', 'C', None]
+
+def test_from_geojson(tmp_path):
+    features = [{'type': 'Feature', 'properties': {'NAME': 'A'},
+                 'geometry': {'type': 'MultiPolygon', 'coordinates': [[star(-120.3, 37.2, 1.3)],
+                                                                      [star(-116.0, 35.0, 0.6)]]}},
+                {'type': 'Feature', 'properties': {'NAME': 'B'},
+                 'geometry': {'type': 'Polygon', 'coordinates': [square(-119.1, 33.05, 2.0), square(-118.6, 33.45, 1.0)]}},
+                {'type': 'Feature', 'properties': {'NAME': 'Nowhere'}, 'geometry': {'type': 'Point', 'coordinates': [0, 0]}}]
+    path = tmp_path / 'states.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    index = StateIndex.from_geojson(str(path))
+    assert index.names == ['A', 'B']
+    assert index.lookup_names([37.2, 35.0, 33.2, 34.0], [-120.3, -116.0, -118.8, -118.0]).tolist() == \
+           ['A', 'A', 'B', None]
+
+def test_invalid_boundaries_warn_on_stderr(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(reference_data, 'DATA_DIR', str(tmp_path))
+    assert reference_data.load_state_index() is None
+    (tmp_path / reference_data.STATE_BOUNDARIES_FILE).write_text('{"features": 3}')
+    assert reference_data.load_state_index() is None
+    out, err = capsys.readouterr()
+    assert out == '' and err.startswith('Warning: ') and 'Error: Invalid state boundaries' in err
@@ -0,0 +1,36 @@
+import json
+from datetime import datetime
+from data_processing import DEFAULT_CUTOFF, process_data, stream_segments
+from synthetic import PLACES, generate_segments, write_export
+
+def test_same_seed_same_history():
+    first = list(generate_segments(300))
+    assert first == list(generate_segments(300))
+    # A longer export starts with the shorter one, as the timeline cache needs.
+    assert list(generate_segments(450))[:300] == first
+    assert list(generate_segments(300, seed=1)) != first
+
+def test_segments_follow_one_another(tmp_path):
+    path = tmp_path / 'export.json'
+    write_export(path, 400)
+    with open(path, encoding='utf-8') as file:
+        segments = json.load(file)['semanticSegments']
+    assert len(segments) == 400
+    assert datetime.fromisoformat(segments[0]['startTime']) > datetime.fromisoformat(DEFAULT_CUTOFF)
+    previous_end = None
+    for segment in segments:
+        start, end = datetime.fromisoformat(segment['startTime']), datetime.fromisoformat(segment['endTime'])
+        assert start <= end
+        if 'timelinePath' in segment:
+            # Recorded along the activity just before it.
+            assert segment['startTime'] == previous['startTime'] and 'activity' in previous
+            assert 2 <= len(segment['timelinePath'])
+            continue
+        if previous_end is not None:
+            assert start == previous_end
+        if 'visit' in segment:
+            assert segment['visit']['topCandidate']['placeId'] in PLACES
+        previous, previous_end = segment, end
+    # Nothing is lost to the cutoff.
+    va, timelinePaths = process_data(stream_segments(str(path)))
+    assert len(va) + len(timelinePaths) == 400
@@ -0,0 +1,75 @@
+import random
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from data_processing import add_duration_to_va, process_data
+from time_utils import MISSING_TIME, days_from_civil, parse_timestamps
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def one_by_one(values):
+    # The per-row path parse_timestamps replaced.
+    times, offsets = [], []
+    for value in values:
+        if not isinstance(value, str) or not value:
+            times.append(MISSING_TIME)
+            offsets.append(0)
+            continue
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        times.append((dt - EPOCH) // timedelta(milliseconds=1))
+        offsets.append(int(dt.utcoffset().total_seconds() // 60))
+    return times, offsets
+
+def check(values):
+    times, offsets = parse_timestamps(values)
+    assert (times.tolist(), offsets.tolist()) == one_by_one(values)
+
+def test_offsets_z_and_fractions():
+    values = ["2024-02-01T06:00:00.000-07:00", "2024-02-01T06:00:00+05:30", "2024-02-01T13:00:00Z",
+              "2024-02-01T13:00:00", "2024-02-01T13:00:00.5Z", "2024-02-01T13:00:00.123456+00:00",
+              "1969-12-31T23:59:59.999+01:00"]
+    times, offsets = parse_timestamps(values)
+    assert times[0] == times[2] == times[3] == 1706792400000
+    assert times[1] == 1706747400000 and offsets[1] == 330
+    assert offsets[0] == -420 and offsets[2] == 0
+    assert times[4] == 1706792400500 and times[5] == 1706792400123
+    check(values)
+
+def test_missing_values():
+    times, offsets = parse_timestamps([None, "2024-02-01T06:00:00.000-07:00", '', np.nan])
+    assert times.tolist()[0] == times.tolist()[2] == times.tolist()[3] == MISSING_TIME
+    assert offsets.tolist() == [0, -420, 0, 0]
+    assert parse_timestamps([])[0].size == 0
+
+def test_matches_fromisoformat_in_bulk():
+    rng = random.Random(0)
+    fixed, mixed = [], []
+    for _ in range(2000):
+        dt = datetime(1990, 1, 1, tzinfo=timezone(timedelta(minutes=rng.randrange(-720, 841, 15)))) + \
+             timedelta(days=rng.randrange(20000), milliseconds=rng.randrange(86400000))
+        fixed.append(dt.isoformat(timespec='milliseconds'))
+        mixed.append(dt.isoformat(timespec=rng.choice(['seconds', 'milliseconds', 'microseconds'])))
+    check(fixed)
+    check(mixed + [None])
+    check([value.replace('+00:00', 'Z') for value in mixed])
+
+def test_days_from_civil():
+    days = days_from_civil(np.array([1970, 2000, 2024, 1969]), np.array([1, 2, 2, 12]), np.array([1, 29, 29, 31]))
+    assert days.tolist() == [0, 11016, 19782, -1]
+
+def test_missing_times_in_the_timeline():
+    segments = [
+        {'startTime': "2024-03-01T08:00:00.000-08:00", 'endTime': "2024-03-01T08:30:00.000-08:00",
+         'activity': {'distanceMeters': 1000, 'topCandidate': {'type': 'WALKING'}}},
+        {'startTime': "2024-03-01T08:30:00.000-08:00",
+         'visit': {'topCandidate': {'placeId': 'p', 'semanticType': 'HOME'}}},
+    ]
+    va, _ = process_data(segments)
+    va = add_duration_to_va(va)
+    assert va.end_time[1] == MISSING_TIME
+    assert va.duration.tolist() == [1800, MISSING_TIME]
+    row = va.row(1)
+    assert row['startTime'] == "2024-03-01T08:30:00.000-08:00"
+    assert np.isnan(row['endTime']) and 'duration' not in row
+    assert row['day-of-week'] == 'Friday'
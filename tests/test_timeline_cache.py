@@ -0,0 +1,69 @@
+import json
+import numpy as np
+import pytest
+import timeline_cache
+from data_processing import SegmentReader, process_data, stream_segments
+from synthetic import write_export
+from timeline_cache import load_timeline
+
+@pytest.fixture
+def reads(monkeypatch):
+    # The offset of every SegmentReader load_timeline starts.
+    offsets = []
+
+    class Reader(SegmentReader):
+        def __init__(self, filename, offset=0, chunk_size=1 << 16):
+            offsets.append(offset)
+            super().__init__(filename, offset, chunk_size)
+
+    monkeypatch.setattr(timeline_cache, 'SegmentReader', Reader)
+    return offsets
+
+def assert_same(loaded, path):
+    va, timelinePaths = loaded
+    expected_va, expected_paths = process_data(stream_segments(str(path)), None)
+    assert json.dumps([va.row(i) for i in range(len(va))]) == \
+           json.dumps([expected_va.row(i) for i in range(len(expected_va))])
+    for name in expected_paths.paths:
+        np.testing.assert_array_equal(timelinePaths.paths[name], expected_paths.paths[name])
+    for name in expected_paths.points:
+        np.testing.assert_array_equal(timelinePaths.points[name], expected_paths.points[name])
+
+def test_warm_rerun_reads_the_cache(tmp_path, reads):
+    path = tmp_path / 'export.json'
+    write_export(path, 500)
+    first = load_timeline(str(path), None, str(tmp_path / 'cache'))
+    second = load_timeline(str(path), None, str(tmp_path / 'cache'))
+    assert reads == [0]
+    assert isinstance(second[0].start_time, np.memmap)
+    assert_same(second, path)
+    assert len(first[0]) == len(second[0])
+
+def test_grown_export_resumes_from_the_last_segment(tmp_path, reads):
+    path = tmp_path / 'export.json'
+    write_export(path, 500)
+    load_timeline(str(path), None, str(tmp_path / 'cache'))
+    write_export(path, 600)  # the same segments and 100 more
+    grown = load_timeline(str(path), None, str(tmp_path / 'cache'))
+    assert reads[0] == 0 and reads[1] > 0 and len(reads) == 2
+    assert_same(grown, path)
+    # The resumed cache resumes again.
+    write_export(path, 650)
+    assert_same(load_timeline(str(path), None, str(tmp_path / 'cache')), path)
+    assert len(reads) == 3 and reads[2] > reads[1]
+
+def test_changed_head_parses_again(tmp_path, reads):
+    path = tmp_path / 'export.json'
+    write_export(path, 500)
+    load_timeline(str(path), None, str(tmp_path / 'cache'))
+    write_export(path, 600, seed=1)  # grown, but not from the same history
+    assert_same(load_timeline(str(path), None, str(tmp_path / 'cache')), path)
+    assert reads == [0, 0]
+
+def test_other_cutoff_parses_again(tmp_path, reads):
+    path = tmp_path / 'export.json'
+    write_export(path, 500)
+    load_timeline(str(path), None, str(tmp_path / 'cache'))
+    va, _ = load_timeline(str(path), "2024-02-10T00:00:00Z", str(tmp_path / 'cache'))
+    assert reads == [0, 0]
+    assert va.start_time.min() >= 1707523200000
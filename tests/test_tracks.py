@@ -0,0 +1,61 @@
+import math
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from data_processing import process_data
+from tracks import EARTH_RADIUS_METERS, derive_miles_correction, detect_stops, haversine, path_distances, track_steps
+
+START = datetime(2024, 3, 1, 8, tzinfo=timezone(timedelta(hours=-8)))
+
+def iso(minutes):
+    return (START + timedelta(minutes=minutes)).isoformat(timespec='milliseconds')
+
+def path_segment(points):
+    # points: (minutes, lat, lng)
+    return {'startTime': iso(points[0][0]), 'endTime': iso(points[-1][0]),
+            'timelinePath': [{'point': f"{lat:.6f}°, {lng:.6f}°", 'time': iso(minutes)} for minutes, lat, lng in points]}
+
+def test_haversine():
+    assert haversine(0, 0, 1, 0) == pytest.approx(2 * math.pi * EARTH_RADIUS_METERS / 360)
+    assert haversine(0, 0, 0, 180) == pytest.approx(math.pi * EARTH_RADIUS_METERS)
+    lat = np.array([37.8044, 37.79, 0.0])
+    lng = np.array([-122.2712, -122.4, 0.0])
+    assert haversine(lat, lng, lat[::-1], lng[::-1]).tolist() == pytest.approx(haversine(lat[::-1], lng[::-1], lat, lng).tolist())
+    assert haversine(lat, lng, lat, lng).tolist() == [0, 0, 0]
+
+def test_stops_stay_within_a_path():
+    segments = [
+        # Drives 0.01 degrees a minute, stands still for three minutes, drives on.
+        path_segment([(0, 37.0, -122.0), (1, 37.01, -122.0), (2, 37.02, -122.0), (3, 37.02, -122.0),
+                      (4, 37.02, -122.0), (5, 37.02, -122.0), (6, 37.03, -122.0)]),
+        # Still for the last minute of one path and the first of the next: not a
+        # stop, as the three still minutes would be if steps crossed paths.
+        path_segment([(10, 37.5, -122.0), (11, 37.6, -122.0), (12, 37.6, -122.0)]),
+        path_segment([(13, 37.6, -122.0), (14, 37.6, -122.0), (15, 37.7, -122.0)]),
+    ]
+    _, timelinePaths = process_data(segments)
+    steps = track_steps(timelinePaths)
+    assert steps['path'].tolist() == [0] * 6 + [1] * 2 + [2] * 2
+    assert steps['seconds'].tolist() == [60.0] * 10
+    lat, lng = timelinePaths.points['lat'], timelinePaths.points['lng']  # float32
+    assert steps['meters'][0] == pytest.approx(haversine(lat[0], lng[0], lat[1], lng[1]))
+    assert steps['meters'][3] == 0
+
+    stops = detect_stops(timelinePaths)
+    assert stops['path'].tolist() == [0]
+    assert stops['seconds'].tolist() == [180.0]
+    assert stops['start_time'][0] == int((START + timedelta(minutes=2)).timestamp() * 1000)
+    assert stops['end_time'][0] == int((START + timedelta(minutes=5)).timestamp() * 1000)
+    assert stops['lat'][0] == pytest.approx(37.02)
+    assert detect_stops(timelinePaths, min_seconds=60)['path'].tolist() == [0, 1, 2]
+
+def test_path_distances_and_miles_correction(timeline):
+    va, timelinePaths = timeline
+    lat, lng = timelinePaths.points['lat'].astype(np.float64), timelinePaths.points['lng'].astype(np.float64)
+    expected, start = [], 0
+    for count in timelinePaths.paths['point_count'].tolist():
+        expected.append(sum(haversine(lat[i], lng[i], lat[i + 1], lng[i + 1]) for i in range(start, start + count - 1)))
+        start += count
+    assert path_distances(timelinePaths).tolist() == pytest.approx(expected)
+    # Synthetic trips report 1.2-1.5 times the straight line their path follows.
+    assert 1 / 1.5 < derive_miles_correction(va, timelinePaths) < 1 / 1.2 * 1.05
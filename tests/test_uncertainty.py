@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import uncertainty
+from uncertainty import sample_miles, trip_probabilities, uncertainty_report
+
+FIXED = {name: ('uniform', 1.0, 1.0) for name in uncertainty.DEFAULT_DISTRIBUTIONS}
+
+def test_sample_miles():
+    rng = np.random.default_rng(0)
+    meters = np.array([1600.0, 3200.0, 16000.0])
+    assert sample_miles(meters, np.ones(3), 5, rng).tolist() == [13.0] * 5
+    assert sample_miles(meters, np.zeros(3), 5, rng).tolist() == [0.0] * 5
+    # Across batches, each trip is kept about as often as its probability.
+    draws = sample_miles(meters, np.array([0.5, 0.0, 0.25]), 3 * uncertainty.DRAW_BATCH + 5, rng, 2.0)
+    assert set(np.round(draws, 6).tolist()) <= {0.0, 2.0, 20.0, 22.0}
+    assert draws.mean() == pytest.approx(0.5 * 2 + 0.25 * 20, rel=0.1)
+
+def test_certain_trips_give_the_point_estimate(timeline, monkeypatch):
+    va, _ = timeline
+    monkeypatch.setattr(uncertainty, 'trip_probabilities', lambda va, rows: np.ones(int(rows.sum())))
+    report = uncertainty_report(va, draws=50, distributions=FIXED, seed=1)
+    trips = va.where('top_candidate_type', 'IN_PASSENGER_VEHICLE')
+    miles = va.distance[trips].sum() / 1000 / 1.6
+    for figure in ('mean', 'median', 'low', 'high'):
+        assert report['miles_driven'][figure] == pytest.approx(miles)
+        assert report['CO2_tons_released'][figure] == pytest.approx(miles / 24.4 * 11.14 * 0.001)
+
+def test_bands(timeline):
+    va, _ = timeline
+    report = uncertainty_report(va, {'vehicle_mpg': 30}, draws=2000, seed=3)
+    assert report == uncertainty_report(va, {'vehicle_mpg': 30}, draws=2000, seed=3)
+    for figures in report.values():
+        assert figures['low'] < figures['median'] < figures['high']
+    trips = va.where('top_candidate_type', 'IN_PASSENGER_VEHICLE')
+    expected = (va.distance[trips] * trip_probabilities(va, trips)).sum() / 1000 / 1.6
+    assert report['miles_driven']['mean'] == pytest.approx(expected, rel=0.02)
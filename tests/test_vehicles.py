@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from emissions_calculator import DEFAULT_STATE, calculate_emissions, determine_wear_costs
+from vehicles import (ELECTRICITY_PRICE, GRID_CO2_KG_PER_KWH, compare_timeline, compare_vehicles, rank_vehicles,
+                      vehicle_catalog, vehicle_matrix)
+
+CATALOG = vehicle_catalog([
+    {'name': 'sedan', 'fuel': 'Regular', 'mpg': 32, 'kerb_weight': 3100},
+    {'name': 'truck', 'fuel': 'Diesel', 'mpg': '18', 'kerb_weight': '5200'},
+    {'name': 'coupe', 'fuel': 'Premium', 'mpg': 26},
+    {'name': 'ev', 'fuel': 'Electric', 'kwh_per_mile': 0.28, 'kerb_weight': 4000},
+])
+PRICES = {'Regular': [4.0, 5.0, 4.5], 'Premium': [5.0, 6.0, 5.5], 'Diesel': [4.5, 5.5, 5.0]}
+MILES = [3.0, 12.5, 40.0]
+
+def test_matrix_matches_the_scalar_functions():
+    matrix = vehicle_matrix(MILES, PRICES, CATALOG)
+    for trip, miles in enumerate(MILES):
+        for vehicle, (fuel, mpg, kerb_weight) in enumerate([('Regular', 32, 3100), ('Diesel', 18, 5200),
+                                                            ('Premium', 26, 3500)]):
+            gallons, CO2kgs, mgs = calculate_emissions(miles, mpg, kerb_weight)
+            assert matrix['gallons_burned'][trip, vehicle] == pytest.approx(gallons)
+            assert matrix['CO2_kgs_released'][trip, vehicle] == pytest.approx(CO2kgs)
+            assert matrix['particulate_mgs_released'][trip, vehicle] == pytest.approx(mgs)
+            assert matrix['wear_cost'][trip, vehicle] == \
+                   pytest.approx(determine_wear_costs(miles, mpg, DEFAULT_STATE, PRICES[fuel][trip]))
+        # The electric car burns no gallons and pays for kWh at the electricity price.
+        kwh = miles * 0.28
+        assert matrix['gallons_burned'][trip, 3] == 0 and matrix['kwh_used'][trip, 3] == pytest.approx(kwh)
+        assert matrix['CO2_kgs_released'][trip, 3] == pytest.approx(kwh * GRID_CO2_KG_PER_KWH)
+        assert matrix['wear_cost'][trip, 3] == \
+               pytest.approx(determine_wear_costs(miles, 1 / 0.28, DEFAULT_STATE, ELECTRICITY_PRICE))
+
+def test_totals_collapse_to_the_weighted_price():
+    matrix = vehicle_matrix(MILES, PRICES, CATALOG)
+    weighted = {grade: float(np.dot(MILES, prices) / sum(MILES)) for grade, prices in PRICES.items()}
+    totals = compare_vehicles(sum(MILES), weighted, CATALOG)
+    for key, values in matrix.items():
+        assert totals[key] == pytest.approx(values.sum(axis=0))
+    ranks = rank_vehicles(totals, CATALOG, top=2)
+    assert ranks['cheapest'][0] == 'ev' and ranks['lowest_CO2'] == ['ev', 'sedan']
+
+def test_unknown_fuel():
+    with pytest.raises(ValueError):
+        vehicle_catalog([{'name': 'boat', 'fuel': 'Kerosene', 'mpg': 3}])
+
+def test_compare_timeline(timeline):
+    va, _ = timeline
+    comparison, ranks = compare_timeline([va], CATALOG, top=4)
+    assert comparison['gallons_burned'][1] / comparison['gallons_burned'][0] == pytest.approx(32 / 18)
+    assert sorted(ranks['cheapest']) == sorted(CATALOG['name'])
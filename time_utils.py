@@ -1,17 +1,158 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+MISSING_TIME = np.iinfo(np.int64).min
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MILLISECOND = timedelta(milliseconds=1)
 
 def find_min_max_dates(va):
     if not va:
         return None, None
-    
-    min_date_str = va[0].get('startTime')
-    max_date_str = va[-1].get('endTime')
-    
-    min_date = datetime.fromisoformat(min_date_str) if min_date_str else None
-    max_date = datetime.fromisoformat(max_date_str) if max_date_str else None
-    
+
+    min_date = to_datetime(va.start_time[0], va.start_offset[0])
+    max_date = to_datetime(va.end_time[-1], va.end_offset[-1])
+
     return min_date, max_date
 
+def to_datetime(ms, offset_minutes):
+    if ms == MISSING_TIME:
+        return None
+    tz = timezone(timedelta(minutes=int(offset_minutes)))
+    return datetime.fromtimestamp(int(ms) / 1000, tz)
+
+def parse_timestamps(values):
+    # Epoch milliseconds and UTC offsets in minutes of ISO-8601 strings;
+    # missing values are MISSING_TIME with a zero offset.
+    n = len(values)
+    times = np.full(n, MISSING_TIME, dtype=np.int64)
+    offsets = np.zeros(n, dtype=np.int16)
+    if n == 0:
+        return times, offsets
+
+    # Non-strings (None, NaN) are blanked first; converting them is slow.
+    if set(map(type, values)) != {str}:
+        values = [value if value.__class__ is str else '' for value in values]
+    chars = fixed = _fixed_width(values)
+    if fixed is None:
+        try:
+            raw = np.array(values, dtype='S')
+        except (UnicodeEncodeError, ValueError):
+            raw = np.array([value if value.isascii() else '' for value in values], dtype='S')
+        if raw.itemsize < 20:
+            raw = raw.astype('S20')
+        chars = raw.view(np.uint8).reshape(n, raw.itemsize)
+        length = np.char.str_len(raw)
+    else:
+        length = np.full(n, chars.shape[1])
+    width = chars.shape[1]
+    flat = chars.ravel()
+    row_start = np.arange(n) * width
+
+    def char_from_end(k):
+        if fixed is not None:
+            return chars[:, width - k].astype(np.int32)
+        return flat[row_start + np.maximum(length - k, 0)].astype(np.int32)
+
+    regular = (length >= 19) & (chars[:, 4] == 45) & (chars[:, 7] == 45) & (chars[:, 10] == 84) & \
+              (chars[:, 13] == 58) & (chars[:, 16] == 58)
+    # One contiguous row per character position keeps the arithmetic below fast.
+    digits = chars[:, :19].T.astype(np.int32) - 48
+    year = digits[0] * 1000 + digits[1] * 100 + digits[2] * 10 + digits[3]
+    month = digits[5] * 10 + digits[6]
+    day = digits[8] * 10 + digits[9]
+    seconds = (digits[11] * 10 + digits[12]) * 3600 + (digits[14] * 10 + digits[15]) * 60 + \
+              digits[17] * 10 + digits[18]
+
+    # Trailing "Z", "+HH:MM"/"-HH:MM", or nothing (treated as UTC).
+    sign_char = char_from_end(6)
+    has_offset = (length >= 25) & ((sign_char == 43) | (sign_char == 45)) & (char_from_end(3) == 58)
+    zone_start = np.where(has_offset, length - 6, np.where(char_from_end(1) == 90, length - 1, length))
+    tz_minutes = ((char_from_end(5) - 48) * 10 + char_from_end(4) - 48) * 60 + \
+                 (char_from_end(2) - 48) * 10 + char_from_end(1) - 48
+    tz_minutes = np.where(has_offset, np.where(sign_char == 45, -tz_minutes, tz_minutes), 0)
+
+    # Up to three fractional digits after the seconds give milliseconds.
+    millis = np.zeros(n, dtype=np.int32)
+    if width > 20:
+        has_fraction = chars[:, 19] == 46
+        for position, scale in ((20, 100), (21, 10), (22, 1)):
+            if position >= width:
+                break
+            present = has_fraction & (position < zone_start)
+            millis += np.where(present, (chars[:, position].astype(np.int32) - 48) * scale, 0)
+
+    local = (days_from_civil(year, month, day).astype(np.int64) * 86400 + seconds) * 1000 + millis
+    times[regular] = (local - tz_minutes * 60000)[regular]
+    offsets[regular] = tz_minutes[regular]
+
+    # Anything that does not match the fixed layout goes through fromisoformat;
+    # non-strings (None, NaN) are missing.
+    for i in np.flatnonzero(~regular).tolist():
+        if not values[i]:
+            continue
+        dt = datetime.fromisoformat(values[i])
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        times[i] = (dt - _EPOCH) // _MILLISECOND
+        offsets[i] = int(dt.utcoffset().total_seconds() // 60)
+    return times, offsets
+
+def parse_cutoff(cutoff):
+    # Accepts an ISO-8601 string, an aware datetime, epoch milliseconds, or None
+    # for no cutoff.
+    if cutoff is None:
+        return np.iinfo(np.int64).min
+    if isinstance(cutoff, str):
+        return int(parse_timestamps([cutoff])[0][0])
+    if hasattr(cutoff, 'timestamp'):
+        return int(cutoff.timestamp() * 1000)
+    return int(cutoff)
+
+def _fixed_width(values):
+    # Strings of the common length are parsed together as one byte matrix.
+    width = len(values[0])
+    if width < 20 or set(map(len, values)) != {width}:
+        return None
+    text = ''.join(values)
+    if not text.isascii():
+        return None
+    return np.frombuffer(text.encode('ascii'), dtype=np.uint8).reshape(len(values), width)
+
+def days_from_civil(year, month, day):
+    # Day numbers counted from 1970-01-01 for (year, month, day) arrays.
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+def civil_from_days(days):
+    # Inverse of days_from_civil.
+    days = np.asarray(days, dtype=np.int64) + 719468
+    era = days // 146097
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    month_index = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * month_index + 2) // 5 + 1
+    month = np.where(month_index < 10, month_index + 3, month_index - 9)
+    year = year_of_era + era * 400 + (month <= 2)
+    return year, month, day
+
+def local_days(times, offsets):
+    return (times + offsets.astype(np.int64) * 60000) // 86400000
+
+def days_of_week(times, offsets):
+    # 1970-01-01 was a Thursday, index 3 with Monday as 0
+    return np.where(times != MISSING_TIME, (local_days(times, offsets) + 3) % 7, -1).astype(np.int8)
+
+def durations(start_times, end_times):
+    seconds = np.trunc((end_times - start_times) / 1000).astype(np.int64)
+    return np.where((start_times != MISSING_TIME) & (end_times != MISSING_TIME), seconds, MISSING_TIME)
+
 def format_datetime_info(datetime_str):
     dt = datetime.fromisoformat(datetime_str)
     day_of_week = dt.strftime('%A')
@@ -30,11 +171,5 @@ def calculate_duration(start_time_str, end_time_str):
     return int(duration.total_seconds())
 
 def count_unique_drive_days(passenger_va):
-    unique_days = set()
-    for entry in passenger_va:
-        start_time_str = entry.get('startTime')
-        if start_time_str:
-            start_time = datetime.fromisoformat(start_time_str)
-            start_date = start_time.date()
-            unique_days.add(start_date)
-    return len(unique_days)
\ No newline at end of file
+    has_start = passenger_va.start_time != MISSING_TIME
+    return len(np.unique(local_days(passenger_va.start_time[has_start], passenger_va.start_offset[has_start])))
\ No newline at end of file
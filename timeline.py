@@ -0,0 +1,400 @@
+import warnings
+from array import array
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from time_utils import MISSING_TIME, DAY_NAMES, parse_timestamps
+
+VISIT, ACTIVITY = 0, 1
+# Rows converted to columns together in one bulk parse
+PARSE_BATCH = 1 << 16
+
+# Column name -> (array typecode used while building, final dtype)
+COLUMNS = {
+    'kind': ('b', np.int8),
+    'start_time': ('q', np.int64),  # epoch milliseconds, MISSING_TIME if absent
+    'end_time': ('q', np.int64),
+    'start_offset': ('h', np.int16),  # UTC offset in minutes
+    'end_offset': ('h', np.int16),
+    'distance': ('d', np.float64),  # meters
+    'probability': ('d', np.float32),  # activity or visit probability
+    'top_candidate_probability': ('d', np.float32),
+    'hierarchy_level': ('b', np.int8),
+    'top_candidate_type': ('h', np.int16),  # categorical codes, -1 if absent
+    'semantic_type': ('h', np.int16),
+    'place_id': ('i', np.int32),
+    'start_lat': ('d', np.float32),
+    'start_lng': ('d', np.float32),
+    'end_lat': ('d', np.float32),
+    'end_lng': ('d', np.float32),
+    'place_lat': ('d', np.float32),
+    'place_lng': ('d', np.float32),
+    'parking_lat': ('d', np.float32),
+    'parking_lng': ('d', np.float32),
+    'parking_time': ('q', np.int64),
+}
+CATEGORICAL = ('top_candidate_type', 'semantic_type', 'place_id')
+LAT_LNG = ('start', 'end', 'place', 'parking')
+
+PATH_COLUMNS = {
+    'start_time': ('q', np.int64),
+    'end_time': ('q', np.int64),
+    'start_offset': ('h', np.int16),
+    'point_count': ('i', np.int32),
+}
+POINT_COLUMNS = {
+    'lat': ('d', np.float32),
+    'lng': ('d', np.float32),
+    'time': ('q', np.int64),
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_EMPTY = {}
+
+class Timeline:
+    # Columnar store of flattened visits and activities, one row per entry.
+    def __init__(self, columns, categories):
+        self.columns = columns
+        self.categories = categories
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __len__(self):
+        return len(self.columns['kind'])
+
+    def code(self, column, value):
+        try:
+            return self.categories[column].index(value)
+        except ValueError:
+            return -1
+
+    def where(self, column, value):
+        code = self.code(column, value)
+        if code < 0:
+            return np.zeros(len(self), dtype=bool)
+        return self.columns[column] == code
+
+    def labels(self, column):
+        # Missing codes (-1) pick up the trailing np.nan, as the old dicts did.
+        lookup = np.array(self.categories[column] + [np.nan], dtype=object)
+        return lookup[self.columns[column]]
+
+    def take(self, index):
+        return Timeline({name: values[index] for name, values in self.columns.items()}, self.categories)
+
+    def concat(self, other):
+        # Appends `other`, remapping its category codes onto this store's.
+        categories = {name: list(labels) for name, labels in self.categories.items()}
+        columns = {}
+        for name, values in self.columns.items():
+            if name not in other.columns:
+                continue
+            other_values = other.columns[name]
+            if name in CATEGORICAL:
+                merged = categories[name]
+                index = {label: code for code, label in enumerate(merged)}
+                for label in other.categories[name]:
+                    if label not in index:
+                        index[label] = len(merged)
+                        merged.append(label)
+                mapping = np.array([index[label] for label in other.categories[name]] + [-1], dtype=values.dtype)
+                other_values = mapping[other_values]
+            columns[name] = np.concatenate([values, other_values])
+        return Timeline(columns, categories)
+
+    def row(self, i):
+        def label(column):
+            code = self.columns[column][i]
+            return self.categories[column][code] if code >= 0 else np.nan
+
+        def lat_lng(prefix):
+            lat, lng = self.columns[prefix + '_lat'][i], self.columns[prefix + '_lng'][i]
+            return np.nan if np.isnan(lat) else f"{lat:.7g}°, {lng:.7g}°"
+
+        entry = {
+            'semanticType': label('semantic_type'),
+            'startTime': format_time(self.start_time[i], self.start_offset[i]),
+            'endTime': format_time(self.end_time[i], self.end_offset[i]),
+            'startTimeTimezoneUtcOffsetMinutes': int(self.start_offset[i]),
+            'endTimeTimezoneUtcOffsetMinutes': int(self.end_offset[i]),
+            'topCandidateProbability': _float(self.top_candidate_probability[i]),
+        }
+        if self.kind[i] == ACTIVITY:
+            entry.update({
+                'startLatLng': lat_lng('start'),
+                'endLatLng': lat_lng('end'),
+                'distanceMeters': _float(self.distance[i]),
+                'activityProbability': _float(self.probability[i]),
+                'topCandidateType': label('top_candidate_type'),
+                'parkingLatLng': lat_lng('parking'),
+                'parkingStartTime': format_time(self.parking_time[i], self.end_offset[i]),
+            })
+        else:
+            entry.update({
+                'hierarchyLevel': int(self.hierarchy_level[i]) if self.hierarchy_level[i] >= 0 else np.nan,
+                'visitProbability': _float(self.probability[i]),
+                'placeId': label('place_id'),
+                'placeLatLng': lat_lng('place'),
+            })
+        if 'day_of_week' in self.columns and self.day_of_week[i] >= 0:
+            entry['day-of-week'] = DAY_NAMES[self.day_of_week[i]]
+        if 'duration' in self.columns and self.duration[i] != MISSING_TIME:
+            entry['duration'] = int(self.duration[i])
+        return entry
+
+class TimelineBuilder:
+    # Collects rows as tuples and converts them to columns PARSE_BATCH at a time.
+    FIELDS = ('kind', 'start_time', 'start_offset', 'end_time', 'distance', 'probability',
+              'top_candidate_probability', 'hierarchy_level', 'top_candidate_type', 'semantic_type',
+              'place_id', 'start', 'end', 'place', 'parking', 'parking_time')
+
+    def __init__(self):
+        self.values = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+        self.codes = {name: {} for name in CATEGORICAL}
+        self.rows = []
+
+    def __len__(self):
+        return len(self.values['kind']) + len(self.rows)
+
+    def append(self, entry, start_time=None, start_offset=None):
+        # `entry` is a dict produced by flatten_activity or flatten_visit. Callers
+        # that already parsed startTime (for the cutoff filter) pass it along.
+        get = entry.get
+        if start_time is None:
+            start_time = get('startTime')
+        if 'topCandidateType' in entry:
+            row = (ACTIVITY, start_time, start_offset, get('endTime'), get('distanceMeters'),
+                   get('activityProbability'), get('topCandidateProbability'), None, get('topCandidateType'),
+                   get('semanticType'), None, get('startLatLng'), get('endLatLng'), None, get('parkingLatLng'),
+                   get('parkingStartTime'))
+        else:
+            row = (VISIT, start_time, start_offset, get('endTime'), None, get('visitProbability'),
+                   get('topCandidateProbability'), get('hierarchyLevel'), None, get('semanticType'),
+                   get('placeId'), None, None, get('placeLatLng'), None, None)
+        self.rows.append(row)
+        if len(self.rows) >= PARSE_BATCH:
+            self._flush()
+
+    # The rows append() adds for flatten_activity and flatten_visit, read
+    # straight from the segment.
+    def append_activity(self, segment, start_time=None, start_offset=None):
+        activity = segment['activity']
+        top_candidate = activity.get('topCandidate', _EMPTY)
+        parking = activity.get('parking', _EMPTY)
+        if start_time is None:
+            start_time = segment.get('startTime')
+        self.rows.append((ACTIVITY, start_time, start_offset, segment.get('endTime'), activity.get('distanceMeters'),
+                          activity.get('probability'), top_candidate.get('probability'), None,
+                          top_candidate.get('type'), 'activity', None, activity.get('start', _EMPTY).get('latLng'),
+                          activity.get('end', _EMPTY).get('latLng'), None,
+                          parking.get('location', _EMPTY).get('latLng'), parking.get('startTime')))
+        if len(self.rows) >= PARSE_BATCH:
+            self._flush()
+
+    def append_visit(self, segment, start_time=None, start_offset=None):
+        visit = segment['visit']
+        top_candidate = visit.get('topCandidate', _EMPTY)
+        if start_time is None:
+            start_time = segment.get('startTime')
+        self.rows.append((VISIT, start_time, start_offset, segment.get('endTime'), None, visit.get('probability'),
+                          top_candidate.get('probability'), visit.get('hierarchyLevel'), None,
+                          top_candidate.get('semanticType'), top_candidate.get('placeId'), None, None,
+                          top_candidate.get('placeLocation', _EMPTY).get('latLng'), None, None))
+        if len(self.rows) >= PARSE_BATCH:
+            self._flush()
+
+    def _flush(self):
+        if not self.rows:
+            return
+        fields = dict(zip(self.FIELDS, zip(*self.rows)))
+        self.rows = []
+        values = self.values
+
+        values['kind'].extend(fields['kind'])
+        _extend_start_times(values, fields['start_time'], fields['start_offset'])
+        end_times, end_offsets = parse_timestamps(fields['end_time'])
+        values['end_time'].frombytes(end_times.tobytes())
+        values['end_offset'].frombytes(end_offsets.tobytes())
+        values['parking_time'].frombytes(parse_timestamps(fields['parking_time'])[0].tobytes())
+
+        for name in ('distance', 'probability', 'top_candidate_probability'):
+            values[name].frombytes(_numbers(fields[name]).tobytes())
+        levels = _numbers(fields['hierarchy_level'])
+        values['hierarchy_level'].extend(np.where(np.isnan(levels), -1, levels).astype(np.int8).tolist())
+        for name in CATEGORICAL:
+            values[name].extend(self._encode(name, fields[name]))
+        for prefix in LAT_LNG:
+            coordinates = parse_lat_lngs(fields[prefix])
+            values[prefix + '_lat'].frombytes(coordinates[:, 0].tobytes())
+            values[prefix + '_lng'].frombytes(coordinates[:, 1].tobytes())
+
+    def _encode(self, column, labels):
+        codes = self.codes[column]
+        lookup = {}
+        for label in dict.fromkeys(labels):
+            if label.__class__ is str:
+                code = codes.get(label)
+                if code is None:
+                    code = codes[label] = len(codes)
+                lookup[label] = code
+            else:
+                lookup[label] = -1
+        return list(map(lookup.__getitem__, labels))
+
+    def build(self):
+        self._flush()
+        categories = {name: list(self.codes[name]) for name in CATEGORICAL}
+        return Timeline(_to_columns(self.values, COLUMNS), categories)
+
+    def build_chunk(self):
+        # The rows so far as a chunk; category codes stay shared across chunks.
+        chunk = self.build()
+        self.values = {name: array(typecode) for name, (typecode, _) in COLUMNS.items()}
+        return chunk
+
+class TimelinePaths:
+    # timelinePath segments packed as flat point arrays. Path i owns the
+    # point_count[i] points that follow those of the paths before it.
+    def __init__(self, paths, points):
+        self.paths = paths
+        self.points = points
+
+    def __len__(self):
+        return len(self.paths['start_time'])
+
+    def point_starts(self):
+        counts = self.paths['point_count']
+        starts = np.zeros(len(counts), dtype=np.int64)
+        np.cumsum(counts[:-1], out=starts[1:])
+        return starts
+
+    def path_of_point(self):
+        return np.repeat(np.arange(len(self)), self.paths['point_count'])
+
+    def take(self, index):
+        index = np.arange(len(self))[index]
+        starts = self.point_starts()
+        counts = self.paths['point_count'][index]
+        point_index = np.repeat(starts[index] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return TimelinePaths({name: values[index] for name, values in self.paths.items()},
+                             {name: values[point_index] for name, values in self.points.items()})
+
+    def concat(self, other):
+        return TimelinePaths({name: np.concatenate([values, other.paths[name]]) for name, values in self.paths.items()},
+                             {name: np.concatenate([values, other.points[name]]) for name, values in self.points.items()})
+
+class TimelinePathsBuilder:
+    def __init__(self):
+        self.paths = {name: array(typecode) for name, (typecode, _) in PATH_COLUMNS.items()}
+        self.points = {name: array(typecode) for name, (typecode, _) in POINT_COLUMNS.items()}
+        self.rows = []
+        self.pending_points = []
+        self.pending_times = []
+
+    def __len__(self):
+        return len(self.paths['start_time']) + len(self.rows)
+
+    def append(self, segment, start_time=None, start_offset=None):
+        if start_time is None:
+            start_time = segment.get('startTime')
+        path = segment.get('timelinePath') or ()
+        self.rows.append((start_time, start_offset, segment.get('endTime'), len(path)))
+        try:
+            points = [point['point'] for point in path]
+            times = [point['time'] for point in path]
+        except KeyError:
+            points = [point.get('point') for point in path]
+            times = [point.get('time') for point in path]
+        self.pending_points += points
+        self.pending_times += times
+        if len(self.pending_points) >= PARSE_BATCH:
+            self._flush()
+
+    def _flush(self):
+        if not self.rows:
+            return
+        start_times, start_offsets, end_times, counts = zip(*self.rows)
+        paths, points = self.paths, self.points
+        _extend_start_times(paths, start_times, start_offsets)
+        paths['end_time'].frombytes(parse_timestamps(end_times)[0].tobytes())
+        paths['point_count'].extend(counts)
+        coordinates = parse_lat_lngs(self.pending_points)
+        points['lat'].frombytes(coordinates[:, 0].tobytes())
+        points['lng'].frombytes(coordinates[:, 1].tobytes())
+        points['time'].frombytes(parse_timestamps(self.pending_times)[0].tobytes())
+        self.rows, self.pending_points, self.pending_times = [], [], []
+
+    def build(self):
+        self._flush()
+        return TimelinePaths(_to_columns(self.paths, PATH_COLUMNS), _to_columns(self.points, POINT_COLUMNS))
+
+def _extend_start_times(values, start_times, start_offsets):
+    # Start times already parsed by the cutoff filter arrive as ints.
+    if set(map(type, start_times)) <= {int}:
+        values['start_time'].extend(start_times)
+        values['start_offset'].extend(start_offsets)
+        return
+    parsed_times, parsed_offsets = parse_timestamps(start_times)
+    for i, (value, offset) in enumerate(zip(start_times, start_offsets)):
+        if isinstance(value, int):
+            parsed_times[i], parsed_offsets[i] = value, offset
+    values['start_time'].frombytes(parsed_times.tobytes())
+    values['start_offset'].frombytes(parsed_offsets.tobytes())
+
+def _to_columns(values, spec):
+    return {
+        name: np.array(values[name], dtype=dtype) if len(values[name]) else np.zeros(0, dtype=dtype)
+        for name, (_, dtype) in spec.items()
+    }
+
+def format_time(ms, offset):
+    if ms == MISSING_TIME:
+        return np.nan
+    tz = timezone(timedelta(minutes=int(offset)))
+    return (_EPOCH + timedelta(milliseconds=int(ms))).astimezone(tz).isoformat(timespec='milliseconds')
+
+def parse_lat_lng(value):
+    # Google exports store coordinates as "37.7749°, -122.4194°".
+    if not isinstance(value, str):
+        return np.nan, np.nan
+    lat, _, lng = value.replace('°', '').partition(',')
+    return float(lat), float(lng)
+
+def parse_lat_lngs(values):
+    # parse_lat_lng over a list, as an (n, 2) array; non-strings are NaN.
+    present = None
+    strings = values
+    if set(map(type, values)) != {str}:
+        present = [value.__class__ is str for value in values]
+        strings = [value for value, is_str in zip(values, present) if is_str]
+    with warnings.catch_warnings():
+        # Text it cannot read gives a short array (and, for now, a DeprecationWarning).
+        warnings.simplefilter('ignore', DeprecationWarning)
+        try:
+            parsed = np.fromstring(', '.join(strings), sep='°,')
+        except ValueError:
+            parsed = None
+    if parsed is None or parsed.size != 2 * len(strings):
+        parsed = np.array([parse_lat_lng(value) for value in strings], dtype=np.float64)
+    parsed = parsed.reshape(len(strings), 2)
+    if present is None:
+        return parsed
+    coordinates = np.full((len(values), 2), np.nan)
+    coordinates[np.array(present, dtype=bool)] = parsed
+    return coordinates
+
+def _float(value):
+    # str() gives the shortest repr, so float32 0.7 comes back as 0.7
+    return float(str(value))
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) else np.nan
+
+def _numbers(values):
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([_number(value) for value in values], dtype=np.float64)
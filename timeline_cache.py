@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from data_processing import DEFAULT_CUTOFF, SegmentReader, process_data, stream_segments
+from instrumentation import instrumented
+from timeline import Timeline, TimelinePaths, COLUMNS, PATH_COLUMNS, POINT_COLUMNS
+from time_utils import parse_cutoff
+
+CACHE_DIR = '.smolways_cache'
+CACHE_VERSION = 2
+HEAD_BYTES = 1 << 16  # bytes that must match, at the start and before the resume point, for the same history
+
+@instrumented('load_timeline')
+def load_timeline(filename, cutoff=DEFAULT_CUTOFF, cache_dir=CACHE_DIR):
+    # (va, timelinePaths) for an export, from the cache when unchanged; a grown
+    # export is read again from its last cached segment on.
+    source = os.path.abspath(filename)
+    try:
+        stat = os.stat(source)
+    except OSError:
+        return process_data(stream_segments(filename), cutoff)
+
+    directory = os.path.join(cache_dir, hashlib.sha1(source.encode('utf-8')).hexdigest()[:16])
+    cutoff_time = parse_cutoff(cutoff)
+    cached = read_cache(directory)
+    if cached is not None:
+        meta, va, timelinePaths = cached
+        same_history = (meta['cutoff'] == cutoff_time and stat.st_size >= meta['size'] and
+                        meta['head'] == _digest(source, 0, meta['head_length']))
+        if same_history and stat.st_size == meta['size'] and stat.st_mtime_ns == meta['mtime_ns']:
+            return va, timelinePaths
+        resume = meta['resume']
+        if same_history and resume is not None and \
+                resume['digest'] == _digest(source, resume['offset'] - resume['length'], resume['length']):
+            reader = SegmentReader(source, resume['offset'])
+            new_va, new_paths = process_data(reader, cutoff)
+            va = va.take(slice(0, resume['events'])).concat(new_va)
+            timelinePaths = timelinePaths.take(slice(0, resume['paths'])).concat(new_paths)
+            write_cache(directory, source, stat, cutoff_time, va, timelinePaths, reader)
+            return va, timelinePaths
+
+    reader = SegmentReader(source)
+    va, timelinePaths = process_data(reader, cutoff)
+    write_cache(directory, source, stat, cutoff_time, va, timelinePaths, reader)
+    return va, timelinePaths
+
+def read_cache(directory):
+    try:
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        # Only a parse that read the whole export is written as complete.
+        if meta.get('version') != CACHE_VERSION or meta.get('complete') is not True:
+            return None
+        columns = {name: _load_array(directory, 'timeline', name) for name in COLUMNS}
+        paths = {name: _load_array(directory, 'paths', name) for name in PATH_COLUMNS}
+        points = {name: _load_array(directory, 'points', name) for name in POINT_COLUMNS}
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError):
+        print(f"Warning: ignoring unreadable timeline cache in '{directory}'.")
+        return None
+    return meta, Timeline(columns, meta['categories']), TimelinePaths(paths, points)
+
+def write_cache(directory, source, stat, cutoff_time, va, timelinePaths, reader):
+    # `reader` is the SegmentReader va and timelinePaths were parsed from.
+    head_length = min(HEAD_BYTES, stat.st_size)
+    resume = None
+    if reader.last is not None:
+        last_va, last_paths = process_data([reader.last], cutoff_time)
+        resume_length = min(HEAD_BYTES, reader.last_offset)
+        resume = {
+            'offset': reader.last_offset,
+            'length': resume_length,
+            'digest': _digest(source, reader.last_offset - resume_length, resume_length),
+            'events': len(va) - len(last_va),
+            'paths': len(timelinePaths) - len(last_paths),
+        }
+    meta = {
+        'version': CACHE_VERSION,
+        'source': source,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'head_length': head_length,
+        'head': _digest(source, 0, head_length),
+        'cutoff': cutoff_time,
+        'resume': resume,
+        'categories': va.categories,
+        'complete': True,
+    }
+
+    # Written beside the old cache and swapped in, never left half-written.
+    staging = f"{directory}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(staging, exist_ok=True)
+        for name in COLUMNS:
+            np.save(os.path.join(staging, f"timeline_{name}.npy"), va.columns[name])
+        for name in PATH_COLUMNS:
+            np.save(os.path.join(staging, f"paths_{name}.npy"), timelinePaths.paths[name])
+        for name in POINT_COLUMNS:
+            np.save(os.path.join(staging, f"points_{name}.npy"), timelinePaths.points[name])
+        with open(os.path.join(staging, 'meta.json'), 'w') as file:
+            json.dump(meta, file)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(staging, directory)
+    except OSError as error:
+        print(f"Warning: could not write timeline cache to '{directory}': {error}")
+        shutil.rmtree(staging, ignore_errors=True)
+
+def _load_array(directory, prefix, name):
+    return np.load(os.path.join(directory, f"{prefix}_{name}.npy"), mmap_mode='r')
+
+def _digest(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        return hashlib.sha1(file.read(length)).hexdigest()
@@ -0,0 +1,94 @@
+import numpy as np
+from analysis import run_lengths
+from time_utils import MISSING_TIME
+
+EARTH_RADIUS_METERS = 6371008.8
+STOP_SPEED = 0.5  # meters per second; slower than this counts as standing still
+STOP_MIN_SECONDS = 120
+
+# Distances, speeds and stops from consecutive points within each timelinePath.
+
+def haversine(lat1, lng1, lat2, lng2):
+    # Great-circle distance in meters; accepts scalars or arrays in degrees.
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def track_steps(timelinePaths):
+    # One row per pair of consecutive points in a path; speed is NaN without elapsed time.
+    points = timelinePaths.points
+    path = timelinePaths.path_of_point()
+    first = np.flatnonzero(path[1:] == path[:-1]) if len(path) else np.zeros(0, dtype=np.int64)
+    second = first + 1
+    lat, lng, time = points['lat'], points['lng'], points['time']
+    first = first[~(np.isnan(lat[first]) | np.isnan(lat[second]))]
+    second = first + 1
+
+    meters = haversine(lat[first], lng[first], lat[second], lng[second])
+    timed = (time[first] != MISSING_TIME) & (time[second] != MISSING_TIME)
+    seconds = np.where(timed, (time[second] - time[first]) / 1000, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(seconds > 0, meters / seconds, np.nan)
+    return {
+        'point': first,
+        'path': path[first],
+        'start_time': np.where(timed, time[first], MISSING_TIME),
+        'end_time': np.where(timed, time[second], MISSING_TIME),
+        'meters': meters,
+        'seconds': seconds,
+        'speed': speed,
+    }
+
+def path_distances(timelinePaths, steps=None):
+    # Track length of every path in meters.
+    steps = steps or track_steps(timelinePaths)
+    return np.bincount(steps['path'], weights=steps['meters'], minlength=len(timelinePaths))
+
+def detect_stops(timelinePaths, max_speed=STOP_SPEED, min_seconds=STOP_MIN_SECONDS, steps=None):
+    # Runs of steps slower than `max_speed` lasting at least `min_seconds`.
+    steps = steps or track_steps(timelinePaths)
+    slow = steps['speed'] < max_speed
+    # A run may not continue into another path or across a dropped pair.
+    breaks = np.ones(len(slow), dtype=bool)
+    breaks[1:] = (steps['path'][1:] != steps['path'][:-1]) | (steps['point'][1:] != steps['point'][:-1] + 1)
+    starts, lengths, values = run_lengths(slow, breaks)
+    starts, lengths = starts[values], lengths[values]
+    last = starts + lengths - 1
+    # Slow steps always have a time, so the NaNs zeroed here lie outside every run.
+    cumulative = np.concatenate([[0.0], np.cumsum(np.nan_to_num(steps['seconds']))])
+    seconds = cumulative[last + 1] - cumulative[starts]
+    stops = seconds >= min_seconds
+    starts, last, seconds = starts[stops], last[stops], seconds[stops]
+    first_point = steps['point'][starts]
+    return {
+        'path': steps['path'][starts],
+        'start_time': steps['start_time'][starts],
+        'end_time': steps['end_time'][last],
+        'seconds': seconds,
+        'lat': timelinePaths.points['lat'][first_point],
+        'lng': timelinePaths.points['lng'][first_point],
+    }
+
+def activity_track_meters(va, timelinePaths, steps=None):
+    # Track meters of the steps within each entry's time span, or NaN.
+    steps = steps or track_steps(timelinePaths)
+    timed = steps['start_time'] != MISSING_TIME
+    order = np.flatnonzero(timed)[np.argsort(steps['start_time'][timed], kind='stable')]
+    step_starts = steps['start_time'][order]
+    # The running maximum keeps the search valid if a sample is out of order.
+    step_ends = np.maximum.accumulate(steps['end_time'][order]) if len(order) else step_starts
+    cumulative = np.concatenate([[0.0], np.cumsum(steps['meters'][order])])
+
+    first = np.searchsorted(step_starts, va.start_time, 'left')
+    stop = np.searchsorted(step_ends, va.end_time, 'right')
+    has_steps = (stop > first) & (va.start_time != MISSING_TIME) & (va.end_time != MISSING_TIME)
+    return np.where(has_steps, cumulative[np.maximum(stop, first)] - cumulative[first], np.nan)
+
+def derive_miles_correction(va, timelinePaths, activity_type='IN_PASSENGER_VEHICLE', steps=None):
+    # Track distance over reported distanceMeters of the covered drives, or None.
+    track_meters = activity_track_meters(va, timelinePaths, steps)
+    covered = va.where('top_candidate_type', activity_type) & ~np.isnan(track_meters) & (va.distance > 0)
+    reported = float(va.distance[covered].sum())
+    if not reported:
+        return None
+    return float(track_meters[covered].sum()) / reported
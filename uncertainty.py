@@ -0,0 +1,87 @@
+import numpy as np
+from car_cost_calculator import determine_car_payment, determine_fees_insurance
+from emissions_calculator import (WEAR_COST_CONSTANTS, average_fuel_price, calculate_emissions, determine_wear_costs,
+                                  trip_fuel_prices)
+from report import split_params
+from time_utils import find_min_max_dates
+
+DRAW_BATCH = 1024
+
+# Each entry is the distribution of a multiplier on the base value, given as
+# a numpy.random.Generator method name and its arguments.
+DEFAULT_DISTRIBUTIONS = {
+    'vehicle_mpg': ('normal', 1.0, 0.1),
+    'fuel_price': ('normal', 1.0, 0.08),
+    'miles_driven_correction': ('normal', 1.0, 0.03),
+    'cost_of_maint_year': ('triangular', 0.75, 1.0, 1.5),
+    'cost_of_tire': ('triangular', 0.75, 1.0, 1.5),
+    'cost_of_brake_change': ('triangular', 0.75, 1.0, 1.5),
+    'brake_rate': ('uniform', 0.7, 1.3),
+    'tire_rate': ('uniform', 0.7, 1.3),
+    'cost_to_park': ('uniform', 0.5, 1.5),
+}
+
+def trip_probabilities(va, rows):
+    # Activity probability times top candidate probability, missing taken as 1.
+    probability = np.nan_to_num(va.probability[rows].astype(np.float64), nan=1.0)
+    candidate = np.nan_to_num(va.top_candidate_probability[rows].astype(np.float64), nan=1.0)
+    return np.clip(probability * candidate, 0.0, 1.0)
+
+def sample_miles(meters, probabilities, draws, rng, miles_driven_correction=1.0):
+    # Total miles per draw, keeping each trip with its probability.
+    meters = np.asarray(meters, dtype=np.float64)
+    totals = np.empty(draws)
+    for start in range(0, draws, DRAW_BATCH):
+        batch = min(DRAW_BATCH, draws - start)
+        kept = rng.random((len(meters), batch)) < probabilities[:, None]
+        totals[start:start + batch] = meters @ kept
+    return totals / 1000 / 1.6 * miles_driven_correction
+
+def sample_multipliers(distributions, draws, rng):
+    return {name: getattr(rng, method)(*arguments, size=draws)
+            for name, (method, *arguments) in distributions.items()}
+
+def uncertainty_report(va, params=None, draws=10000, confidence=0.9, distributions=DEFAULT_DISTRIBUTIONS, seed=None,
+                       activity_type='IN_PASSENGER_VEHICLE'):
+    # Monte Carlo mean, median and `confidence` interval of miles, CO2 and
+    # per-mile cost, redrawing each trip and each constant per draw.
+    params = params or {}
+    rng = np.random.default_rng(seed)
+    vehicle_params, car_params, insurance_params = split_params(params)
+    vehicle_mpg = vehicle_params.get('vehicle_mpg', 24.4)
+    miles_driven_correction = vehicle_params.get('miles_driven_correction', 1.0)
+
+    rows = va.where('top_candidate_type', activity_type)
+    meters = va.distance[rows]
+    prices = trip_fuel_prices(va.start_lat[rows], va.start_lng[rows])
+    fuel_price = average_fuel_price(float((meters * prices).sum()), float(meters.sum()))
+    min_date, max_date = find_min_max_dates(va)
+    years = (max_date - min_date).days / 365.0
+    _, _, monthly_amortized_cost = determine_car_payment(**car_params)
+    insurance_cost = determine_fees_insurance(**insurance_params)
+    annual_fixed_cost = (monthly_amortized_cost * 12 + insurance_cost['annual_insurance_cost'] +
+                         insurance_cost['registration_fee'])
+
+    multipliers = sample_multipliers(distributions, draws, rng)
+    ones = np.ones(draws)
+    correction = miles_driven_correction * multipliers.get('miles_driven_correction', ones)
+    miles = sample_miles(meters, trip_probabilities(va, rows), draws, rng) * correction
+    mpg = vehicle_mpg * multipliers.get('vehicle_mpg', ones)
+    constants = {name: base * multipliers[name] for name, base in WEAR_COST_CONSTANTS.items() if name in multipliers}
+
+    _, CO2kgs, _ = calculate_emissions(miles, mpg)
+    wear_cost = determine_wear_costs(miles, mpg, None, fuel_price * multipliers.get('fuel_price', ones), constants)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_mile_cost = (wear_cost / years + annual_fixed_cost) / (miles / years)
+
+    samples = {'miles_driven': miles, 'CO2_tons_released': CO2kgs * 0.001, 'wear_cost': wear_cost,
+               'per_mile_cost': per_mile_cost}
+    tail = (1 - confidence) / 2 * 100
+    return {name: summarize_samples(values, tail) for name, values in samples.items()}
+
+def summarize_samples(values, tail):
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return {'mean': None, 'median': None, 'low': None, 'high': None}
+    low, median, high = np.percentile(values, [tail, 50, 100 - tail])
+    return {'mean': float(values.mean()), 'median': float(median), 'low': float(low), 'high': float(high)}
@@ -0,0 +1,92 @@
+import csv
+import json
+import numpy as np
+from aggregation import aggregate, PassengerDistance, FuelPrice
+from emissions_calculator import DEFAULT_STATE, FUEL_GRADES, calculate_emissions, determine_wear_costs
+
+ELECTRIC = 'Electric'
+ELECTRICITY_PRICE = 0.30  # dollars per kWh; assumed, there is no per-state electricity table yet
+GRID_CO2_KG_PER_KWH = 0.39  # assumed US grid average
+
+# A catalog holds 'name' and 'fuel' lists and 'mpg', 'kerb_weight' and
+# 'kwh_per_mile' arrays; fuel is one of FUEL_GRADES or ELECTRIC.
+
+def vehicle_catalog(profiles):
+    # Builds a catalog from a list of dicts with the keys above.
+    def column(key):
+        return np.array([_float(profile.get(key)) for profile in profiles], dtype=np.float64)
+
+    fuels = [profile.get('fuel') or 'Regular' for profile in profiles]
+    for fuel in set(fuels) - set(FUEL_GRADES) - {ELECTRIC}:
+        raise ValueError(f"unknown fuel type '{fuel}', expected one of {', '.join(FUEL_GRADES + (ELECTRIC,))}")
+    return {
+        'name': [profile.get('name') for profile in profiles],
+        'fuel': fuels,
+        'mpg': column('mpg'),
+        'kerb_weight': column('kerb_weight'),
+        'kwh_per_mile': column('kwh_per_mile'),
+    }
+
+def load_vehicle_catalog(filename):
+    # JSON list of profiles, or a CSV with one column per profile key.
+    with open(filename, 'r', newline='') as file:
+        profiles = json.load(file) if filename.endswith('.json') else list(csv.DictReader(file))
+    return vehicle_catalog(profiles)
+
+def vehicle_matrix(miles, fuel_prices, catalog, electricity_price=ELECTRICITY_PRICE):
+    # Trips x vehicles matrices; `fuel_prices` maps each grade to per-trip prices.
+    miles = np.asarray(miles, dtype=np.float64)[:, None]
+    electric = np.array([fuel == ELECTRIC for fuel in catalog['fuel']])
+    grades = [grade for grade in FUEL_GRADES if grade in fuel_prices]
+    grade_of_vehicle = np.array([grades.index(fuel) if fuel in grades else 0 for fuel in catalog['fuel']])
+    prices = np.stack([np.asarray(fuel_prices[grade], dtype=np.float64) for grade in grades], axis=1)
+
+    # Electric vehicles go through the same formulas in miles per kWh and
+    # dollars per kWh; they burn no gallons.
+    mpg = np.where(electric, np.inf, catalog['mpg'])
+    per_energy_unit = np.where(electric, 1 / catalog['kwh_per_mile'], catalog['mpg'])
+    energy_price = np.where(electric, electricity_price, prices[:, grade_of_vehicle])
+    kerb_weight = np.where(np.isnan(catalog['kerb_weight']), 3500, catalog['kerb_weight'])
+
+    gallons, CO2kgs, mgs = calculate_emissions(miles, mpg, kerb_weight)
+    kwh = np.where(electric, miles * catalog['kwh_per_mile'], 0.0)
+    return {
+        'gallons_burned': gallons,
+        'kwh_used': kwh,
+        'CO2_kgs_released': CO2kgs + kwh * GRID_CO2_KG_PER_KWH,
+        'particulate_mgs_released': mgs,
+        'wear_cost': determine_wear_costs(miles, per_energy_unit, DEFAULT_STATE, energy_price),
+    }
+
+def compare_vehicles(miles_driven, fuel_prices, catalog, electricity_price=ELECTRICITY_PRICE):
+    # Totals per vehicle at each grade's distance-weighted price.
+    matrix = vehicle_matrix([miles_driven], {grade: [price] for grade, price in fuel_prices.items()}, catalog,
+                            electricity_price)
+    return {key: values[0] for key, values in matrix.items()}
+
+def rank_vehicles(comparison, catalog, top=5):
+    # Names of the `top` cheapest and lowest-CO2 vehicles, best first.
+    cheapest = np.argsort(comparison['wear_cost'], kind='stable')[:top]
+    cleanest = np.argsort(comparison['CO2_kgs_released'], kind='stable')[:top]
+    return {
+        'cheapest': [catalog['name'][i] for i in cheapest.tolist()],
+        'lowest_CO2': [catalog['name'][i] for i in cleanest.tolist()],
+    }
+
+def vehicle_reducers():
+    reducers = {'passenger_meters': PassengerDistance()}
+    reducers.update({grade: FuelPrice(grade=grade) for grade in FUEL_GRADES})
+    return reducers
+
+def compare_timeline(chunks, catalog, miles_driven_correction=1.0, top=5):
+    # One pass over a timeline (or its chunks) to compare and rank the catalog.
+    aggregates = aggregate(chunks, vehicle_reducers())
+    miles_driven = aggregates.pop('passenger_meters') / 1000 / 1.6 * miles_driven_correction
+    comparison = compare_vehicles(miles_driven, aggregates, catalog)
+    return comparison, rank_vehicles(comparison, catalog, top)
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan